@@ -0,0 +1,119 @@
+"""
+Benchmark of the time to first token with and without the client pool, against a local mock OpenAI compatible server.
+
+fresh:  a new OpenAI client (and a new connection) per request, the way llm_ask worked before the pool.
+pooled: the client borrowed from the client pool, the connection is kept alive between the requests.
+
+The mock server can add a delay to accept the connection (--connect-delay, in ms) to simulate the TCP/TLS handshake
+to a remote API.
+
+Usage: python example/benchmark_llm_client.py [--number 200] [--connect-delay 0]
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from openai import OpenAI
+
+from wiseagent.core.llm.client_pool import get_client_pool
+
+CHUNK_LIST = ["Hello", ", ", "I am ", "the mock ", "server."]
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for content in CHUNK_LIST:
+            chunk = {
+                "id": "mock",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+            }
+            self.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        # The end of the stream and the last chunk of the chunked encoding are sent together, as the real API does, so
+        # the client sees the end of the response and keeps the connection.
+        data = b"data: [DONE]\n\n"
+        self.wfile.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    connect_delay: float = 0
+
+    def get_request(self):
+        request = super().get_request()
+        if self.connect_delay:
+            # Simulate the handshake of a new connection, the kept alive connection does not pay it again.
+            time.sleep(self.connect_delay)
+        return request
+
+
+def time_to_first_token(client: OpenAI) -> float:
+    start = time.perf_counter()
+    response = client.chat.completions.create(
+        model="mock", messages=[{"role": "user", "content": "hello"}], stream=True
+    )
+    ttft = None
+    for chunk in response:
+        if ttft is None and chunk.choices and chunk.choices[0].delta.content:
+            ttft = time.perf_counter() - start
+    return ttft
+
+
+def main(number: int, connect_delay: float):
+    server = MockOpenAIServer(("127.0.0.1", 0), MockOpenAIHandler)
+    server.connect_delay = connect_delay / 1000
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    def fresh():
+        client = OpenAI(api_key="mock", base_url=base_url)
+        try:
+            return time_to_first_token(client)
+        finally:
+            client.close()
+
+    def pooled():
+        with get_client_pool().use_client("mock", base_url) as client:
+            return time_to_first_token(client)
+
+    # Warm up
+    fresh()
+    pooled()
+    print(f"{'case':<8}{'p50(ms)':>10}{'p95(ms)':>10}{'mean(ms)':>10}")
+    result_map = {}
+    for case, function in (("fresh", fresh), ("pooled", pooled)):
+        ttft_list = sorted(function() * 1000 for _ in range(number))
+        result_map[case] = statistics.median(ttft_list)
+        p95 = ttft_list[int(len(ttft_list) * 0.95) - 1]
+        print(f"{case:<8}{result_map[case]:>10.2f}{p95:>10.2f}{statistics.mean(ttft_list):>10.2f}")
+    print(f"p50 speedup: {result_map['fresh'] / result_map['pooled']:.1f}x")
+    get_client_pool().close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=200)
+    parser.add_argument("--connect-delay", type=float, default=0, help="The delay of a new connection in ms.")
+    args = parser.parse_args()
+    main(args.number, args.connect_delay)
@@ -0,0 +1,81 @@
+"""
+Microbenchmark of the message construction.
+
+legacy: the construction before the fast path (pydantic validation, uuid4, strftime, ContextVar lookup and the
+        isupper scan of the names on every message).
+init:   Message(...), the validated construction.
+fast:   Message.fast(...), the construction used in the hot path (sleep, wakeup and the memory of the life loop).
+
+Usage: python example/benchmark_message.py [number]
+"""
+import sys
+import time
+import uuid
+from datetime import datetime
+
+from pydantic import BaseModel
+
+from wiseagent.common.protocol_message import AIMessage, WakeupMessage
+from wiseagent.core.agent import CURRENT_AGENT_DATA, Agent, get_current_agent_data
+
+
+def make_legacy_message_class(message_class):
+    """Return the subclass of the message class with the construction before the fast path."""
+
+    class LegacyMessage(message_class):
+        def __init__(self, **kwargs):
+            BaseModel.__init__(self, message_id=uuid.uuid4().hex, **kwargs)
+            if not self.send_from or not self.send_to:
+                agent_data = get_current_agent_data()
+                if agent_data and not self.send_from:
+                    self.send_from = agent_data.name
+                if agent_data and not self.send_to:
+                    self.send_to = agent_data.name
+            if self.time_stamp == "":
+                self.time_stamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            if self.send_to and any(char.isupper() for char in self.send_to):
+                self.send_to = self.send_to.lower()
+            if self.send_from and any(char.isupper() for char in self.send_from):
+                self.send_from = self.send_from.lower()
+
+    return LegacyMessage
+
+
+LegacyWakeupMessage = make_legacy_message_class(WakeupMessage)
+LegacyAIMessage = make_legacy_message_class(AIMessage)
+
+
+def benchmark(function, number: int) -> float:
+    """Return the best time of 5 runs in microseconds per message."""
+    best = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        best = min(best, time.perf_counter() - start)
+    return best / number * 1e6
+
+
+def main(number: int = 20000):
+    # The messages in the life loop are created with the current agent data in the context.
+    CURRENT_AGENT_DATA.set(Agent(name="Bob"))
+    case_map = {
+        "wakeup": (
+            lambda: LegacyWakeupMessage(send_from="Bob"),
+            lambda: WakeupMessage(send_from="Bob"),
+            lambda: WakeupMessage.fast(send_from="Bob"),
+        ),
+        "memory": (
+            lambda: LegacyAIMessage(content="I will write the code."),
+            lambda: AIMessage(content="I will write the code."),
+            lambda: AIMessage.fast(content="I will write the code."),
+        ),
+    }
+    print(f"{'case':<8}{'legacy(us)':>12}{'init(us)':>12}{'fast(us)':>12}{'speedup':>10}")
+    for case, (legacy, init, fast) in case_map.items():
+        legacy_time, init_time, fast_time = (benchmark(function, number) for function in (legacy, init, fast))
+        print(f"{case:<8}{legacy_time:>12.2f}{init_time:>12.2f}{fast_time:>12.2f}{legacy_time / fast_time:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -20,12 +20,15 @@ from wiseagent.common.protocol_command import ActionCommand
 from wiseagent.common.protocol_message import Message, UserMessage
 from wiseagent.core.agent import Agent, get_current_agent_data
 from wiseagent.core.agent_core import get_agent_core
+from wiseagent.core.llm.llm_cache import CURRENT_LLM_CALLER
 
 
 class BaseAction(BaseModel):
     action_name: str = ""  # the action name is the same with the action class
     action_type: str = ""
     action_description: str = None
+    # Whether the LLM response of the action can be served by the semantic cache (if the action is in the allowlist).
+    allow_semantic_cache: bool = True
 
     def __init__(self):
         super().__init__()
@@ -91,30 +94,81 @@ class BaseAction(BaseModel):
         self, prompt=None, memory: List[Message] = None, system_prompt: str = None, handle_stream_function=None
     ):
         """Ask the LLM to generate a response to the given prompt."""
+        llm, llm_kwargs = self._prepare_llm_ask(prompt, memory, system_prompt)
+        token = CURRENT_LLM_CALLER.set(self.action_name if self.allow_semantic_cache else None)
+        try:
+            return llm.llm_ask(handle_stream_function=handle_stream_function, **llm_kwargs)
+        finally:
+            CURRENT_LLM_CALLER.reset(token)
+
+    async def allm_ask(
+        self, prompt=None, memory: List[Message] = None, system_prompt: str = None, handle_stream_function=None
+    ):
+        """The coroutine version of llm_ask. The handle_stream_function can be a function or a coroutine function."""
+        llm, llm_kwargs = self._prepare_llm_ask(prompt, memory, system_prompt)
+        token = CURRENT_LLM_CALLER.set(self.action_name if self.allow_semantic_cache else None)
+        try:
+            return await llm.allm_ask(handle_stream_function=handle_stream_function, **llm_kwargs)
+        finally:
+            CURRENT_LLM_CALLER.reset(token)
+
+    def llm_batch_ask(
+        self,
+        prompt_list: List[str],
+        memory: List[Message] = None,
+        system_prompt: str = None,
+        handle_stream_function_list: List = None,
+        max_concurrency: int = 8,
+        return_exceptions: bool = False,
+    ) -> list:
+        """Ask the LLM the prompts concurrently with the same memory and system prompt.
+        Returns:
+            list: The responses in the order of the prompt_list, None (or the exception if return_exceptions is True)
+                if the request failed.
+        """
+        if not prompt_list:
+            return []
+        memory_list = []
+        for prompt in prompt_list:
+            llm, llm_kwargs = self._prepare_llm_ask(prompt, memory, system_prompt)
+            memory_list.append(llm_kwargs.pop("memory"))
+        token = CURRENT_LLM_CALLER.set(self.action_name if self.allow_semantic_cache else None)
+        try:
+            return llm.llm_batch_ask(
+                memory_list,
+                handle_stream_function_list=handle_stream_function_list,
+                max_concurrency=max_concurrency,
+                return_exceptions=return_exceptions,
+                **llm_kwargs,
+            )
+        finally:
+            CURRENT_LLM_CALLER.reset(token)
+
+    def _prepare_llm_ask(self, prompt=None, memory: List[Message] = None, system_prompt: str = None):
+        """Return the LLM of the current agent and the arguments of llm_ask."""
         agent_data: Agent = get_current_agent_data()
         agent_core = get_agent_core()
-        if memory is None:
-            # Get the lastest memory from the agent autumaticly
-            memory = agent_data.get_latest_memory()
-        if prompt is not None:
-            memory = memory + [UserMessage(content=prompt)]
         if system_prompt is None:
             system_prompt = agent_data.get_agent_system_prompt(
                 tools_description="", agent_instructions="", agent_example=""
             )
+        if memory is None:
+            # Get the lastest memory which fits in the context window from the agent autumaticly
+            memory = agent_data.get_context_messages(system_prompt, prompt)
+        if prompt is not None:
+            memory = memory + [UserMessage(content=prompt)]
         memory = memory + [UserMessage(content=prompt)]
         llm = agent_core.get_llm(agent_data.llm_config["llm_type"])
         if not llm:
             raise Exception("LLM not found")
-        rsp = llm.llm_ask(
+        llm_kwargs = dict(
             memory=memory,
             system_prompt=system_prompt,
-            handle_stream_function=handle_stream_function,
             base_url=agent_data.llm_config.get("base_url", None),
             api_key=agent_data.llm_config.get("api_key", None),
             model_name=agent_data.llm_config.get("model_name", None),
         )
-        return rsp
+        return llm, llm_kwargs
 
 
 class BasePlanAction(BaseAction):
@@ -128,6 +182,15 @@ class BasePlanAction(BaseAction):
             Tuple: thoughts, command_list"""
         raise NotImplementedError("BaseActionData can not be plan")
 
+    async def aplan(self, command_list: List[ActionCommand]):
+        """The coroutine version of plan, used by the async life runtime.
+        By default, the blocking plan is run in the executor of the runtime, override it to await the LLM.
+        Returns:
+            Tuple: thoughts, command_list"""
+        from wiseagent.core.async_life_runtime import get_async_life_runtime
+
+        return await get_async_life_runtime().run_blocking(self.plan, command_list)
+
     @action()
     def end(self):
         """Use this action to stop. It is command when you do not recieve any useful command or do the final response.
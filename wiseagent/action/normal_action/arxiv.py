@@ -15,7 +15,6 @@ from urllib.parse import urlencode
 from bs4 import BeautifulSoup
 from matplotlib import pyplot as plt
 from playwright.sync_api import sync_playwright
-from tqdm import tqdm
 
 from wiseagent.action.action_decorator import action
 from wiseagent.action.base_action import BaseAction, BaseActionData
@@ -188,10 +187,13 @@ class ArxivAction(BaseAction):
             }
             for index, (arxiv_id_list, title, authors, abstract) in enumerate(arxiv_data.current_arxiv_data)
         ]
-        # Translate and classify papers
+        # Translate and classify papers, the papers are independent so they are asked concurrently
         arxiv_data.current_arxiv_data = []
-        for item in tqdm(paper_data, total=len(paper_data)):
-            self.translate_and_classify(item)
+        output_list = self.llm_batch_ask(
+            [self.get_translation_prompt(item) for item in paper_data], memory=[], system_prompt=""
+        )
+        for item, output in zip(paper_data, output_list):
+            self.parse_translation(arxiv_paper_item=item, output=output)
             arxiv_data.current_arxiv_data.append(item)
             BaseActionMessage(content="```json" + json.dumps(item, ensure_ascii=False) + "```").send_message()
 
@@ -335,9 +337,23 @@ class ArxivAction(BaseAction):
 
     def translate_and_classify(self, arxiv_paper_item):
         """Translates the abstract of an arXiv item and classifies it using the LLM."""
-        content = TRANSLATION_PROMPT.format(base_class=BASE_CLASS, abstract=arxiv_paper_item["abstract"])
         try:
-            output = self.llm_ask(prompt=content, memory=[], system_prompt="")
+            output = self.llm_ask(prompt=self.get_translation_prompt(arxiv_paper_item), memory=[], system_prompt="")
+        except Exception as e:
+            print(f"Error processing {arxiv_paper_item['title']}: {e}")
+            output = None
+        self.parse_translation(arxiv_paper_item, output)
+
+    def get_translation_prompt(self, arxiv_paper_item):
+        return TRANSLATION_PROMPT.format(base_class=BASE_CLASS, abstract=arxiv_paper_item["abstract"])
+
+    def parse_translation(self, arxiv_paper_item, output):
+        """Set the label and the translated abstract of the item from the LLM output, empty if the output is None."""
+        if output is None:
+            arxiv_paper_item["label"] = []
+            arxiv_paper_item["abstract_translated"] = ""
+            return
+        try:
             label_start, label_end = "<label>", "</label>"
             abstract_start, abstract_end = "<abstract>", "</abstract>"
 
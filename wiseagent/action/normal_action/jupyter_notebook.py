@@ -12,7 +12,7 @@ from pydantic import ConfigDict
 from wiseagent.action.action_decorator import action
 from wiseagent.action.base_action import BaseAction, BaseActionData
 from wiseagent.common.protocol_message import FileUploadMessage
-from wiseagent.common.utils import read_rb, repair_path
+from wiseagent.common.utils import repair_path
 from wiseagent.tools.notebook_execute_tool import JupyterNotebookTool
 
 
@@ -60,7 +60,7 @@ class JupyterNotebookAction(BaseAction):
         notebook_tool = self.get_notebook_tool()
         notebook_tool.save_notebook(file_name)
         if upload_file:
-            FileUploadMessage(file_name=str(file_name), file_content=read_rb(file_name)).send_message()
+            FileUploadMessage(file_name=str(file_name)).send_message()
         return file_name
 
     @action()
@@ -6,7 +6,6 @@ LastEditTime: 2024-11-08 16:29:24
 Description: 
 """
 import json
-import queue
 import re
 from functools import partial
 from typing import Any, List
@@ -20,8 +19,15 @@ from wiseagent.common.protocol_message import (
     Message,
 )
 from wiseagent.common.singleton import singleton
+from wiseagent.common.stream_buffer import StreamBuffer
+from wiseagent.common.stream_parser import StreamTagTokenizer, chunk_stream_function
 from wiseagent.common.utils import repair_path, write_file
 
+CONTENT_START_TAG = "<content>"
+CONTENT_END_TAG = "</content>"
+CHAPTER_START_PATTERN = re.compile(r'<chapter level="(\d+)">')
+CHAPTER_END_TAG = "</chapter>"
+
 GENERATE_LONG_DOCUMENT_PROMPT = """
 You are a book writing expert, you need to complete a book.
 
@@ -193,7 +199,7 @@ class LongDocumentGenerateAction(BaseAction):
         # Generate the document
         content = topic + "\n"
         stream_message = FileUploadMessage(
-            file_name=str(repair_path(save_path)), is_stream=True, stream_queue=queue.Queue()
+            file_name=str(repair_path(save_path)), is_stream=True, stream_queue=StreamBuffer()
         ).send_message()
         for item in outline:
             level = item.get("level", None)
@@ -213,7 +219,12 @@ class LongDocumentGenerateAction(BaseAction):
 
             # Call the LLM to generate the chapter content
             response = self.llm_ask(
-                prompt, handle_stream_function=partial(self.parse_document_stream, upload_mesage=stream_message)
+                prompt,
+                handle_stream_function=partial(
+                    self.parse_document_stream,
+                    upload_mesage=stream_message,
+                    tokenizer=StreamTagTokenizer(CONTENT_START_TAG, CONTENT_END_TAG),
+                ),
             )
             content += f"{self.parse_document(response).strip()}\n"
         stream_message.stream_queue.put(STREAM_END_FLAG)
@@ -223,22 +234,17 @@ class LongDocumentGenerateAction(BaseAction):
         # FileUploadMessage(file_name=save_path).send_message()
         return f"document generated successfully. The path is {save_path}"
 
-    def parse_document_stream(self, rsp_message, upload_mesage: Message):
-        if rsp_message == STREAM_END_FLAG:
-            return ""
-        special_tag = ["<content>", "</content>"]
-        if any(tag.startswith(rsp_message) for tag in special_tag):
-            if "<content>" in rsp_message:
+    @chunk_stream_function
+    def parse_document_stream(self, chunk, upload_mesage: Message, tokenizer: StreamTagTokenizer):
+        """Upload the text between <content> and </content> of the stream."""
+        token_list = tokenizer.flush() if chunk == STREAM_END_FLAG else tokenizer.feed(chunk)
+        for token in token_list:
+            if token.tag == CONTENT_START_TAG:
                 upload_mesage.appendix["start_receive_content"] = True
-                return ""
-            elif "</content>" in rsp_message:
+            elif token.tag == CONTENT_END_TAG:
                 upload_mesage.appendix["start_receive_content"] = False
-                return ""
-            return rsp_message
-        else:
-            if upload_mesage.appendix.get("start_receive_content", None):
-                upload_mesage.stream_queue.put(rsp_message)
-            return ""
+            elif upload_mesage.appendix.get("start_receive_content", None):
+                upload_mesage.stream_queue.put(token.text)
 
     def parse_document(self, respond):
         pattern = "<content>\s*(.*?)\s*</content>"
@@ -258,46 +264,57 @@ class LongDocumentGenerateAction(BaseAction):
         generate_outline_prompt = GENERATE_OUTLINE_PROMPT.format(
             topic=topic, description=description, language=language
         )
-        steam_mesage = CommunicationMessage(is_stream=True, stream_queue=queue.Queue()).send_message()
+        steam_mesage = CommunicationMessage(is_stream=True, stream_queue=StreamBuffer()).send_message()
 
         respond = self.llm_ask(
             generate_outline_prompt,
-            handle_stream_function=partial(self.parse_outline_stream, upload_mesage=steam_mesage),
+            handle_stream_function=partial(
+                self.parse_outline_stream,
+                upload_mesage=steam_mesage,
+                tokenizer=StreamTagTokenizer(CHAPTER_START_PATTERN, CHAPTER_END_TAG),
+            ),
         )
         outline = self.parse_outline(respond)
         return f"generate_outline executed successfully.\nThe outline is:\n{outline}"
 
-    def parse_outline_stream(self, rsp_message, upload_mesage: Message):
-        """Parse outline stream"""
+    @chunk_stream_function
+    def parse_outline_stream(self, chunk, upload_mesage: Message, tokenizer: StreamTagTokenizer):
+        """Parse outline stream, upload the outline text when a chapter is closed."""
         if "start_flag" not in upload_mesage.appendix:
             upload_mesage.appendix["start_flag"] = True
             upload_mesage.appendix["level_list"] = [0, 0, 0]
-        if rsp_message == STREAM_END_FLAG:
+            upload_mesage.appendix["chapter_level"] = None
+            upload_mesage.appendix["chapter_content"] = ""
+        if chunk == STREAM_END_FLAG:
             upload_mesage.stream_queue.put(STREAM_END_FLAG)
-            return ""
-        pattern = r'<chapter level="(\d+)">(.*?)</chapter>'
-        chapter_pattern = re.compile(pattern, re.DOTALL)
-        matches = chapter_pattern.findall(rsp_message)
-        if not matches:
-            return rsp_message
-        outline_text = ""
-        for level, content in matches:
-            level = int(level) - 1
-            upload_mesage.appendix["level_list"][level] += 1
-            pre_level = ".".join([str(i) for i in upload_mesage.appendix["level_list"][: level + 1]]) + "."
-            if level == 0 or level == 1:
-                upload_mesage.appendix["level_list"][level + 1] = 0
-                outline_text += f"{pre_level} {content}\n"
-            elif level == 2:
-                chapter_name = re.search(r"<chapter_name>(.*?)</chapter_name>", content, re.DOTALL).group(1)
-                chapter_description = re.search(
-                    r"<chapter_description>(.*?)</chapter_description>", content, re.DOTALL
-                ).group(1)
-                outline_text += f"{pre_level} {chapter_name}\n"
-                outline_text += f"    {chapter_description}\n"
-        outline_text += "\n"
-        upload_mesage.stream_queue.put(outline_text)
-        return ""
+            return
+        for token in tokenizer.feed(chunk):
+            if token.tag == CHAPTER_START_PATTERN.pattern:
+                upload_mesage.appendix["chapter_level"] = int(token.match.group(1)) - 1
+                upload_mesage.appendix["chapter_content"] = ""
+            elif token.tag == CHAPTER_END_TAG:
+                level = upload_mesage.appendix["chapter_level"]
+                if level is None:
+                    continue
+                content = upload_mesage.appendix["chapter_content"]
+                upload_mesage.appendix["chapter_level"] = None
+                outline_text = ""
+                upload_mesage.appendix["level_list"][level] += 1
+                pre_level = ".".join([str(i) for i in upload_mesage.appendix["level_list"][: level + 1]]) + "."
+                if level == 0 or level == 1:
+                    upload_mesage.appendix["level_list"][level + 1] = 0
+                    outline_text += f"{pre_level} {content}\n"
+                elif level == 2:
+                    chapter_name = re.search(r"<chapter_name>(.*?)</chapter_name>", content, re.DOTALL).group(1)
+                    chapter_description = re.search(
+                        r"<chapter_description>(.*?)</chapter_description>", content, re.DOTALL
+                    ).group(1)
+                    outline_text += f"{pre_level} {chapter_name}\n"
+                    outline_text += f"    {chapter_description}\n"
+                outline_text += "\n"
+                upload_mesage.stream_queue.put(outline_text)
+            elif upload_mesage.appendix["chapter_level"] is not None:
+                upload_mesage.appendix["chapter_content"] += token.text
 
     def parse_outline(self, xml_outline):
         """Parse outline from xml
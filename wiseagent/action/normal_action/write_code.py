@@ -6,7 +6,6 @@ LastEditTime: 2024-11-05 10:33:19
 Description: 
 """
 import itertools
-import queue
 import re
 import webbrowser
 from functools import partial
@@ -20,6 +19,8 @@ from wiseagent.common.protocol_message import (
     FileUploadMessage,
 )
 from wiseagent.common.singleton import singleton
+from wiseagent.common.stream_buffer import StreamBuffer
+from wiseagent.common.stream_parser import StreamTagTokenizer, chunk_stream_function
 from wiseagent.common.utils import repair_path, write_file
 from wiseagent.core.agent import Agent, get_current_agent_data
 
@@ -63,6 +64,11 @@ class WriteCodeAction(BaseAction):
     """This is ActionCass to do wechat action, all the action will be play in Wechat Application"""
 
     action_description: str = " this class is to do wechat action."
+    # The code must be generated for the current request, never served from the semantic cache.
+    allow_semantic_cache: bool = False
+    # Write the batches of five files concurrently. The batch does not see the code of the earlier batches then, so
+    # it is only for the files which do not depend on each other.
+    write_batches_concurrently: bool = False
 
     def init_agent(self, agent_data: Agent):
         """This Action Does not need to add structure"""
@@ -88,88 +94,97 @@ class WriteCodeAction(BaseAction):
             )
         """
         output = ""
-        temp_memory = get_current_agent_data().get_latest_memory()
-        for current_file_list in [file_list[i : i + 5] for i in range(0, len(file_list), 5)]:
-            """Write code for each five files"""
-            write_code_prompt = WRITE_CODE_PROMPT_TEMPLATE.format(
-                file_list="\n".join(current_file_list), file_description=file_description
-            )
-            # the will be multi file generate in one respond, so need to report a list of FileUpload Message
-            cache = {}
-            respond = self.llm_ask(
-                write_code_prompt,
-                memory=temp_memory,
-                handle_stream_function=partial(self.handle_write_code_stream, cache=cache),
+        batch_list = [file_list[i : i + 5] for i in range(0, len(file_list), 5)]
+        prompt_list = [
+            WRITE_CODE_PROMPT_TEMPLATE.format(file_list="\n".join(current_file_list), file_description=file_description)
+            for current_file_list in batch_list
+        ]
+        agent_data = get_current_agent_data()
+        # The same system prompt as llm_ask uses by default, the memory is fitted to the context window with it.
+        system_prompt = agent_data.get_agent_system_prompt(
+            tools_description="", agent_instructions="", agent_example=""
+        )
+        # The responses of the previous batches, the memory is fitted again with them before each batch.
+        respond_memory = []
+        respond_list = None
+        if self.write_batches_concurrently and len(batch_list) > 1:
+            respond_list = self.llm_batch_ask(
+                prompt_list,
+                memory=agent_data.get_context_memory(system_prompt, max(prompt_list, key=len)),
+                system_prompt=system_prompt,
+                handle_stream_function_list=[partial(self.handle_write_code_stream, cache={}) for _ in batch_list],
             )
+        for index, write_code_prompt in enumerate(prompt_list):
+            """Write code for each five files"""
+            if respond_list is not None:
+                respond = respond_list[index] or ""
+            else:
+                # the will be multi file generate in one respond, so need to report a list of FileUpload Message
+                cache = {}
+                respond = self.llm_ask(
+                    write_code_prompt,
+                    memory=agent_data.get_context_memory(system_prompt, write_code_prompt, respond_memory),
+                    system_prompt=system_prompt,
+                    handle_stream_function=partial(self.handle_write_code_stream, cache=cache),
+                )
             current_file_list, code = self.parse_write_code_respond(respond)
-            temp_memory.append(AIMessage(coontent=respond))
+            respond_memory.append(AIMessage(content=respond))
             output += "\n\n".join(
                 [f"{file_name} complete.\ncontent:\n{code}" for file_name, code in zip(current_file_list, code)]
             )
         return output + "All files are complete."
 
-    def handle_write_code_stream(self, rsp_message: str, cache: dict):
+    @chunk_stream_function
+    def handle_write_code_stream(self, chunk: str, cache: dict):
         """
-        Prase the stream message and return the file name and file content
+        Prase the stream message and upload the code of each file as a stream FileUploadMessage.
         Agrs:
-            rsp_message (str): the stream message from LLM, the rsp_message will only add one char per round.
-            upload_message (FileUploadMessage): the upload message to upload the file
+            chunk (str): the new text of the stream from LLM, or STREAM_END_FLAG at the end.
+            cache (dict): the state of the stream, please use {} to init cache
         """
         if not isinstance(cache, dict):
             raise Exception("cache is not initialized, please use {} to init cache")
-        if "file_number" not in cache:
-            cache["file_number"] = ""
-        if "message_list" not in cache:
+        if "tokenizer" not in cache:
+            cache["tokenizer"] = StreamTagTokenizer(
+                FILE_NAME_START_TAG, FILE_NAME_END_TAG, CODE_START_TAG, CODE_END_TAG
+            )
             cache["message_list"] = []
-        if "message_index" not in cache:
-            cache["message_index"] = -1
-        if "start_receive_code" not in cache:
             cache["start_receive_code"] = False
-        if "start_receive_file_name" not in cache:
             cache["start_receive_file_name"] = False
             cache["file_name"] = ""
-        if STREAM_END_FLAG in rsp_message:
-            try:
-                cache["message_list"][cache["message_index"]].stream_queue.put(STREAM_END_FLAG)
-            except Exception as e:
-                pass
-        special_tag = [FILE_NAME_START_TAG, FILE_NAME_END_TAG, CODE_START_TAG, CODE_END_TAG]
-        if any(tag.startswith(rsp_message) for tag in special_tag):
-            # Step One, wait for receiver file_name
-            if FILE_NAME_END_TAG in rsp_message:
+        tokenizer: StreamTagTokenizer = cache["tokenizer"]
+        if chunk == STREAM_END_FLAG:
+            token_list = tokenizer.flush()
+        else:
+            token_list = tokenizer.feed(chunk)
+        for token in token_list:
+            # Step One, receive the file name and create the upload message
+            if token.tag == FILE_NAME_START_TAG:
+                cache["start_receive_file_name"] = True
+            elif token.tag == FILE_NAME_END_TAG:
                 file_name = repair_path(cache["file_name"].strip())
                 cache["message_list"].append(
                     FileUploadMessage(
-                        file_name=str(file_name), is_stream=True, stream_queue=queue.Queue()
+                        file_name=str(file_name), is_stream=True, stream_queue=StreamBuffer()
                     ).send_message()
                 )
-                cache["message_index"] = cache["message_index"] + 1
                 cache["file_name"] = ""
                 cache["start_receive_file_name"] = False
-                return ""
             # Step Two, start to receive code
-            elif FILE_NAME_START_TAG == rsp_message:
-                cache["start_receive_file_name"] = True
-                return ""
-            elif CODE_START_TAG == rsp_message:
+            elif token.tag == CODE_START_TAG:
                 cache["start_receive_code"] = True
-                return ""
             # Step Three, stop to receive code
-            elif CODE_END_TAG in rsp_message:
+            elif token.tag == CODE_END_TAG:
                 cache["start_receive_code"] = False
-                message_index = cache["message_index"]
-                cache["message_list"][message_index].stream_queue.put(STREAM_END_FLAG)
-                return ""
-            return rsp_message
-        else:
-            # Receive code
-            if cache["start_receive_code"]:
-                message_index = cache["message_index"]
-                cache["message_list"][message_index].stream_queue.put(rsp_message)
-            # Receive file name
-            if cache["start_receive_file_name"]:
-                cache["file_name"] += rsp_message
-            return ""
+                if cache["message_list"]:
+                    cache["message_list"][-1].stream_queue.put(STREAM_END_FLAG)
+            elif cache["start_receive_code"]:
+                if cache["message_list"]:
+                    cache["message_list"][-1].stream_queue.put(token.text)
+            elif cache["start_receive_file_name"]:
+                cache["file_name"] += token.text
+        if chunk == STREAM_END_FLAG and cache["message_list"]:
+            cache["message_list"][-1].stream_queue.put(STREAM_END_FLAG)
 
     def parse_write_code_respond(self, rsp):
         """Parse the respond from LLM and return the file name and file content"""
@@ -146,6 +146,28 @@ class MethodPlanAction(BasePlanAction):
         Returns:
             Dict: The result of the plan action, which may include thoughts, action command list, etc.
         """
+        plan_action_data, system_prompt, instruction_prompt = self._build_plan_prompt()
+        i, error = 0, "start"
+        while error and i < self.max_tries:
+            rsp = self.llm_ask(instruction_prompt, system_prompt=system_prompt)
+            command_data, error = self.parse_function[plan_action_data.parse_type](rsp)
+            prompt = instruction_prompt + f"Your respond is :{rsp}"
+            prompt += f"But the data format is not valid.\nError:{error} \nplease try again."
+            i += 1
+        return self._finish_plan(plan_action_data, rsp, command_data, command_list)
+
+    async def aplan(self, command_list: List[ActionCommand]):
+        """The coroutine version of plan, the LLM is awaited instead of blocking a thread."""
+        plan_action_data, system_prompt, instruction_prompt = self._build_plan_prompt()
+        i, error = 0, "start"
+        while error and i < self.max_tries:
+            rsp = await self.allm_ask(instruction_prompt, system_prompt=system_prompt)
+            command_data, error = self.parse_function[plan_action_data.parse_type](rsp)
+            i += 1
+        return self._finish_plan(plan_action_data, rsp, command_data, command_list)
+
+    def _build_plan_prompt(self):
+        """Return the action data, the system prompt and the instruction prompt of the plan."""
         agent_data: Agent = get_current_agent_data()
         plan_action_data = agent_data.get_action_data("MethodPlanAction")
         system_prompt = agent_data.get_agent_system_prompt(agent_example=plan_action_data.expericence)
@@ -155,13 +177,10 @@ class MethodPlanAction(BasePlanAction):
             if len(plan_action_data.plan_list) > plan_action_data.current_plan_index
             else "",
         )
-        i, error = 0, "start"
-        while error and i < self.max_tries:
-            rsp = self.llm_ask(instruction_prompt, system_prompt=system_prompt)
-            command_data, error = self.parse_function[plan_action_data.parse_type](rsp)
-            prompt = instruction_prompt + f"Your respond is :{rsp}"
-            prompt += f"But the data format is not valid.\nError:{error} \nplease try again."
-            i += 1
+        return plan_action_data, system_prompt, instruction_prompt
+
+    def _finish_plan(self, plan_action_data, rsp: str, command_data, command_list: List[ActionCommand]):
+        """Parse the thoughts and the command list from the respond, and report the command list."""
         thoughts = (
             rsp[: rsp.find(f"```{plan_action_data.parse_type}")]
             if rsp.find(f"```{plan_action_data.parse_type}") != -1
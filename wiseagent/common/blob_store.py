@@ -0,0 +1,191 @@
+"""
+Author: Huang Weitao
+Date: 2026-10-18 17:24:08
+LastEditors: Huang Weitao
+LastEditTime: 2026-10-18 17:24:08
+Description: Content addressed blob store on the disk.
+
+The FileUploadMessage and the ImageMessage keep the blob id (the sha256 of the content) instead of the bytes, so the
+messages in the short term memory and the message cache of the environment do not hold the files in memory. The
+bytes are loaded only when they are needed (e.g. by a reporter or the server), and the same content is stored once.
+
+The store does not know which messages still refer to a blob, so the disk use is bounded by the last use time of the
+blobs (the mtime, touched when the blob is put or read again):
+1. The blob not used for ttl seconds is deleted, the expired blobs are swept at most every ttl / 2 seconds.
+2. If the blobs exceed max_size bytes, the least recently used ones are deleted until they are below 80% of it.
+The message whose blob is deleted has no file content. Set ttl and max_size to None to keep the blobs forever.
+"""
+import hashlib
+import mmap
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, List, Optional, Tuple, Union
+
+from pydantic import BaseModel
+
+from wiseagent.common.const import DATA_PATH
+from wiseagent.common.logs import logger
+from wiseagent.common.singleton import singleton
+
+_READ_BLOCK_SIZE = 1024 * 1024
+
+
+@singleton
+class BlobStore(BaseModel):
+    """The blob is saved in root/<first two chars of the id>/<id>."""
+
+    root: Path = DATA_PATH / "blob"
+    # The max total size of the blobs in bytes, None means no limit.
+    max_size: Optional[int] = 1024 * 1024 * 1024
+    # The blob not used for ttl seconds is deleted, None means never.
+    ttl: Optional[float] = None
+    # The total size of the blobs, None until the blobs are scanned.
+    total_size: Optional[int] = None
+    last_collect_time: float = 0
+    lock: Any = None
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self.lock = threading.Lock()
+
+    def configure(self, **config):
+        for k, v in config.items():
+            if v is not None:
+                setattr(self, k, v)
+
+    def get_path(self, blob_id: str) -> Path:
+        return self.root / blob_id[:2] / blob_id
+
+    def exists(self, blob_id: str) -> bool:
+        return bool(blob_id) and self.get_path(blob_id).exists()
+
+    def get_size(self, blob_id: str) -> int:
+        return self.get_path(blob_id).stat().st_size
+
+    def _save(self, blob_id: str, write_function) -> str:
+        """Write the blob to a temp file and move it to the path, so the reader never see a half written blob."""
+        path = self.get_path(blob_id)
+        if self._touch(path):
+            self._collect_if_needed(0)
+            return blob_id
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f"{blob_id}.{uuid.uuid4().hex}.tmp")
+        try:
+            write_function(temp_path)
+            os.replace(temp_path, path)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+        self._collect_if_needed(path.stat().st_size)
+        return blob_id
+
+    def _touch(self, path: Path) -> bool:
+        """Update the last use time of the blob, return False if it does not exist."""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _collect_if_needed(self, added_size: int):
+        now = time.time()
+        with self.lock:
+            if self.total_size is not None:
+                self.total_size += added_size
+            is_over_size = self.max_size is not None and (self.total_size is None or self.total_size > self.max_size)
+            is_sweep_time = self.ttl is not None and now - self.last_collect_time > self.ttl / 2
+            if not is_over_size and not is_sweep_time:
+                return
+            self._collect(now)
+
+    def _list_blob(self) -> List[Tuple[float, int, Path]]:
+        """Return the (last use time, size, path) of the blobs, the temp files being written are skipped."""
+        blob_list = []
+        if not self.root.exists():
+            return blob_list
+        for entry in os.scandir(self.root):
+            if not entry.is_dir():
+                continue
+            for blob_entry in os.scandir(entry.path):
+                if blob_entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = blob_entry.stat()
+                except FileNotFoundError:
+                    continue
+                blob_list.append((stat.st_mtime, stat.st_size, Path(blob_entry.path)))
+        return blob_list
+
+    def collect(self) -> int:
+        """Delete the expired blobs and the least recently used blobs over max_size, return the deleted number."""
+        with self.lock:
+            return self._collect(time.time())
+
+    def _collect(self, now: float) -> int:
+        blob_list = sorted(self._list_blob())
+        total_size = sum(size for _, size, _ in blob_list)
+        target_size = self.max_size * 0.8 if self.max_size is not None and total_size > self.max_size else None
+        deleted_number = 0
+        for last_use_time, size, path in blob_list:
+            is_expired = self.ttl is not None and now - last_use_time > self.ttl
+            if not is_expired and (target_size is None or total_size <= target_size):
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            deleted_number += 1
+        if deleted_number:
+            logger.info(f"Delete {deleted_number} blobs, {total_size} bytes left in the blob store")
+        self.total_size = total_size
+        self.last_collect_time = now
+        return deleted_number
+
+    def delete(self, blob_id: str):
+        path = self.get_path(blob_id)
+        with self.lock:
+            try:
+                size = path.stat().st_size
+                path.unlink()
+            except FileNotFoundError:
+                return
+            if self.total_size is not None:
+                self.total_size -= size
+
+    def put(self, data: Union[bytes, bytearray, memoryview]) -> str:
+        """Save the bytes and return the blob id."""
+        blob_id = hashlib.sha256(data).hexdigest()
+        return self._save(blob_id, lambda temp_path: temp_path.write_bytes(data))
+
+    def put_file(self, file_path: Union[str, Path]) -> str:
+        """Save the file and return the blob id. The file is hashed and copied block by block, not read into memory."""
+        sha256 = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            while block := f.read(_READ_BLOCK_SIZE):
+                sha256.update(block)
+        return self._save(sha256.hexdigest(), lambda temp_path: shutil.copyfile(file_path, temp_path))
+
+    def read(self, blob_id: str) -> bytes:
+        """Read the whole blob into memory."""
+        path = self.get_path(blob_id)
+        self._touch(path)
+        return path.read_bytes()
+
+    def open(self, blob_id: str) -> Union[memoryview, bytes]:
+        """Map the blob into memory read only. The pages are loaded on demand and can be dropped by the OS."""
+        path = self.get_path(blob_id)
+        self._touch(path)
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # The empty file can not be mapped.
+                return b""
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def get_blob_store() -> BlobStore:
+    return BlobStore()
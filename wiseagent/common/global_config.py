@@ -7,7 +7,7 @@ Description:
 """
 
 import os
-from typing import List
+from typing import Any, Dict, List, Optional
 
 import yaml
 from pydantic import BaseModel
@@ -23,6 +23,25 @@ class GlobalConfig(BaseModel, YamlConfig):
     # Life Scheduler(e.g. react, act ...) belong to the life manager
     life_scheduler_module_path: List[str] = None
 
+    # The runtime of the agent life, "thread" (one thread per agent) or "async" (coroutines on one event loop).
+    life_runtime: str = None
+    # The max number of the threads that run the blocking plan and action in the async runtime.
+    async_executor_size: int = None
+
+    # The number of the worker processes to shard the agents. None means all the agents live in the main process.
+    shard_number: Optional[int] = None
+
+    # The node of the distributed agent society. None means single node.
+    node_id: Optional[str] = None
+    # The transport between the nodes, "socket" (TCP) or "local" (in-process loopback, for the test on one host).
+    node_transport: str = None
+    # The address of this node, e.g. "127.0.0.1:7100".
+    node_address: str = None
+    # The other nodes, map the node id to its address.
+    node_peers: Dict[str, str] = None
+    # The node whose monitor receives the messages reported by the agents of this node. None means local only.
+    report_node: Optional[str] = None
+
     # Action belong to the action manager
     action_module_path: List[str] = None
     # Base Action class, which is used to select ActionClas from code file. e.g. ["BaseAtion", "BasePlanAction"]
@@ -30,9 +49,65 @@ class GlobalConfig(BaseModel, YamlConfig):
 
     # LLM belong to the llm manager
     llm_module_path: List[str] = None
+    # The pool of the OpenAI clients, one client with keep-alive connections per (api_key, base_url).
+    llm_client_max_connections: int = None
+    llm_client_max_keepalive_connections: int = None
+    llm_client_keepalive_expiry: float = None
+    llm_client_idle_timeout: float = None
+    # The exact match cache of the LLM response, in memory (llm_cache_size responses) and in the SQLite database at
+    # llm_cache_path. The response expires after llm_cache_ttl seconds.
+    llm_cache: bool = None
+    llm_cache_size: int = None
+    llm_cache_ttl: Optional[float] = None
+    llm_cache_path: Optional[str] = None
+    # The semantic cache of the LLM response, used by the actions in llm_semantic_cache_actions. The response of the
+    # prompt whose embedding similarity is above llm_semantic_cache_threshold is returned.
+    llm_semantic_cache: bool = None
+    llm_semantic_cache_threshold: float = None
+    llm_semantic_cache_actions: List[str] = None
+    llm_semantic_cache_embedding: Optional[Dict[str, Any]] = None
+    # The rate limit (rpm, tpm, concurrency) of the LLM requests, the key is "default", the model name or
+    # "base_url|model". The request failed with 429, 5xx or a connection error is retried llm_max_retries times.
+    llm_rate_limit: Optional[Dict[str, Optional[Dict[str, Any]]]] = None
+    llm_max_retries: int = None
+    llm_retry_base_delay: float = None
+    llm_retry_max_delay: float = None
+    # Whether the identical LLM requests in flight share one upstream call.
+    llm_coalesce_requests: bool = None
+    # The backends of the "Router" LLM, each one has the llm_type of the backend LLM and the arguments of its
+    # llm_ask (base_url, api_key, model_name). The request fails over if the first token is not received in
+    # llm_router_first_token_timeout seconds, the failing backend is skipped for llm_router_cooldown seconds.
+    llm_router_backends: Optional[List[Dict[str, Any]]] = None
+    llm_router_first_token_timeout: Optional[float] = None
+    llm_router_cooldown: float = None
+    # Send a hedge request if the first token is later than llm_hedge_percentile of the recent time to first token,
+    # the hedges are at most llm_hedge_budget of the requests.
+    llm_hedge: bool = None
+    llm_hedge_percentile: float = None
+    llm_hedge_min_delay: float = None
+    llm_hedge_budget: float = None
+    llm_hedge_backend: Optional[Dict[str, Any]] = None
+    # Fit the memory to the context window (the key is the model name or "default") minus the reserved tokens,
+    # the last 30 messages are used if no window is configured.
+    llm_context_window: Optional[Dict[str, int]] = None
+    llm_context_reserved_tokens: int = None
+    llm_context_max_message_tokens: int = None
+    llm_context_min_recent: int = None
 
     env_yaml_path: str = None
 
+    # The blob store of the file messages. The blob not used for blob_store_ttl seconds is deleted, and the least
+    # recently used blobs are deleted if the blobs exceed blob_store_max_size bytes.
+    blob_store_max_size: Optional[int] = None
+    blob_store_ttl: Optional[float] = None
+
+    # Receiver. The message whose receiver is not found will be kept for dead_letter_ttl seconds,
+    # and retried every dead_letter_retry_interval seconds.
+    dead_letter_ttl: float = None
+    dead_letter_retry_interval: float = None
+    # The weight of the message lanes (control, user, bulk) in the receiver and monitor queue.
+    message_lane_weight: Dict[str, int] = None
+
     def __init__(self, **data):
         super().__init__(**data)
         self.env_yaml_path = self.env_yaml_path or ENV_CONFIG_PATH
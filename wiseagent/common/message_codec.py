@@ -0,0 +1,87 @@
+"""
+Author: Huang Weitao
+Date: 2026-10-18 17:05:31
+LastEditors: Huang Weitao
+LastEditTime: 2026-10-18 17:05:31
+Description: The binary codec of the message, used between the processes and the nodes.
+
+A frame is:
+    magic (4 bytes) | header size (uint32) | blob number (uint32) | blob size (uint64) * blob number | header | blobs
+The header is the json of the message class and the fields. The bytes value (e.g. the file_content of the
+FileUploadMessage) is not base64 encoded into the header, it is replaced by a reference to a blob and written as it
+is after the header. When decoding, the blob is a memoryview slice of the frame, so the file is not copied.
+
+The json form (Message.to_json) is still used by the web client.
+"""
+import json
+import struct
+from typing import List, Union
+
+from wiseagent.common.protocol_message import MESSAGE_MAP, Message
+
+MESSAGE_CODEC_MAGIC = b"WAM1"
+_PREFIX = struct.Struct(">4sII")
+_BLOB_SIZE = struct.Struct(">Q")
+# The key of the blob reference in the header, {"__blob__": index}
+_BLOB_KEY = "__blob__"
+
+
+def encode_message_parts(message: Message) -> List[Union[bytes, memoryview]]:
+    """Encode the message to a list of buffers: the prefix with the header, and the blobs.
+    The blobs are memoryviews of the bytes in the message, so they can be written to the socket or the file without
+    joining them into one buffer.
+    """
+    blob_list = []
+
+    def add_blob(value):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            blob_list.append(memoryview(value).cast("B"))
+            return {_BLOB_KEY: len(blob_list) - 1}
+        raise TypeError(f"Object of type {value.__class__.__name__} is not serializable in the message")
+
+    fields = message._to_codec_fields()
+    header = json.dumps(
+        {"MessageClass": message.__class__.__name__, "fields": fields}, ensure_ascii=False, default=add_blob
+    ).encode("utf-8")
+    prefix = _PREFIX.pack(MESSAGE_CODEC_MAGIC, len(header), len(blob_list))
+    blob_size = b"".join(_BLOB_SIZE.pack(blob.nbytes) for blob in blob_list)
+    return [prefix + blob_size + header] + blob_list
+
+
+def encode_message(message: Message) -> bytes:
+    """Encode the message to one bytes frame."""
+    return b"".join(encode_message_parts(message))
+
+
+def decode_message(data: Union[bytes, bytearray, memoryview], copy: bool = False) -> Message:
+    """Decode the frame to the message of the class in MESSAGE_MAP.
+    Args:
+        data: The frame.
+        copy (bool): If False, the bytes fields are the memoryview slices of the frame, so the frame must not be
+            modified while the message is in use. If True, they are copied into bytes.
+    """
+    view = memoryview(data).cast("B")
+    magic, header_size, blob_number = _PREFIX.unpack_from(view)
+    if magic != MESSAGE_CODEC_MAGIC:
+        raise ValueError("The data is not a message frame")
+    offset = _PREFIX.size
+    blob_size_list = [_BLOB_SIZE.unpack_from(view, offset + i * _BLOB_SIZE.size)[0] for i in range(blob_number)]
+    offset += blob_number * _BLOB_SIZE.size
+    header_view = view[offset : offset + header_size]
+    offset += header_size
+    blob_list = []
+    for blob_size in blob_size_list:
+        blob = view[offset : offset + blob_size]
+        blob_list.append(bytes(blob) if copy else blob)
+        offset += blob_size
+
+    def load_blob(value: dict):
+        if len(value) == 1 and _BLOB_KEY in value:
+            return blob_list[value[_BLOB_KEY]]
+        return value
+
+    header = json.loads(bytes(header_view), object_hook=load_blob)
+    message_class = MESSAGE_MAP.get(header["MessageClass"], Message)
+    # The fields are encoded from a message, so the validation (and e.g. reading the file in FileUploadMessage) is
+    # skipped.
+    return message_class.fast(**header["fields"])
@@ -0,0 +1,125 @@
+"""
+Author: Huang Weitao
+Date: 2026-10-18 15:58:40
+LastEditors: Huang Weitao
+LastEditTime: 2026-10-18 15:58:40
+Description: Priority aware message queue used by the receiver and the monitor.
+The messages are put into different lanes according to the env_handle_type, and the lanes are drained with
+weighted fair scheduling, so the control messages will not wait behind a lot of large file upload messages.
+"""
+import queue
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+from wiseagent.common.protocol_message import EnvironmentHandleType
+
+
+class MessageLane:
+    # Sleep, wakeup and control signals.
+    CONTROL = "control"
+    # The messages the user or other agents are waiting for.
+    USER = "user"
+    # Large payloads, e.g. file upload, image, action result.
+    BULK = "bulk"
+
+
+DEFAULT_LANE_WEIGHT = {MessageLane.CONTROL: 8, MessageLane.USER: 4, MessageLane.BULK: 1}
+
+CONTROL_HANDLE_TYPE = {EnvironmentHandleType.SLEEP, EnvironmentHandleType.WAKEUP, EnvironmentHandleType.CONTROL}
+BULK_HANDLE_TYPE = {
+    EnvironmentHandleType.FILE_UPLOAD,
+    EnvironmentHandleType.IMAGE,
+    EnvironmentHandleType.BASE_ACTION_MESSAGE,
+}
+
+
+def get_message_lane(message) -> str:
+    """Return the lane of the message according to its env_handle_type."""
+    env_handle_type = getattr(message, "env_handle_type", None)
+    if env_handle_type in CONTROL_HANDLE_TYPE:
+        return MessageLane.CONTROL
+    if env_handle_type in BULK_HANDLE_TYPE:
+        return MessageLane.BULK
+    return MessageLane.USER
+
+
+class PriorityMessageQueue:
+    """A thread safe queue with the same get/put interface as queue.Queue.
+
+    Every lane is a FIFO. When more than one lane has messages, the lane is selected by smooth weighted round robin,
+    so a lane with weight 8 is drained 8 times as often as a lane with weight 1, and no lane is starved.
+    """
+
+    def __init__(self, lane_weight: Dict[str, int] = None, lane_function=get_message_lane):
+        self.lane_weight = dict(DEFAULT_LANE_WEIGHT)
+        if lane_weight:
+            self.lane_weight.update(lane_weight)
+        if any(weight <= 0 for weight in self.lane_weight.values()):
+            raise ValueError("The weight of the lane must be positive")
+        self.lane_function = lane_function
+        self.lane_map = {lane: deque() for lane in self.lane_weight}
+        self.current_weight = {lane: 0 for lane in self.lane_weight}
+        self.size = 0
+        self.not_empty = threading.Condition()
+
+    def put(self, item, block=True, timeout=None):
+        """Put the item into its lane. The queue is unbounded, so block and timeout are ignored."""
+        lane = self.lane_function(item)
+        if lane not in self.lane_map:
+            lane = MessageLane.USER
+        with self.not_empty:
+            self.lane_map[lane].append(item)
+            self.size += 1
+            self.not_empty.notify()
+
+    def put_nowait(self, item):
+        self.put(item, block=False)
+
+    def get(self, block=True, timeout=None):
+        """Remove and return an item. Raise queue.Empty if no item is available in time."""
+        with self.not_empty:
+            if not block:
+                if not self.size:
+                    raise queue.Empty
+            elif timeout is None:
+                while not self.size:
+                    self.not_empty.wait()
+            else:
+                if timeout < 0:
+                    raise ValueError("'timeout' must be a non-negative number")
+                end_time = time.monotonic() + timeout
+                while not self.size:
+                    remaining = end_time - time.monotonic()
+                    if remaining <= 0:
+                        raise queue.Empty
+                    self.not_empty.wait(remaining)
+            return self._pop()
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def _pop(self):
+        """Select a lane by smooth weighted round robin and pop its first item. Must be called with the lock held."""
+        selected_lane, total_weight = None, 0
+        for lane, lane_queue in self.lane_map.items():
+            if not lane_queue:
+                continue
+            weight = self.lane_weight[lane]
+            total_weight += weight
+            self.current_weight[lane] += weight
+            if selected_lane is None or self.current_weight[lane] > self.current_weight[selected_lane]:
+                selected_lane = lane
+        self.current_weight[selected_lane] -= total_weight
+        self.size -= 1
+        return self.lane_map[selected_lane].popleft()
+
+    def qsize(self):
+        return self.size
+
+    def lane_size(self, lane: str):
+        return len(self.lane_map.get(lane, ()))
+
+    def empty(self):
+        return self.size == 0
@@ -6,7 +6,11 @@ LastEditTime: 2024-10-05 12:17:28
 Description: 
 """
 import base64
+import functools
+import itertools
 import json
+import os
+import time
 import uuid
 from datetime import datetime
 from enum import Enum
@@ -15,10 +19,100 @@ from typing import Any
 
 from pydantic import BaseModel, ConfigDict, field_validator
 
+from wiseagent.common.blob_store import get_blob_store
 from wiseagent.common.logs import logger
 
 STREAM_END_FLAG = "[STREAM_END_FLAG]"
 
+# The message id is a random prefix of the process and a monotonic counter, it is cheaper than uuid4 for every message
+# and still unique across the processes (e.g. the agent shards).
+_message_id_prefix = uuid.uuid4().hex[:16]
+_message_id_counter = itertools.count(1)
+
+
+def _reset_message_id():
+    global _message_id_prefix, _message_id_counter
+    _message_id_prefix = uuid.uuid4().hex[:16]
+    _message_id_counter = itertools.count(1)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_message_id)
+
+
+def new_message_id() -> str:
+    return _message_id_prefix + "%016x" % next(_message_id_counter)
+
+
+# The formatted time stamp of the last second, (second, time_stamp).
+_time_stamp_cache = (0, "")
+
+
+def format_time_stamp(create_time: float) -> str:
+    """Format the time as "%Y-%m-%d %H:%M:%S". The result is cached for one second."""
+    global _time_stamp_cache
+    second = int(create_time)
+    cache = _time_stamp_cache
+    if cache[0] != second:
+        cache = (second, datetime.fromtimestamp(second).strftime("%Y-%m-%d %H:%M:%S"))
+        _time_stamp_cache = cache
+    return cache[1]
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_name(name: str) -> str:
+    """The agent name is case insensitive, the lower case name is used in the message."""
+    return name.lower()
+
+
+_get_current_agent_data = None
+
+
+def _load_get_current_agent_data():
+    global _get_current_agent_data
+    # Import here to avoid the circular import.
+    from wiseagent.core.agent import get_current_agent_data
+
+    _get_current_agent_data = get_current_agent_data
+    return get_current_agent_data
+
+
+def _fill_message_default(data: dict) -> dict:
+    """Fill the message id, the sender, the receiver and the time stamp, and normalize the names."""
+    get = data.get
+    if not get("message_id"):
+        data["message_id"] = new_message_id()
+    send_from, send_to = get("send_from"), get("send_to")
+    if not send_from or not send_to:
+        agent_data = (_get_current_agent_data or _load_get_current_agent_data())()
+        if agent_data:
+            send_from = send_from or agent_data.name
+            send_to = send_to or agent_data.name
+    if isinstance(send_from, str):
+        data["send_from"] = normalize_name(send_from)
+    if isinstance(send_to, str):
+        data["send_to"] = normalize_name(send_to)
+    if not get("time_stamp"):
+        data["create_time"] = create_time = get("create_time") or time.time()
+        cache = _time_stamp_cache
+        data["time_stamp"] = cache[1] if cache[0] == int(create_time) else format_time_stamp(create_time)
+    return data
+
+
+# The default values of the message class used by Message.fast, map the class to (default dict, mutable field names).
+_fast_default_map = {}
+_object_setattr = object.__setattr__
+_object_new = object.__new__
+
+
+def _get_fast_default(cls):
+    if cls.__private_attributes__:
+        raise TypeError(f"{cls.__name__} has private attributes, Message.fast is not supported")
+    default = {name: field.get_default(call_default_factory=True) for name, field in cls.model_fields.items()}
+    mutable_field = [name for name, value in default.items() if isinstance(value, (dict, list, set))]
+    fast_default = _fast_default_map[cls] = (default, mutable_field)
+    return fast_default
+
 
 class EnvironmentHandleType:
     COMMUNICATION = "communication"
@@ -47,6 +141,8 @@ class Message(BaseModel):
     cause_by: str = ""
     content: str = ""
     time_stamp: str = ""
+    # The unix time when the message is created.
+    create_time: float = 0
     env_handle_type: Any = None
     llm_handle_type: LLMHandleType = None
     appendix: dict = {}
@@ -56,30 +152,42 @@ class Message(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
     def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        if self.message_id == "":
-            self.message_id = uuid.uuid4().hex
-        if not self.send_from or not self.send_to:
-            from wiseagent.core.agent import get_current_agent_data
-
-            agent_data = get_current_agent_data()
-            if agent_data and not self.send_from:
-                self.send_from = agent_data.name
-            if agent_data and not self.send_to:
-                self.send_to = agent_data.name
-        if self.time_stamp == "":
-            self.time_stamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        if self.send_to and any(char.isupper() for char in self.send_to):
-            self.send_to = self.send_to.lower()
-        if self.send_from and any(char.isupper() for char in self.send_from):
-            self.send_from = self.send_from.lower()
-
-    def _to_dict(self, exclude=[]) -> str:
-        data = self.model_dump(exclude=exclude.append("stream_queue"))
+        super().__init__(**_fill_message_default(kwargs))
+
+    @classmethod
+    def fast(cls, **kwargs):
+        """Create the message without the pydantic validation, for the messages created by the system in the hot path
+        (e.g. sleep, wakeup and the memory of the life loop). The caller must pass the values of the right type.
+        NOTE: The __init__ of the subclass is not called, e.g. FileUploadMessage will not read the file.
+        """
+        default, mutable_field = _fast_default_map.get(cls) or _get_fast_default(cls)
+        data = default.copy()
+        for name in mutable_field:
+            data[name] = data[name].copy()
+        data.update(kwargs)
+        # Filled on the defaults of the class, so the kwargs are not merged twice.
+        _fill_message_default(data)
+        # The same as BaseModel.model_construct, without copying the default values field by field.
+        message = _object_new(cls)
+        _object_setattr(message, "__dict__", data)
+        _object_setattr(message, "__pydantic_fields_set__", set(kwargs))
+        _object_setattr(message, "__pydantic_extra__", None)
+        _object_setattr(message, "__pydantic_private__", None)
+        return message
+
+    def _to_dict(self, exclude=[]) -> dict:
+        """The json form of the message for the web client. Use wiseagent.common.message_codec between the processes
+        and the nodes, it does not base64 encode the file content."""
+        data = self.model_dump(exclude=set(exclude) | {"stream_queue"})
         data["MessageClass"] = self.__class__.__name__
         data["stream_queue"] = ""
         return data
 
+    def _to_codec_fields(self) -> dict:
+        """The fields encoded by wiseagent.common.message_codec. The stream queue can not be encoded.
+        Read from __dict__ instead of model_dump, model_dump will copy the bytes."""
+        return {name: value for name, value in self.__dict__.items() if name != "stream_queue"}
+
     def to_json(self, exclude=[]) -> str:
         data = self._to_dict(exclude)
         return json.dumps(data, ensure_ascii=False)
@@ -140,14 +248,14 @@ class ControlMessage(Message):
     env_handle_type: str = EnvironmentHandleType.CONTROL
 
 
-class FileUploadMessage(Message):
-    """
-    NOTE: This message will not save to the database.
+class FileMessage(Message):
+    """The base class of the message with a file. The content is kept in the blob store (see
+    wiseagent.common.blob_store) and the message only keeps the blob id, the bytes are loaded when they are needed.
     """
 
-    env_handle_type: str = EnvironmentHandleType.FILE_UPLOAD
     file_name: str = ""
-    file_content: Any = b""
+    # The id of the content in the blob store. Empty means no content, e.g. the stream message.
+    blob_id: str = ""
 
     @field_validator("file_name", mode="before")
     def convert_to_path(cls, v):
@@ -155,45 +263,72 @@ class FileUploadMessage(Message):
             return str(v)
         return v
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, file_content=None, **kwargs):
         super().__init__(*args, **kwargs)
         if self.file_name == "" and self.stream_queue is None:
             raise ValueError("file_name must be specified")
-        if self.file_content == b"" and self.file_name and not self.is_stream:
-            from wiseagent.common.utils import read_rb
-
-            self.file_content = read_rb(self.file_name)
-
-    def _to_dict(self, exclude=["file_content"]):
+        if file_content:
+            self.file_content = file_content
+        elif not self.blob_id and self.file_name and not self.is_stream:
+            from wiseagent.common.utils import repair_path
+
+            self.blob_id = get_blob_store().put_file(repair_path(self.file_name))
+
+    @classmethod
+    def fast(cls, file_content=None, **kwargs):
+        message = super().fast(**kwargs)
+        if file_content:
+            message.file_content = file_content
+        return message
+
+    @property
+    def file_content(self) -> bytes:
+        """The content of the file. It is read from the blob store on every access, do not keep it. Empty if the blob
+        has been deleted by the blob store."""
+        if not self.blob_id:
+            return b""
+        try:
+            return get_blob_store().read(self.blob_id)
+        except FileNotFoundError:
+            logger.warning(f"The content of {self.file_name} has been deleted from the blob store")
+            return b""
+
+    @file_content.setter
+    def file_content(self, value):
+        self.blob_id = get_blob_store().put(value) if value else ""
+
+    def open_file_content(self):
+        """Return the content mapped read only, without reading the whole file into memory."""
+        if not self.blob_id:
+            return b""
+        try:
+            return get_blob_store().open(self.blob_id)
+        except FileNotFoundError:
+            logger.warning(f"The content of {self.file_name} has been deleted from the blob store")
+            return b""
+
+    def _to_dict(self, exclude=[]):
         data = super()._to_dict(exclude=exclude)
-        data["file_content"] = base64.b64encode(self.file_content).decode("utf-8")
+        data["file_content"] = base64.b64encode(self.open_file_content()).decode("utf-8")
         return data
 
+    def _to_codec_fields(self) -> dict:
+        # The peer may not share the blob store, so the content is sent with the message.
+        fields = super()._to_codec_fields()
+        fields["file_content"] = self.open_file_content()
+        return fields
 
-class ImageMessage(Message):
-    env_handle_type: str = EnvironmentHandleType.IMAGE
-    file_name: str = ""
-    file_content: Any = b""
 
-    @field_validator("file_name", mode="before")
-    def convert_to_path(cls, v):
-        if isinstance(v, Path):
-            return str(v)
-        return v
+class FileUploadMessage(FileMessage):
+    """
+    NOTE: This message will not save to the database.
+    """
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        if self.file_name == "" and self.stream_queue is None:
-            raise ValueError("file_name must be specified")
-        if self.file_content == b"" and self.file_name and not self.is_stream:
-            from wiseagent.common.utils import read_rb
+    env_handle_type: str = EnvironmentHandleType.FILE_UPLOAD
 
-            self.file_content = read_rb(self.file_name)
 
-    def _to_dict(self, exclude=["file_content"]):
-        data = super()._to_dict(exclude=exclude)
-        data["file_content"] = base64.b64encode(self.file_content).decode("utf-8")
-        return data
+class ImageMessage(FileMessage):
+    env_handle_type: str = EnvironmentHandleType.IMAGE
 
 
 class SleepMessage(Message):
@@ -221,15 +356,25 @@ MESSAGE_MAP = {
     "BaseActionMessage": BaseActionMessage,
     "ControlMessage": ControlMessage,
     "FileUploadMessage": FileUploadMessage,
+    "ImageMessage": ImageMessage,
     "SleepMessage": SleepMessage,
     "WakeupMessage": WakeupMessage,
     "CreateTaskMessage": CreateTaskMessage,
     "FinishTaskMessage": FinishTaskMessage,
+    "Message": Message,
 }
 
 
 def get_message_from_dict(data: dict):
-    return MESSAGE_MAP[data["message_type"]](**data)
+    """Create the message from the dict of Message._to_dict."""
+    # The None value is not valid for some typed fields (e.g. llm_handle_type), use the default instead.
+    data = {key: value for key, value in data.items() if value is not None}
+    message_class = MESSAGE_MAP.get(data.pop("MessageClass", None) or data.pop("message_type", None), Message)
+    if data.get("stream_queue") == "":
+        data.pop("stream_queue")
+    if isinstance(data.get("file_content", None), str):
+        data["file_content"] = base64.b64decode(data["file_content"])
+    return message_class(**data)
 
 
 # TODO: add more message types
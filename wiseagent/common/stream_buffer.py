@@ -0,0 +1,194 @@
+"""
+Author: Huang Weitao
+Date: 2026-10-18 17:40:26
+LastEditors: Huang Weitao
+LastEditTime: 2026-10-18 17:40:26
+Description: Append-only stream buffer of the stream message.
+
+The producer appends the chunks to the buffer, and every consumer (the reporters, the SSE clients of the server, the
+IPC bus) reads it with its own StreamReader. The reader has its own cursor, so the consumers do not steal the chunks
+from each other, and the consumer that starts late still reads the stream from the beginning. The reader returns all
+the chunks appended since the last read in one string, so a slow consumer does not wake up for every character.
+
+StreamBuffer keeps put(block) / put(STREAM_END_FLAG) of queue.Queue for the producers, and get() for the consumer
+that still reads the stream like a queue. The coroutine reads the stream with StreamReader.aread, it is woken up by
+the writer through its event loop instead of blocking a thread.
+"""
+import asyncio
+import queue
+import threading
+import time
+from typing import AsyncIterator, Iterator, List, Optional
+
+from wiseagent.common.protocol_message import STREAM_END_FLAG
+
+
+class StreamBuffer:
+    """Thread safe append-only buffer of the text chunks."""
+
+    def __init__(self):
+        self._chunk_list: List[str] = []
+        self._is_closed = False
+        self._condition = threading.Condition()
+        # The reader used by get(), it is created when get() is called first time.
+        self._default_reader = None
+        # The (event loop, future) of the coroutines waiting in StreamReader.aread.
+        self._async_waiter_list = []
+
+    @property
+    def is_closed(self) -> bool:
+        return self._is_closed
+
+    def write(self, chunk: str):
+        """Append the chunk. The empty chunk and the chunk after the end of the stream are ignored."""
+        if not chunk:
+            return
+        with self._condition:
+            if self._is_closed:
+                return
+            self._chunk_list.append(chunk)
+            self._condition.notify_all()
+            self._wake_async_waiters()
+
+    def close(self):
+        """Mark the end of the stream. Calling it more than once is allowed."""
+        with self._condition:
+            self._is_closed = True
+            self._condition.notify_all()
+            self._wake_async_waiters()
+
+    def put(self, item, block=True, timeout=None):
+        """The same as queue.Queue.put. None or STREAM_END_FLAG closes the stream."""
+        if item is None or item == STREAM_END_FLAG:
+            self.close()
+        else:
+            self.write(item)
+
+    def get(self, block=True, timeout=None) -> str:
+        """The same as queue.Queue.get for the single consumer. Returns STREAM_END_FLAG at the end of the stream.
+        Raise:
+            queue.Empty: If no chunk is available in time.
+        """
+        if self._default_reader is None:
+            self._default_reader = self.reader()
+        chunk = self._default_reader.read(timeout=timeout if block else 0)
+        if chunk is None:
+            return STREAM_END_FLAG
+        if chunk == "":
+            raise queue.Empty
+        return chunk
+
+    def reader(self, position: int = 0) -> "StreamReader":
+        """Return a new reader starting from the chunk at the position (0 is the beginning of the stream)."""
+        return StreamReader(self, position)
+
+    def get_value(self) -> str:
+        """Return the text written so far."""
+        with self._condition:
+            return "".join(self._chunk_list)
+
+    def _read(self, position: int, timeout: Optional[float]):
+        """Wait for the chunks after the position. Returns (chunk list, is_closed)."""
+        with self._condition:
+            if position >= len(self._chunk_list) and not self._is_closed:
+                if timeout is None:
+                    while position >= len(self._chunk_list) and not self._is_closed:
+                        self._condition.wait()
+                else:
+                    end_time = time.monotonic() + timeout
+                    while position >= len(self._chunk_list) and not self._is_closed:
+                        remaining = end_time - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+            return self._chunk_list[position:], self._is_closed
+
+    def _wake_async_waiters(self):
+        """Wake up the coroutines waiting for the chunks. Called with the condition held."""
+        for loop, future in self._async_waiter_list:
+            try:
+                loop.call_soon_threadsafe(_set_future_done, future)
+            except RuntimeError:
+                # The event loop of the waiter is closed.
+                pass
+        self._async_waiter_list = []
+
+    def _read_or_wait(self, position: int, loop):
+        """Return (chunk list, is_closed, None) if there are chunks after the position or the stream is closed,
+        otherwise ([], False, the future which is done when the buffer changes)."""
+        with self._condition:
+            if position < len(self._chunk_list) or self._is_closed:
+                return self._chunk_list[position:], self._is_closed, None
+            future = loop.create_future()
+            self._async_waiter_list.append((loop, future))
+            return [], False, future
+
+
+def _set_future_done(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class StreamReader:
+    """The cursor of one consumer of the stream buffer."""
+
+    def __init__(self, stream_buffer: StreamBuffer, position: int = 0):
+        self.stream_buffer = stream_buffer
+        self.position = position
+
+    def read(self, timeout: Optional[float] = None) -> Optional[str]:
+        """Return the text appended since the last read.
+        Returns:
+            str: The new text, or "" if nothing is appended in time.
+            None: The stream is closed and all the text has been read.
+        """
+        chunk_list, is_closed = self.stream_buffer._read(self.position, timeout)
+        if not chunk_list:
+            return None if is_closed else ""
+        self.position += len(chunk_list)
+        return "".join(chunk_list)
+
+    async def aread(self) -> Optional[str]:
+        """The coroutine version of read without the timeout, it waits for the text without blocking the event loop.
+        Returns:
+            str: The new text.
+            None: The stream is closed and all the text has been read.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            chunk_list, is_closed, future = self.stream_buffer._read_or_wait(self.position, loop)
+            if future is None:
+                break
+            await future
+        if not chunk_list:
+            return None
+        self.position += len(chunk_list)
+        return "".join(chunk_list)
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            text = self.read()
+            if text is None:
+                break
+            yield text
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        while (text := await self.aread()) is not None:
+            yield text
+
+
+def iter_stream(stream_queue, timeout: float = 1) -> Iterator[str]:
+    """Iterate the text of the stream message until the end of the stream.
+    The stream_queue can be a StreamBuffer (read with a new reader) or a queue.Queue (the legacy producer).
+    """
+    if isinstance(stream_queue, StreamBuffer):
+        yield from stream_queue.reader()
+        return
+    while True:
+        try:
+            message_block = stream_queue.get(timeout=timeout)
+        except queue.Empty:
+            continue
+        if message_block == None or message_block == STREAM_END_FLAG:
+            break
+        yield message_block
@@ -0,0 +1,132 @@
+"""
+Author: Huang Weitao
+Date: 2026-10-18 19:32:48
+LastEditors: Huang Weitao
+LastEditTime: 2026-10-18 19:32:48
+Description: The chunk level stream function and the incremental tag tokenizer of the LLM stream.
+
+The legacy stream function is called once per character with the accumulated text, and returns the text to keep. The
+chunk level stream function (marked by chunk_stream_function) is called once per chunk of the LLM stream with the new
+text only, and once with STREAM_END_FLAG at the end. The LLM accepts both, the legacy one is wrapped by
+LegacyStreamAdapter.
+
+StreamTagTokenizer splits the stream into the text and the tags (e.g. <file_name>, <code>, <content>,
+<chapter level="1">) with one precompiled pattern. The tail which may be the beginning of a tag is kept until the next
+chunk, so the tag split between two chunks is still found, and every character is scanned a constant number of times.
+"""
+import functools
+import inspect
+import re
+from typing import List, NamedTuple, Optional, Union
+
+from wiseagent.common.protocol_message import STREAM_END_FLAG
+
+
+def chunk_stream_function(function):
+    """Mark the function as a chunk level stream function. The return value of the function is ignored.
+    Example:
+        @chunk_stream_function
+        def handle_stream(self, chunk: str):
+            if chunk == STREAM_END_FLAG:
+                ...
+    """
+    function.chunk_stream = True
+    return function
+
+
+def is_chunk_stream_function(function) -> bool:
+    while isinstance(function, functools.partial):
+        function = function.func
+    return getattr(function, "chunk_stream", False)
+
+
+class LegacyStreamAdapter:
+    """Call the legacy stream function once per character of the chunk with the accumulated text."""
+
+    def __init__(self, function):
+        self.function = function
+        self.stream_message = ""
+        self.is_async = inspect.iscoroutinefunction(function)
+
+    def __call__(self, chunk: str):
+        if self.is_async:
+            return self._acall(chunk)
+        if chunk == STREAM_END_FLAG:
+            return self.function(STREAM_END_FLAG)
+        for ch in chunk:
+            self.stream_message = self.function(self.stream_message + ch)
+
+    async def _acall(self, chunk: str):
+        if chunk == STREAM_END_FLAG:
+            return await self.function(STREAM_END_FLAG)
+        for ch in chunk:
+            self.stream_message = await self.function(self.stream_message + ch)
+
+
+def to_chunk_stream_function(function):
+    """Return the chunk level stream function of the function, None if the function is None."""
+    if function is None or is_chunk_stream_function(function):
+        return function
+    return LegacyStreamAdapter(function)
+
+
+class StreamToken(NamedTuple):
+    # The tag (the string or the pattern given to the tokenizer), None if the token is text.
+    tag: Optional[str]
+    text: str
+    # The match of the tag pattern, used to read the groups, e.g. the level of <chapter level="1">.
+    match: Optional[re.Match] = None
+
+
+class StreamTagTokenizer:
+    """Split the stream into the text and the tags. The tag starts with "<" and ends with ">".
+    Example:
+        tokenizer = StreamTagTokenizer("<code>", "</code>", re.compile(r'<chapter level="(\\d+)">'))
+        for token in tokenizer.feed(chunk):
+            if token.tag == "<code>":
+                ...
+        remaining_token_list = tokenizer.flush()
+    """
+
+    def __init__(self, *tags: Union[str, re.Pattern], max_tag_length: int = 64):
+        """
+        Args:
+            tags: The tag string or the compiled pattern of the tag.
+            max_tag_length: The tail longer than it is not kept as a partial tag.
+        """
+        self.tag_list = []
+        self.pattern_list = []
+        for tag in tags:
+            pattern = tag if isinstance(tag, re.Pattern) else re.compile(re.escape(tag))
+            self.tag_list.append(tag.pattern if isinstance(tag, re.Pattern) else tag)
+            self.pattern_list.append(pattern)
+        self.pattern = re.compile("|".join(f"(?P<tag{i}>{p.pattern})" for i, p in enumerate(self.pattern_list)))
+        self.max_tag_length = max_tag_length
+        self.pending = ""
+
+    def feed(self, chunk: str) -> List[StreamToken]:
+        buffer = self.pending + chunk
+        token_list = []
+        position = 0
+        for match in self.pattern.finditer(buffer):
+            if match.start() > position:
+                token_list.append(StreamToken(None, buffer[position : match.start()]))
+            index = int(match.lastgroup[3:])
+            tag_text = match.group(match.lastgroup)
+            token_list.append(StreamToken(self.tag_list[index], tag_text, self.pattern_list[index].fullmatch(tag_text)))
+            position = match.end()
+        # Keep the tail which may be the beginning of a tag.
+        end = len(buffer)
+        tail_start = buffer.rfind("<", position)
+        if tail_start != -1 and ">" not in buffer[tail_start:] and end - tail_start < self.max_tag_length:
+            end = tail_start
+        if end > position:
+            token_list.append(StreamToken(None, buffer[position:end]))
+        self.pending = buffer[end:]
+        return token_list
+
+    def flush(self) -> List[StreamToken]:
+        """Return the kept tail as text at the end of the stream."""
+        token_list = [StreamToken(None, self.pending)] if self.pending else []
+        self.pending = ""
+        return token_list
@@ -6,7 +6,10 @@ LastEditTime: 2024-09-21 01:58:56
 Description: Agent core data, contain all the necessary data for agent. Include the agent's property, action_list, report_config, etc.
 """
 
+import asyncio
+import os
 import threading
+import time
 from contextvars import ContextVar
 from pathlib import Path
 from typing import Any, Dict, List, Union
@@ -96,11 +99,22 @@ class Agent(BaseModel, YamlConfig):
     _is_alive: bool = False  # If is alive, the agent thread keep
     _is_activate: bool = False  # If is sleep, the agent will not act untill wake up
     wake_up_event: Any = None  # The event to wake up the agent
+    # Debounce the observation. When the agent is woken up by a message, it will wait until no new message arrives
+    # within wake_up_debounce_window seconds (at most wake_up_max_delay seconds) before planning, so a burst of
+    # messages is handled by one plan. 0 means plan immediately.
+    wake_up_debounce_window: float = 0
+    wake_up_max_delay: float = 1
+    _last_observe_time: float = 0
+    # The asyncio version of wake_up_event, only used when the agent live in the async life runtime.
+    _async_wake_up_event: Any = None
+    _event_loop: Any = None
 
     # Memory
     short_term_memory: List = []
     short_term_memory_lock: Any = None
     new_observe_message_number: int = 0
+    # The cached system prompt and converted messages, see prompt_assembler.py.
+    prompt_assembler: Any = None
 
     @classmethod
     def from_default(
@@ -150,8 +164,9 @@ class Agent(BaseModel, YamlConfig):
         agent_instructions=None,
         agent_example=None,
     ):
-        """Set and Return the system prompt for the agent."""
-        return self.agent_system_prompt_template.format(
+        """Set and Return the system prompt for the agent. The prompt is rendered again only if its inputs change."""
+        return self.get_prompt_assembler().get_system_prompt(
+            self.agent_system_prompt_template,
             agent_name=name or self.name,
             agent_description=description or self.description,
             current_environment=current_environment or self.current_environment,
@@ -187,6 +202,25 @@ class Agent(BaseModel, YamlConfig):
         self.wake_up_event.wait()
         self.wake_up_event.clear()
 
+    def bind_event_loop(self, loop):
+        """Bind the agent to the event loop of the async life runtime, so it can be woken up in the loop."""
+        self._event_loop = loop
+        self._async_wake_up_event = asyncio.Event()
+
+    async def async_wait_for_new_message(self):
+        """
+        Wait for a new message from the environment without blocking the event loop.
+        """
+        await self._async_wake_up_event.wait()
+        self._async_wake_up_event.clear()
+        self.wake_up_event.clear()
+
+    def _set_wake_up_event(self):
+        if not self.wake_up_event.is_set():
+            self.wake_up_event.set()
+        if self._async_wake_up_event is not None:
+            self._event_loop.call_soon_threadsafe(self._async_wake_up_event.set)
+
     def register_life_scheduler(self, life_scheduler):
         """
         Register a life schedule to the agent.
@@ -232,8 +266,9 @@ class Agent(BaseModel, YamlConfig):
                 logger.info(f"Receive message from {message.send_from}")
                 self.short_term_memory.append(message)
                 if from_env:
-                    self.wake_up()
                     self.new_observe_message_number += 1
+                    self._last_observe_time = time.monotonic()
+                    self.wake_up()
         except Exception as e:
             logger.error(f"Error adding message to memory: {e}")
 
@@ -242,6 +277,53 @@ class Agent(BaseModel, YamlConfig):
             return self.short_term_memory
         return self.short_term_memory[-min(last_k, len(self.short_term_memory)) :]
 
+    def get_context_memory(self, system_prompt: str = "", prompt: str = "", extra_memory: List[Message] = None):
+        """Return the latest memory which fits in the context window of the LLM of the agent with the system prompt
+        and the prompt. The extra_memory (e.g. the responses of the previous steps of the action) is fitted after the
+        short term memory. See context_builder.py."""
+        from wiseagent.core.llm.context_builder import get_context_builder
+
+        model_name = self.llm_config.get("model_name") or os.environ.get("LLM_MODEL_NAME")
+        memory = list(self.short_term_memory) + list(extra_memory or [])
+        return get_context_builder().build(memory, model_name, system_prompt or "", prompt or "")
+
+    def get_context_messages(self, system_prompt: str = "", prompt: str = ""):
+        """Return the context memory converted to the dicts of the API request. Only the messages added since the
+        last call are fitted and converted, see prompt_assembler.py."""
+        model_name = self.llm_config.get("model_name") or os.environ.get("LLM_MODEL_NAME")
+        return self.get_prompt_assembler().build_context(self.short_term_memory, model_name, system_prompt, prompt)
+
+    def get_prompt_assembler(self):
+        if self.prompt_assembler is None:
+            from wiseagent.core.llm.prompt_assembler import PromptAssembler
+
+            self.prompt_assembler = PromptAssembler()
+        return self.prompt_assembler
+
+    def wait_for_debounce(self):
+        """Wait until no new message arrives within the debounce window, or the max delay is reached."""
+        if self.wake_up_debounce_window <= 0:
+            return
+        deadline = time.monotonic() + self.wake_up_max_delay
+        while True:
+            now = time.monotonic()
+            remaining = min(self._last_observe_time + self.wake_up_debounce_window, deadline) - now
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    async def async_wait_for_debounce(self):
+        """The same as wait_for_debounce, but sleep in the event loop."""
+        if self.wake_up_debounce_window <= 0:
+            return
+        deadline = time.monotonic() + self.wake_up_max_delay
+        while True:
+            now = time.monotonic()
+            remaining = min(self._last_observe_time + self.wake_up_debounce_window, deadline) - now
+            if remaining <= 0:
+                return
+            await asyncio.sleep(remaining)
+
     def set_short_term_memory(self, memory: List[Message]):
         with self.short_term_memory:
             self.short_term_memory = memory
@@ -296,14 +378,19 @@ class Agent(BaseModel, YamlConfig):
         self._is_activate = value
 
     def sleep(self):
-        SleepMessage(send_from=self.name).send_message()
-        self._is_activate = False
+        # Hold the memory lock, so that the wake up from add_memory is not lost between the state change.
+        with self.short_term_memory_lock:
+            if self._is_activate:
+                SleepMessage.fast(send_from=self.name).send_message()
+            self._is_activate = False
 
     def wake_up(self):
-        WakeupMessage(send_from=self.name).send_message()
-        if not self.wake_up_event.is_set():
-            self.wake_up_event.set()
+        """Wake up the agent. The WakeupMessage is only sent when the agent is sleeping, so a burst of messages
+        to an active agent will be coalesced into one wake up."""
+        if not self._is_activate:
+            WakeupMessage.fast(send_from=self.name).send_message()
         self._is_activate = True
+        self._set_wake_up_event()
 
     def __enter__(self):
         global CURRENT_AGENT_DATA
@@ -324,7 +411,7 @@ class Agent(BaseModel, YamlConfig):
     def close(self):
         self._is_alive = False
         # Wake up to exit the life thread.
-        self.wake_up_event.set()
+        self._set_wake_up_event()
         # Remove From agent_core
         from wiseagent.core.agent_core import get_agent_core
 
@@ -27,6 +27,10 @@ class AgentCore(BaseModel):
     # The interface to receive the message from the outside world
     receiver: Any = Field(default=None)
     monitor: Any = Field(default=None)
+    # Start the agents in worker processes when shard_number is set in the global config.
+    shard_manager: Any = Field(default=None)
+    # The node of the distributed agent society when node_id is set in the global config.
+    node: Any = Field(default=None)
 
     # The agent list in current system
     agent_manager: List[Any] = []
@@ -70,14 +74,22 @@ class AgentCore(BaseModel):
         if self._have_been_init:
             return
         global_config = global_config or self.global_config
+        self._init_blob_store(global_config)
         self._init_receiver(global_config)
         self._init_monitor(global_config)
         self._init_life_manager(global_config)
         self._init_action_manager(global_config)
         self._init_llm_manager(global_config)
+        self._init_shard_manager(global_config)
+        self._init_node(global_config)
         self._preparetion()
         self._have_been_init = True
 
+    def _init_blob_store(self, global_config):
+        from wiseagent.common.blob_store import get_blob_store
+
+        get_blob_store().configure(max_size=global_config.blob_store_max_size, ttl=global_config.blob_store_ttl)
+
     def _init_receiver(self, global_config):
         from wiseagent.core.base_receiver import BaseReceiver
 
@@ -107,6 +119,24 @@ class AgentCore(BaseModel):
 
         self.llm_manager = LLMManager(global_config)
 
+    def _init_shard_manager(self, global_config):
+        if not global_config.shard_number:
+            return
+        from wiseagent.core.agent_shard import AgentShardManager
+
+        self.shard_manager = AgentShardManager(global_config)
+        self._prepare_function_list.append(self.shard_manager.start)
+        self._close_function_list.append(self.shard_manager.close)
+
+    def _init_node(self, global_config):
+        if not global_config.node_id:
+            return
+        from wiseagent.core.transport import AgentNode
+
+        self.node = AgentNode.from_global_config(global_config)
+        self._prepare_function_list.append(self.node.start)
+        self._close_function_list.append(self.node.close)
+
     def register(self, obj):
         """
         Register Action, LLM, Monitor to the agent system
@@ -167,6 +197,12 @@ class AgentCore(BaseModel):
         # Add the agent to the agent list
         if agent_data not in self.agent_manager:
             self.agent_manager.append(agent_data)
+        # Add the agent to the routing table of the receiver
+        if self.receiver is not None:
+            self.receiver.add_route(agent_data)
+        # Let the other nodes know the new agent
+        if self.node is not None:
+            self.node.announce()
         return agent_data
 
     def start_agent_life(self, agent_data, new_thread=True):
@@ -175,6 +211,19 @@ class AgentCore(BaseModel):
         self.life_manager.life(agent_data, new_thread)
         logger.info(f"{agent_data.name}'s life start.")
 
+    def start_agent_in_shard(self, agent_config):
+        """Start the agent in a worker process. Only available when shard_number is set in the global config.
+        Args:
+            agent_config (Union[str, dict]): The yaml string or the dict of the agent.
+        """
+        if self.shard_manager is None:
+            raise Exception("Shard manager is not init, please set shard_number in the global config")
+        proxy = self.shard_manager.add_agent(agent_config)
+        if self.node is not None:
+            self.node.announce()
+        logger.info(f"{proxy.name}'s life start in shard {proxy.shard_index}.")
+        return proxy
+
     def get_action(self, action_name: str = None):
         return self.action_manager.get_action(action_name)
 
@@ -196,7 +245,11 @@ class AgentCore(BaseModel):
         self.monitor.add_message(message)
 
     def remove_agent(self, agent_name):
-        self.agent_list = [agent_data for agent_data in self.agent_list if agent_data.name != agent_name]
+        self.agent_manager = [agent_data for agent_data in self.agent_manager if agent_data.name != agent_name]
+        if self.receiver is not None:
+            self.receiver.remove_route(agent_name)
+        if self.node is not None:
+            self.node.announce()
 
 
 def get_agent_core():
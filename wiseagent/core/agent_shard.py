@@ -0,0 +1,240 @@
+"""
+Author: Huang Weitao
+Date: 2026-10-18 16:20:45
+LastEditors: Huang Weitao
+LastEditTime: 2026-10-18 16:20:45
+Description: Shard the agents across worker processes, so the CPU bound work of different agents is not serialized
+by the GIL.
+
+The main process keeps the receiver, the monitor and the environment. Every agent in a worker process is
+represented by a ShardAgentProxy in the routing table of the main receiver, so the routing (including the broadcast
+of send_to == "all") is the same as the single process mode. The worker forwards all the messages reported by its
+agents to the main monitor through the IPC bus (multiprocessing queues). The stream message is forwarded chunk by
+chunk and rebuilt in the main process.
+
+NOTE: The worker processes are started with "spawn", so the script that start the shards must be guarded by
+if __name__ == "__main__".
+"""
+import multiprocessing
+import queue
+import threading
+from typing import Any, Dict, List, Union
+
+import yaml
+from pydantic import BaseModel
+
+from wiseagent.common.global_config import GlobalConfig
+from wiseagent.common.logs import logger
+from wiseagent.common.protocol_message import Message
+from wiseagent.common.stream_buffer import StreamBuffer, iter_stream
+from wiseagent.core.reporter.base_reporter import BaseReporter
+
+
+class ShardFrame:
+    """The frame type on the IPC bus."""
+
+    # Main -> Worker
+    ADD_AGENT = "add_agent"
+    DELIVER = "deliver"
+    CLOSE = "close"
+    # Worker -> Main
+    REPORT = "report"
+    STREAM_START = "stream_start"
+    STREAM_CHUNK = "stream_chunk"
+    STREAM_END = "stream_end"
+    AGENT_STARTED = "agent_started"
+    ERROR = "error"
+
+
+def to_ipc_message(message: Message) -> Message:
+    """Return a copy of the message which can be pickled. The stream queue can not be sent to another process."""
+    return message.model_copy(update={"stream_queue": None})
+
+
+class ShardAgentProxy(BaseModel):
+    """The agent living in a worker process. It is registered in the routing table of the main receiver."""
+
+    name: str
+    shard_index: int
+    is_activate: bool = False
+    shard_manager: Any = None
+
+    def add_memory(self, message: Message, from_env=False):
+        self.shard_manager.deliver(self.shard_index, self.name, message)
+
+
+class ShardReporter(BaseReporter):
+    """The reporter in the worker process, forward all the messages to the main process."""
+
+    name: str = "ShardReporter"
+    shard_index: int = 0
+    outbound_queue: Any = None
+
+    def handle_message(self, report_message: Message) -> bool:
+        self.outbound_queue.put((ShardFrame.REPORT, self.shard_index, to_ipc_message(report_message)))
+        return True
+
+    def handle_stream_message(self, report_message: Message) -> bool:
+        message_id = report_message.message_id
+        self.outbound_queue.put((ShardFrame.STREAM_START, self.shard_index, to_ipc_message(report_message)))
+        # The reader returns all the text appended since the last read, so one frame carries many characters.
+        for message_block in iter_stream(report_message.stream_queue):
+            self.outbound_queue.put((ShardFrame.STREAM_CHUNK, self.shard_index, (message_id, message_block)))
+        self.outbound_queue.put((ShardFrame.STREAM_END, self.shard_index, message_id))
+        return True
+
+
+def _load_agent(agent_config: Union[str, dict]):
+    from wiseagent.core.agent import Agent
+
+    if isinstance(agent_config, str):
+        return Agent.from_yaml_string(agent_config)
+    return Agent(**agent_config)
+
+
+def _shard_main(shard_index: int, global_config: dict, inbound_queue, outbound_queue):
+    """The main function of the worker process."""
+    from wiseagent.core.agent_core import AgentCore
+
+    # The reporters are in the main process, the worker only forward the messages.
+    global_config = dict(global_config, reporter_module_path=[])
+    global_config.pop("shard_number", None)
+    # The worker is part of the node of the main process, it does not start its own node.
+    global_config.pop("node_id", None)
+    agent_core = AgentCore(global_config=GlobalConfig(**global_config))
+    agent_core.init()
+    agent_core.get_monitor().register(ShardReporter(shard_index=shard_index, outbound_queue=outbound_queue))
+    receiver = agent_core.get_receiver()
+
+    while agent_core.is_running:
+        frame_type, payload = inbound_queue.get()
+        try:
+            if frame_type == ShardFrame.ADD_AGENT:
+                agent_data = _load_agent(payload)
+                agent_data.life()
+                outbound_queue.put((ShardFrame.AGENT_STARTED, shard_index, agent_data.name))
+            elif frame_type == ShardFrame.DELIVER:
+                agent_name, message = payload
+                agent_data = receiver.get_route(agent_name)
+                if agent_data is None:
+                    raise Exception(f"Agent {agent_name} is not in shard {shard_index}")
+                agent_data.add_memory(message, from_env=True)
+            elif frame_type == ShardFrame.CLOSE:
+                for agent_data in list(agent_core.agent_manager):
+                    agent_data.close()
+                agent_core.close()
+        except Exception as e:
+            outbound_queue.put((ShardFrame.ERROR, shard_index, str(e)))
+
+
+class AgentShardManager(BaseModel):
+    """Start the worker processes and move the messages between the main process and the workers."""
+
+    shard_number: int = 1
+    global_config: Any = None
+    process_list: List[Any] = []
+    inbound_queue_list: List[Any] = []
+    outbound_queue: Any = None
+    bus_thread: Any = None
+    # The agent name (lower case) to the shard index.
+    agent_shard_map: Dict[str, int] = {}
+    # The stream message rebuilt in the main process, map the message id to the local stream buffer.
+    stream_queue_map: Dict[str, Any] = {}
+    _is_running: bool = False
+
+    def __init__(self, global_config: GlobalConfig, shard_number: int = None):
+        super().__init__()
+        self.global_config = global_config
+        self.shard_number = shard_number or global_config.shard_number or multiprocessing.cpu_count()
+
+    def start(self):
+        if self._is_running:
+            return
+        context = multiprocessing.get_context("spawn")
+        self.outbound_queue = context.Queue()
+        global_config = self.global_config.model_dump(exclude_none=True, exclude={"env_yaml_path"})
+        for shard_index in range(self.shard_number):
+            inbound_queue = context.Queue()
+            process = context.Process(
+                target=_shard_main,
+                args=(shard_index, global_config, inbound_queue, self.outbound_queue),
+                name=f"AgentShard-{shard_index}",
+            )
+            process.daemon = True
+            process.start()
+            self.inbound_queue_list.append(inbound_queue)
+            self.process_list.append(process)
+        self._is_running = True
+        self.bus_thread = threading.Thread(target=self._bus, name="AgentShardBus")
+        self.bus_thread.daemon = True
+        self.bus_thread.start()
+        logger.info(f"Start {self.shard_number} agent shard process")
+
+    def add_agent(self, agent_config: Union[str, dict], shard_index: int = None) -> ShardAgentProxy:
+        """Start the agent in a worker process. The agent is put into the shard with the fewest agents by default.
+        Args:
+            agent_config (Union[str, dict]): The yaml string or the dict of the agent.
+            shard_index (int, optional): The shard to put the agent in.
+        """
+        from wiseagent.core.agent_core import get_agent_core
+
+        config = yaml.safe_load(agent_config) if isinstance(agent_config, str) else agent_config
+        name = config["name"].lower()
+        if name in self.agent_shard_map:
+            raise Exception("Agent name is already exist. DO NOT use the same name for different agent")
+        if shard_index is None:
+            load = [0] * self.shard_number
+            for index in self.agent_shard_map.values():
+                load[index] += 1
+            shard_index = load.index(min(load))
+        self.agent_shard_map[name] = shard_index
+        self.inbound_queue_list[shard_index].put((ShardFrame.ADD_AGENT, agent_config))
+        proxy = ShardAgentProxy(name=config["name"], shard_index=shard_index, shard_manager=self)
+        get_agent_core().get_receiver().add_route(proxy)
+        return proxy
+
+    def deliver(self, shard_index: int, agent_name: str, message: Message):
+        """Deliver the message to the agent in the worker process."""
+        self.inbound_queue_list[shard_index].put((ShardFrame.DELIVER, (agent_name, to_ipc_message(message))))
+
+    def _bus(self):
+        """Receive the frames from the workers and report them to the main monitor."""
+        from wiseagent.core.agent_core import get_agent_core
+
+        monitor = get_agent_core().get_monitor()
+        while self._is_running:
+            try:
+                frame_type, shard_index, payload = self.outbound_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            if frame_type == ShardFrame.REPORT:
+                monitor.add_message(payload)
+            elif frame_type == ShardFrame.STREAM_START:
+                payload.stream_queue = StreamBuffer()
+                self.stream_queue_map[payload.message_id] = payload.stream_queue
+                monitor.add_message(payload)
+            elif frame_type == ShardFrame.STREAM_CHUNK:
+                message_id, message_block = payload
+                if message_id in self.stream_queue_map:
+                    self.stream_queue_map[message_id].write(message_block)
+            elif frame_type == ShardFrame.STREAM_END:
+                stream_queue = self.stream_queue_map.pop(payload, None)
+                if stream_queue is not None:
+                    stream_queue.close()
+            elif frame_type == ShardFrame.AGENT_STARTED:
+                logger.info(f"{payload}'s life start in shard {shard_index}.")
+            elif frame_type == ShardFrame.ERROR:
+                logger.error(f"Agent shard {shard_index}: {payload}")
+
+    def close(self, timeout: float = 5):
+        if not self._is_running:
+            return
+        for inbound_queue in self.inbound_queue_list:
+            inbound_queue.put((ShardFrame.CLOSE, None))
+        for process in self.process_list:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._is_running = False
@@ -0,0 +1,97 @@
+"""
+Author: Huang Weitao
+Date: 2026-10-18 16:05:12
+LastEditors: Huang Weitao
+LastEditTime: 2026-10-18 16:05:12
+Description: The asyncio runtime of the agent life. It is an alternative to the thread-per-agent LifeManager.
+All the agent lives run as coroutines on one event loop, the blocking plan and action are offloaded to a bounded
+executor. So the idle agent only costs a suspended coroutine instead of an OS thread.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+
+from pydantic import BaseModel
+
+from wiseagent.common.logs import logger
+from wiseagent.common.singleton import singleton
+
+
+@singleton
+class AsyncLifeRuntime(BaseModel):
+    """Run the agent lives on one event loop in a dedicated thread."""
+
+    # The max number of the threads that run the blocking plan and action at the same time.
+    max_workers: int = 32
+    loop: Any = None
+    loop_thread: Any = None
+    executor: Any = None
+    # A map to store the life task of the agent, preventing multiple life tasks for the same agent.
+    agent_task_map: Dict[str, Any] = {}
+
+    def __init__(self, max_workers: int = None):
+        super().__init__()
+        self.max_workers = max_workers or self.max_workers
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="AgentLifeExecutor")
+
+    def start(self):
+        """Start the event loop thread if it is not running."""
+        if self.loop_thread is not None and self.loop_thread.is_alive():
+            return
+        self.loop = asyncio.new_event_loop()
+        loop_ready = threading.Event()
+
+        def run_loop():
+            asyncio.set_event_loop(self.loop)
+            self.loop.call_soon(loop_ready.set)
+            self.loop.run_forever()
+
+        self.loop_thread = threading.Thread(target=run_loop, name="AgentLifeLoop")
+        self.loop_thread.daemon = True
+        self.loop_thread.start()
+        loop_ready.wait()
+
+    def submit(self, coroutine):
+        """Run the coroutine on the event loop from any thread. Returns a concurrent.futures.Future."""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    async def run_blocking(self, function, *args, **kwargs):
+        """Run the blocking function in the executor. The context (e.g. the current agent data) is copied."""
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, functools.partial(context.run, function, *args, **kwargs)
+        )
+
+    def life(self, agent_data, life_scheduler):
+        """Start the life of the agent as a coroutine.
+
+        Raise:
+            Exception: If the agent has already started life task.
+        """
+        task = self.agent_task_map.get(agent_data.name, None)
+        if task is not None and not task.done():
+            raise Exception(f"Agent {agent_data.name} has already started life task")
+        self.start()
+        agent_data.bind_event_loop(self.loop)
+        self.agent_task_map[agent_data.name] = self.submit(self._life(agent_data, life_scheduler))
+
+    async def _life(self, agent_data, life_scheduler):
+        # with agent_data will set the current_agent_data in the context of this task.
+        with agent_data:
+            try:
+                await life_scheduler.alife()
+            except Exception as e:
+                logger.exception(f"The life of {agent_data.name} exit with exception: {e}")
+
+    def close(self):
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self.executor.shutdown(wait=False)
+
+
+def get_async_life_runtime(max_workers: int = None) -> AsyncLifeRuntime:
+    return AsyncLifeRuntime(max_workers=max_workers)
@@ -6,36 +6,44 @@ LastEditTime: 2024-09-20 22:39:58
 Description: The Monitor class is used to monitor the agent and report the status to the reporter.
 I hope this class can support streaming data and normal data.
 
-This will be single thread to monitor the agent and report the status to the reporter.
-# TODO: switch to multi-thread
-# NOTE: In current version, the monitor will not report more than one message in one time.
+The monitor thread takes the message from the cache and put it into the inbox of every reporter. Each reporter
+has its own ReporterWorker thread, so a slow reporter or a long stream will not block the others.
 """
 
 import importlib
-import queue
 import threading
 import time
-from typing import Any, List
+from typing import Any, Dict, List
 
 from pydantic import BaseModel
 
 from wiseagent.common.global_config import GlobalConfig
 from wiseagent.common.logs import logger
+from wiseagent.common.message_queue import PriorityMessageQueue
 from wiseagent.common.protocol_message import Message
 from wiseagent.common.singleton import singleton
 from wiseagent.core.agent_core import AgentCore, get_agent_core
 from wiseagent.core.reporter.base_reporter import BaseReporter
+from wiseagent.core.reporter.reporter_worker import ReporterWorker
 
 
 @singleton
 class BaseMonitor(BaseModel):
     reporter_list: List[BaseReporter] = []
-    # The stream_queue_list is used to store the stream data
-    reporter_cache: Any = queue.Queue()
+    # The message waiting to be dispatched. Control messages are drained before the bulk messages.
+    reporter_cache: Any = None
     report_thread: Any = None
+    # The dispatch worker of each reporter, in the same order as reporter_list.
+    reporter_worker_list: List[ReporterWorker] = []
+    reporter_lock: Any = None
+    # Dispatch index, map (env_handle_type, send_from) to the workers whose reporter subscribe the message.
+    # It is built lazily and cleared when the reporter is registered or unregistered.
+    dispatch_index: Dict[Any, List[ReporterWorker]] = {}
 
     def __init__(self, global_config: GlobalConfig):
         super().__init__()
+        self.reporter_cache = PriorityMessageQueue(global_config.message_lane_weight)
+        self.reporter_lock = threading.Lock()
         # init the reporter model use global config
         start = time.time()
         self.init_reporter(global_config)
@@ -50,23 +58,35 @@ class BaseMonitor(BaseModel):
             if not hasattr(import_module, "get_reporter") or not callable(getattr(import_module, "get_reporter")):
                 raise Exception(f"Reporter Module {reporter_module_path} does not have a get_reporter method")
             reporter = import_module.get_reporter()
-            if reporter not in self.reporter_list:
-                self.reporter_list.append(reporter)
+            self.register(reporter)
 
     def register(self, reporter: BaseReporter):
         """Register a reporter to the monitor.
         NOTE : The EnvReceiver is a Reporter of the agent system.
         Args:
             reporter (BaseReporter): The reporter to register."""
-        if reporter not in self.reporter_list:
+        with self.reporter_lock:
+            if any(reporter is registered for registered in self.reporter_list):
+                return
+            worker = ReporterWorker(reporter)
             self.reporter_list.append(reporter)
+            self.reporter_worker_list.append(worker)
+            self.dispatch_index = {}
+        if self.report_thread is not None and self.report_thread.is_alive():
+            worker.start()
 
     def unregister(self, reporter: BaseReporter):
         """Remove a reporter from the monitor.
         Args:
             reporter (BaseReporter): The reporter to remove."""
-        if reporter in self.reporter_list:
-            self.reporter_list.remove(reporter)
+        with self.reporter_lock:
+            index = next((i for i, registered in enumerate(self.reporter_list) if registered is reporter), None)
+            if index is None:
+                return
+            self.reporter_list.pop(index)
+            worker = self.reporter_worker_list.pop(index)
+            self.dispatch_index = {}
+        worker.close()
 
     def add_message(self, msg: Message):
         if not isinstance(msg, Message):
@@ -85,22 +105,34 @@ class BaseMonitor(BaseModel):
 
     def handle_report(self, message: Message):
         """Report the message to reporter(Which is the receiver of the environment)
-        One message can only be reported to one reporter.
-        # TODO: hope in the future, one message can be reported to multiple reporter. But this must consider the stream message
+        The message is put into the inbox of the reporter worker which subscribe it, and the worker call the reporter
+        in its own thread.
         Args:
             message (Message): The message to be reported.
         """
-        is_solved = False
-        for reporter in self.reporter_list:
-            if message.is_stream:
-                is_solved = reporter.handle_stream_message(message)
-            else:
-                is_solved = reporter.handle_message(message)
+        for worker in self.get_subscribed_worker(message):
+            worker.put(message)
+
+    def get_subscribed_worker(self, message: Message) -> List[ReporterWorker]:
+        """Return the workers whose reporter subscribe the message."""
+        key = (message.env_handle_type, message.send_from)
+        worker_list = self.dispatch_index.get(key, None)
+        if worker_list is None:
+            with self.reporter_lock:
+                worker_list = [
+                    worker
+                    for worker in self.reporter_worker_list
+                    if worker.reporter.is_subscribed(message.env_handle_type, message.send_from)
+                ]
+                self.dispatch_index[key] = worker_list
+        return worker_list
 
     def run_report_thread(self) -> bool:
         # check if the thread is running
         if self.report_thread is not None and self.report_thread.is_alive():
             return True
+        for worker in list(self.reporter_worker_list):
+            worker.start()
         # create or continue a thread to receive message
         try:
             self.report_thread = self.report_thread or threading.Thread(target=self._report, args=(get_agent_core(),))
@@ -114,3 +146,5 @@ class BaseMonitor(BaseModel):
     def close(self):
         if self.report_thread is not None:
             self.report_thread.join()
+        for worker in list(self.reporter_worker_list):
+            worker.close()
@@ -7,30 +7,54 @@ Description:  Base class for receivers, responsible for handling and processing
 """
 import queue
 import threading
-from typing import Any
+import time
+from typing import Any, Dict, List
 
 from pydantic import BaseModel
 
 from wiseagent.common.global_config import GlobalConfig
 from wiseagent.common.logs import logger
+from wiseagent.common.message_queue import PriorityMessageQueue
 from wiseagent.common.protocol_message import Message
 from wiseagent.common.singleton import singleton
 from wiseagent.core.agent_core import AgentCore, get_agent_core
 
 
+class DeadLetter(BaseModel):
+    """The message which can not be delivered for now."""
+
+    message: Message
+    expire_time: float
+
+
 @singleton
 class BaseReceiver(BaseModel):
     """Base class for receivers."""
 
     # All the perceptron model. For difference agent, will use different perceptron model according to the Agent Data
     perceptron_list: list[Any] = []
-    # A message queue to cache incoming messages.
-    message_queue: Any = queue.Queue()
+    # A message queue to cache incoming messages. Control messages are drained before the bulk messages.
+    message_queue: Any = None
     # The thread that runs the receive loop.
     receive_thread: Any = None
 
+    # Routing table, map the lower case agent name to the agent, keep in sync by AgentCore.init_agent/remove_agent.
+    route_map: Dict[str, Any] = {}
+    route_lock: Any = None
+    # Dead letter store for the message whose receiver is unknown. Map the receiver name to the list of
+    # DeadLetter. The message will be redelivered when the receiver is registered, or dropped after the ttl.
+    dead_letter_map: Dict[str, List[DeadLetter]] = {}
+    dead_letter_ttl: float = 60
+    dead_letter_retry_interval: float = 1
+
     def __init__(self, global_config: GlobalConfig):
         super().__init__()
+        self.message_queue = PriorityMessageQueue(global_config.message_lane_weight)
+        self.route_lock = threading.Lock()
+        if global_config.dead_letter_ttl is not None:
+            self.dead_letter_ttl = global_config.dead_letter_ttl
+        if global_config.dead_letter_retry_interval is not None:
+            self.dead_letter_retry_interval = global_config.dead_letter_retry_interval
         self._init_perceptron(global_config)
 
     def _init_perceptron(self, global_config: GlobalConfig):
@@ -40,40 +64,101 @@ class BaseReceiver(BaseModel):
     def add_message(self, message: list[Message]):
         if not isinstance(message, list):
             message = [message]
+        # The message to an agent on another node is sent by the transport directly.
+        node = get_agent_core().node
         for m in message:
             if not isinstance(m, Message):
                 logger.info(f"Message {m} is not a Message. andd will be ignored")
                 continue
+            if node is not None and node.route(m):
+                continue
             # m.content = f"Message from <{m.send_from}> to <{m.send_to}>: {m.content}"
             self.message_queue.put(m)
 
+    def add_route(self, agent_data):
+        """Add the agent to the routing table, and redeliver the dead letters that belong to it."""
+        name = agent_data.name.lower()
+        with self.route_lock:
+            self.route_map[name] = agent_data
+            dead_letter_list = self.dead_letter_map.pop(name, [])
+        for dead_letter in dead_letter_list:
+            self.message_queue.put(dead_letter.message)
+
+    def remove_route(self, agent_name: str):
+        """Remove the agent from the routing table."""
+        with self.route_lock:
+            self.route_map.pop(agent_name.lower(), None)
+
+    def get_route(self, agent_name: str):
+        """Return the agent registered with the name, or None."""
+        return self.route_map.get(agent_name.lower(), None)
+
+    def _add_dead_letter(self, message: Message):
+        """Keep the message whose receiver is unknown until the receiver is registered or the ttl expires."""
+        with self.route_lock:
+            # The receiver may be registered after the lookup, so deliver it again.
+            if message.send_to in self.route_map:
+                self.message_queue.put(message)
+                return
+            self.dead_letter_map.setdefault(message.send_to, []).append(
+                DeadLetter(message=message, expire_time=time.time() + self.dead_letter_ttl)
+            )
+        logger.debug(f"Receiver {message.send_to} not found, message {message.message_id} is kept as dead letter")
+
+    def _retry_dead_letter(self):
+        """Redeliver the dead letters whose receiver has been registered and drop the expired ones."""
+        now = time.time()
+        redeliver_list = []
+        with self.route_lock:
+            for name in list(self.dead_letter_map.keys()):
+                dead_letter_list = self.dead_letter_map[name]
+                if name in self.route_map:
+                    redeliver_list.extend(dead_letter_list)
+                    del self.dead_letter_map[name]
+                    continue
+                alive_list = [dead_letter for dead_letter in dead_letter_list if dead_letter.expire_time > now]
+                if len(alive_list) != len(dead_letter_list):
+                    logger.warning(
+                        f"Drop {len(dead_letter_list) - len(alive_list)} message(s) to {name}, the receiver is not found."
+                    )
+                if alive_list:
+                    self.dead_letter_map[name] = alive_list
+                else:
+                    del self.dead_letter_map[name]
+        for dead_letter in redeliver_list:
+            self.message_queue.put(dead_letter.message)
+
     def _receive(self, agent_core: "AgentCore"):
         """Receive messages from the message queue and process them.
 
         Args:
             agent_core (AgentCore): The agent core object.
         """
+        next_retry_time = time.time() + self.dead_letter_retry_interval
         while agent_core.is_running:
-            # Get the message from the queue, if the queue is empty, the get() method will block until a message is available
+            # Get the message from the queue. The timeout is used to retry the dead letters periodically.
             message = None
             try:
-                message = self.message_queue.get()
+                message = self.message_queue.get(timeout=self.dead_letter_retry_interval)
             except queue.Empty:
+                pass
+            if self.dead_letter_map and time.time() >= next_retry_time:
+                self._retry_dead_letter()
+                next_retry_time = time.time() + self.dead_letter_retry_interval
+            if message is None:
                 continue
 
             # Determine the target agent(s) for the message.
             if message.send_to == "all":
-                for agent in agent_core.agent_manager:
-                    if agent.name.lower() != message.send_from:
+                for name, agent in list(self.route_map.items()):
+                    if name != message.send_from:
                         agent.add_memory(message, from_env=True)
             else:
-                receive_agent = next(
-                    (agent for agent in agent_core.agent_manager if message.send_to == agent.name.lower()), None
-                )
+                receive_agent = self.route_map.get(message.send_to, None)
                 if receive_agent:
                     receive_agent.add_memory(message, from_env=True)
                 else:
-                    self.message_queue.put(message)
+                    self._add_dead_letter(message)
 
     def run_receive_thread(self) -> bool:
         # Check if the thread is already running.
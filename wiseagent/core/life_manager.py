@@ -31,10 +31,16 @@ class LifeManager(BaseModel):
     agent_life_thread_map: dict = {}
     # A map to store different life schedulers, which are used to control the life cycle of agents.
     life_scheduler_map: Dict[str, Any] = {}
+    # "thread" start one thread per agent, "async" run the agent lives as coroutines on one event loop.
+    life_runtime: str = "thread"
+    # The max number of the threads that run the blocking plan and action in the async runtime.
+    async_executor_size: int = None
 
     def __init__(self, global_config: GlobalConfig):
         """Initialize the LifeManager and load all life schedulers from the configuration."""
         super().__init__()
+        self.life_runtime = global_config.life_runtime or self.life_runtime
+        self.async_executor_size = global_config.async_executor_size
         start = time.time()
         self._init_life_scheduler(global_config)
         end = time.time()
@@ -69,7 +75,12 @@ class LifeManager(BaseModel):
         """
         # Get the existing life thread for the agent, or create a new one.
         agent_data._is_alive = True
-        if new_thread:
+        if new_thread and self.life_runtime == "async":
+            from wiseagent.core.async_life_runtime import get_async_life_runtime
+
+            life_scheduler = self.life_scheduler_map[agent_data.life_schedule_config]
+            get_async_life_runtime(self.async_executor_size).life(agent_data, life_scheduler)
+        elif new_thread:
             thread = self.agent_life_thread_map.get(agent_data.name, None) or threading.Thread(
                 target=self._life, args=(agent_data,)
             )
@@ -28,29 +28,48 @@ class BaseLifeScheduler(BaseModel, ABC):
     def life(self):
         pass
 
+    async def alife(self):
+        """The life coroutine used by the async life runtime.
+        By default, the blocking life is run in the executor of the runtime, override it to release the thread when
+        the agent is waiting."""
+        from wiseagent.core.async_life_runtime import get_async_life_runtime
+
+        await get_async_life_runtime().run_blocking(self.life)
+
     def llm_ask(self, prompt, memory: List[Message] = None, system_prompt: str = None, handle_stream_function=None):
         """Ask the LLM to generate a response to the given prompt."""
+        llm, llm_kwargs = self._prepare_llm_ask(prompt, memory, system_prompt)
+        return llm.llm_ask(handle_stream_function=handle_stream_function, **llm_kwargs)
+
+    async def allm_ask(
+        self, prompt, memory: List[Message] = None, system_prompt: str = None, handle_stream_function=None
+    ):
+        """The coroutine version of llm_ask. The handle_stream_function can be a function or a coroutine function."""
+        llm, llm_kwargs = self._prepare_llm_ask(prompt, memory, system_prompt)
+        return await llm.allm_ask(handle_stream_function=handle_stream_function, **llm_kwargs)
+
+    def _prepare_llm_ask(self, prompt, memory: List[Message] = None, system_prompt: str = None):
+        """Return the LLM of the current agent and the arguments of llm_ask."""
         agent_data: Agent = get_current_agent_data()
         from wiseagent.core.agent_core import get_agent_core
 
         agent_core = get_agent_core()
         if memory is None:
-            # Get the lastest memory from the agent autumaticly
-            memory = agent_data.get_latest_memory()
+            # Get the lastest memory which fits in the context window from the agent autumaticly
+            memory = agent_data.get_context_messages(system_prompt, prompt)
         memory = memory + [UserMessage(content=prompt)]
         llm = agent_core.get_llm(agent_data.llm_config["llm_type"])
         if not llm:
             raise Exception("LLM not found")
-        rsp = llm.llm_ask(
+        llm_kwargs = dict(
             memory=memory,
             system_prompt=system_prompt,
-            handle_stream_function=handle_stream_function,
             base_url=agent_data.llm_config.get("base_url", None),
             api_key=agent_data.llm_config.get("api_key", None),
             model_name=agent_data.llm_config.get("model_name", None),
             temperature=agent_data.llm_config.get("temperature", None),
         )
-        return rsp
+        return llm, llm_kwargs
 
     def get_agent_plan_action(self, agent_data):
         """
@@ -27,26 +27,14 @@ class ReActLifeSchedule(BaseLifeScheduler):
         agent_data = get_current_agent_data()
         self.react(agent_data)
 
+    async def alife(self):
+        """Main life cycle coroutine for the agent, used by the async life runtime."""
+        agent_data = get_current_agent_data()
+        await self.areact(agent_data)
+
     def react(self, agent_data: "Agent"):
         """React to the environment and execute actions based on the agent's state."""
-        agent_core = get_agent_core()
-
-        # Separate plan actions and normal actions
-        plan_action_list = []
-        normal_action_list = []
-        for action_item in agent_data.action_list:
-            action_name = action_item.split(":")[0]
-            action = agent_core.get_action(action_name)
-            if isinstance(action, BasePlanAction):
-                plan_action_list.append(action)
-            else:
-                normal_action_list.append(action)
-
-        # Log if there are multiple plan actions
-        if len(plan_action_list) > 1:
-            logger.info(
-                f"Agent {agent_data.name} plan action more than one:{[plan_action.action_name for plan_action in plan_action_list]}"
-            )
+        plan_action_list, _ = self.split_action_list(agent_data)
 
         # Main loop
         while agent_data.is_alive:
@@ -54,38 +42,96 @@ class ReActLifeSchedule(BaseLifeScheduler):
                 agent_data.wake_up_event.wait()
                 agent_data.wake_up_event.clear()
                 continue
+            # Wait for the burst of messages, so they are handled by one plan.
+            agent_data.wait_for_debounce()
             # Make Plan
             command_list: List[ActionCommand] = []
             for plan_action in plan_action_list:
                 thought, command_list = plan_action.plan(command_list)
-                plan_memory = ""
-                if thought:
-                    plan_memory += thought
-                if command_list:
-                    thought += json.dumps([i.to_dict() for i in command_list], ensure_ascii=False)
-                if plan_memory:
-                    agent_data.add_memory(AIMessage(content=thought))
+                self.add_plan_memory(agent_data, thought, command_list)
+
+            # Act/ReAct
+            command: ActionCommand
+            for command in command_list:
+                try:
+                    rsp = self.execute_command(command)
+                except Exception as e:
+                    rsp = f"Exception: {str(e)}"
+                self.add_command_memory(agent_data, command, rsp)
+
+    async def areact(self, agent_data: "Agent"):
+        """The same as react, but the waiting is done on the event loop, the plan is awaited (aplan) and the action is
+        run in the bounded executor of the async life runtime, so the idle agent does not hold a thread."""
+        from wiseagent.core.async_life_runtime import get_async_life_runtime
+
+        runtime = get_async_life_runtime()
+        plan_action_list, _ = self.split_action_list(agent_data)
+
+        # Main loop
+        while agent_data.is_alive:
+            if not agent_data.is_activate:
+                await agent_data.async_wait_for_new_message()
+                continue
+            # Wait for the burst of messages, so they are handled by one plan.
+            await agent_data.async_wait_for_debounce()
+            # Make Plan
+            command_list: List[ActionCommand] = []
+            for plan_action in plan_action_list:
+                thought, command_list = await plan_action.aplan(command_list)
+                self.add_plan_memory(agent_data, thought, command_list)
 
             # Act/ReAct
             command: ActionCommand
             for command in command_list:
-                current_action = agent_core.get_action(command.action_name)
-                rsp = ""
                 try:
-                    if hasattr(current_action, command.action_method) and callable(
-                        getattr(current_action, command.action_method)
-                    ):
-                        # current_action.action_method(self,agent_data,command.params)
-                        method = getattr(current_action, command.action_method)
-                        rsp = method(**command.args)
-                    else:
-                        rsp = f"{command.action_method} not found"
+                    rsp = await runtime.run_blocking(self.execute_command, command)
                 except Exception as e:
                     rsp = f"Exception: {str(e)}"
-                if rsp:
-                    agent_data.add_memory(UserMessage(content=rsp))
-                # After executed the action, if the agent is dead, then break the loop
-                logger.info(f"{command.action_method} executed. " + rsp if rsp else "")
+                self.add_command_memory(agent_data, command, rsp)
+
+    def split_action_list(self, agent_data: "Agent"):
+        """Separate the plan actions and the normal actions of the agent."""
+        agent_core = get_agent_core()
+        plan_action_list = []
+        normal_action_list = []
+        for action_item in agent_data.action_list:
+            action_name = action_item.split(":")[0]
+            action = agent_core.get_action(action_name)
+            if isinstance(action, BasePlanAction):
+                plan_action_list.append(action)
+            else:
+                normal_action_list.append(action)
+
+        # Log if there are multiple plan actions
+        if len(plan_action_list) > 1:
+            logger.info(
+                f"Agent {agent_data.name} plan action more than one:{[plan_action.action_name for plan_action in plan_action_list]}"
+            )
+        return plan_action_list, normal_action_list
+
+    def add_plan_memory(self, agent_data: "Agent", thought: str, command_list: List[ActionCommand]):
+        plan_memory = ""
+        if thought:
+            plan_memory += thought
+        if command_list:
+            thought += json.dumps([i.to_dict() for i in command_list], ensure_ascii=False)
+        if plan_memory:
+            agent_data.add_memory(AIMessage.fast(content=thought))
+
+    def execute_command(self, command: ActionCommand):
+        """Execute the action method of the command and return the response."""
+        current_action = get_agent_core().get_action(command.action_name)
+        if hasattr(current_action, command.action_method) and callable(getattr(current_action, command.action_method)):
+            # current_action.action_method(self,agent_data,command.params)
+            method = getattr(current_action, command.action_method)
+            return method(**command.args)
+        return f"{command.action_method} not found"
+
+    def add_command_memory(self, agent_data: "Agent", command: ActionCommand, rsp: str):
+        if rsp:
+            agent_data.add_memory(UserMessage(content=rsp))
+        # After executed the action, if the agent is dead, then break the loop
+        logger.info(f"{command.action_method} executed. " + rsp if rsp else "")
 
 
 def get_life_scheduler():
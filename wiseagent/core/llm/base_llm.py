@@ -6,13 +6,38 @@ LastEditTime: 2024-10-06 16:34:55
 Description: 
 """
 
+import asyncio
+import contextvars
+import inspect
 from abc import ABC, abstractmethod
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 
 from pydantic import BaseModel
 
 from wiseagent.common.logs import logger
 from wiseagent.common.protocol_message import Message
+from wiseagent.common.stream_parser import is_chunk_stream_function
+
+
+async def acall_stream_function(handle_stream_function, stream_message: str):
+    """Call the handle_stream_function, await the result if it is a coroutine function."""
+    result = handle_stream_function(stream_message)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+def convert_message(memory) -> dict:
+    """Convert the message to the dict of the API request, the dict is returned as it is."""
+    # If the message if from AI, the message.role is set to "assistant", otherwise it is set to "user".
+    # If the message.role is not set, it is set to "user".
+    if type(memory) is dict:
+        return memory
+    if memory.llm_handle_type is None:
+        logger.warning(f"Message {memory.content} does not have a llm_handle_type, set to 'user'")
+        return {"role": "user", "content": memory.content}
+    return {"role": memory.llm_handle_type, "content": memory.content}
 
 
 class BaseLLM(BaseModel, ABC):
@@ -22,9 +47,91 @@ class BaseLLM(BaseModel, ABC):
 
     @abstractmethod
     def llm_ask(self, memory: List[Message] = None, system_prompt: str = None, handle_stream_function=None) -> str:
-        """Ask the LLM a question and return the answer"""
+        """Ask the LLM a question and return the answer.
+        The handle_stream_function is called once per chunk of the stream if it is marked by chunk_stream_function
+        (see stream_parser.py), otherwise once per character with the accumulated text. Then it is called with
+        STREAM_END_FLAG.
+        """
         pass
 
+    async def allm_ask(
+        self, memory: List[Message] = None, system_prompt: str = None, handle_stream_function=None, **kwargs
+    ) -> str:
+        """The coroutine version of llm_ask. By default, llm_ask is run in a thread, override it with the async client
+        of the LLM so the waiting request does not hold a thread.
+        The handle_stream_function can be a function or a coroutine function.
+        """
+        if handle_stream_function is not None and inspect.iscoroutinefunction(handle_stream_function):
+            loop = asyncio.get_running_loop()
+            async_handle_stream_function = handle_stream_function
+
+            def handle_stream_function(stream_message):
+                # Called in the thread of llm_ask, run the coroutine on the event loop and wait for the result.
+                return asyncio.run_coroutine_threadsafe(async_handle_stream_function(stream_message), loop).result()
+
+            handle_stream_function.chunk_stream = is_chunk_stream_function(async_handle_stream_function)
+
+        return await asyncio.to_thread(
+            self.llm_ask,
+            memory=memory,
+            system_prompt=system_prompt,
+            handle_stream_function=handle_stream_function,
+            **kwargs,
+        )
+
+    def llm_batch_ask(
+        self,
+        memory_list: List[List[Message]],
+        system_prompt: str = None,
+        handle_stream_function_list: List = None,
+        max_concurrency: int = 8,
+        return_exceptions: bool = False,
+        **kwargs,
+    ) -> List[Optional[str]]:
+        """Ask the LLM the independent requests concurrently, the requests are still limited by the rate limiter of
+        the LLM. The context (the current agent, the current action) is copied to the worker threads.
+
+        Args:
+            memory_list (List[List[Message]]): The memory of each request.
+            system_prompt (str, optional): The system prompt shared by the requests. Defaults to None.
+            handle_stream_function_list (List, optional): The handle_stream_function of each request. Defaults to None.
+            max_concurrency (int, optional): The max number of the requests in flight. Defaults to 8.
+            return_exceptions (bool, optional): Return the exception of the failed request instead of None.
+
+        Returns:
+            List[Optional[str]]: The responses in the order of the memory_list, None (or the exception) if the request
+                failed.
+        Raise:
+            ValueError: If the length of the handle_stream_function_list is not the same as the memory_list.
+        """
+        if not memory_list:
+            return []
+        handle_stream_function_list = handle_stream_function_list or [None] * len(memory_list)
+        if len(handle_stream_function_list) != len(memory_list):
+            raise ValueError(
+                f"Got {len(handle_stream_function_list)} handle_stream_function for {len(memory_list)} requests"
+            )
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(memory_list))) as executor:
+            future_list = [
+                executor.submit(
+                    contextvars.copy_context().run,
+                    self.llm_ask,
+                    memory=memory,
+                    system_prompt=system_prompt,
+                    handle_stream_function=handle_stream_function,
+                    **kwargs,
+                )
+                for memory, handle_stream_function in zip(memory_list, handle_stream_function_list)
+            ]
+            rsp_list = []
+            for index, future in enumerate(future_list):
+                try:
+                    rsp_list.append(future.result())
+                except Exception as e:
+                    logger.warning(f"The request {index} of the batch failed: {e}")
+                    rsp_list.append(e if return_exceptions else None)
+        return rsp_list
+
     def set_key(self, api_key: str):
         self.api_key = api_key
 
@@ -39,15 +146,7 @@ class BaseLLM(BaseModel, ABC):
         if system_prompt:
             messages.append({"role": "system", "content": system_prompt})
         for memory in memories:
-            # If the message if from AI, the message.role is set to "assistant", otherwise it is set to "user".
-            # If the message.role is not set, it is set to "user".
-            if type(memory) is dict:
-                messages.append(memory)
-            elif memory.llm_handle_type is None:
-                logger.warning(f"Message {memory.content} does not have a llm_handle_type, set to 'user'")
-                messages.append({"role": "user", "content": memory.content})
-            else:
-                messages.append({"role": memory.llm_handle_type, "content": memory.content})
+            messages.append(convert_message(memory))
 
         if user_prompt:
             messages.append({"role": "user", "content": user_prompt})
@@ -0,0 +1,159 @@
+"""
+Author: Huang Weitao
+Date: 2026-10-18 18:02:11
+LastEditors: Huang Weitao
+LastEditTime: 2026-10-18 18:02:11
+Description: The pool of the OpenAI clients shared by all the agents.
+
+Creating an OpenAI client creates a new http connection pool, so the request pays the TCP (and TLS) handshake again.
+The pool keeps one client per (api_key, base_url) with keep-alive connections, and closes the client which is not
+used for idle_timeout seconds.
+
+The async client (AsyncOpenAI) is bound to the event loop which uses it, so it is pooled per (api_key, base_url,
+event loop).
+"""
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, Tuple
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+from pydantic import BaseModel
+
+from wiseagent.common.logs import logger
+from wiseagent.common.singleton import singleton
+
+
+class PooledClient(BaseModel):
+    client: Any = None
+    last_used_time: float = 0
+    # The number of the requests using the client, the client in use is never evicted.
+    use_count: int = 0
+    # The event loop of the async client, None for the sync client.
+    loop: Any = None
+
+
+@singleton
+class OpenAIClientPool(BaseModel):
+    # The max number of the connections of one client.
+    max_connections: int = 20
+    # The max number of the idle connections kept alive by one client.
+    max_keepalive_connections: int = 10
+    # The idle connection is closed after keepalive_expiry seconds.
+    keepalive_expiry: float = 60
+    # The client is closed after idle_timeout seconds without request.
+    idle_timeout: float = 600
+    # The key is (api_key, base_url, id of the event loop), the id is 0 for the sync client.
+    client_map: Dict[Tuple[str, str, int], PooledClient] = {}
+    lock: Any = None
+    last_evict_time: float = 0
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self.client_map = {}
+        self.lock = threading.Lock()
+        self.last_evict_time = time.monotonic()
+
+    def configure(self, **config):
+        """Update the pool config. The clients created before keep their connection limits."""
+        for k, v in config.items():
+            if v is not None:
+                setattr(self, k, v)
+
+    def _get_limits(self):
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    # The sdk does not retry the request, the failed request is retried by the rate limiter (see rate_limiter.py),
+    # which also backs off the other requests of the throttled model.
+    def create_client(self, api_key: str, base_url: str) -> OpenAI:
+        http_client = DefaultHttpxClient(limits=self._get_limits())
+        return OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+
+    def create_async_client(self, api_key: str, base_url: str) -> AsyncOpenAI:
+        http_client = DefaultAsyncHttpxClient(limits=self._get_limits())
+        return AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+
+    def _borrow(self, key: tuple, create_function, loop=None) -> PooledClient:
+        with self.lock:
+            now = time.monotonic()
+            if now - self.last_evict_time > self.idle_timeout:
+                self._evict_idle(now)
+            pooled_client = self.client_map.get(key)
+            # The id of the closed event loop can be reused by a new one.
+            if pooled_client is None or pooled_client.loop is not loop:
+                pooled_client = PooledClient(client=create_function(key[0], key[1]), loop=loop)
+                self.client_map[key] = pooled_client
+            pooled_client.use_count += 1
+            return pooled_client
+
+    def _give_back(self, pooled_client: PooledClient):
+        with self.lock:
+            pooled_client.use_count -= 1
+            pooled_client.last_used_time = time.monotonic()
+
+    @contextmanager
+    def use_client(self, api_key: str, base_url: str):
+        """Borrow the client of the (api_key, base_url), create it if it is not in the pool.
+        Example:
+            with get_client_pool().use_client(api_key, base_url) as client:
+                client.chat.completions.create(...)
+        """
+        pooled_client = self._borrow((api_key, base_url, 0), self.create_client)
+        try:
+            yield pooled_client.client
+        finally:
+            self._give_back(pooled_client)
+
+    @asynccontextmanager
+    async def use_async_client(self, api_key: str, base_url: str):
+        """Borrow the async client of the (api_key, base_url) for the running event loop.
+        Example:
+            async with get_client_pool().use_async_client(api_key, base_url) as client:
+                await client.chat.completions.create(...)
+        """
+        loop = asyncio.get_running_loop()
+        pooled_client = self._borrow((api_key, base_url, id(loop)), self.create_async_client, loop)
+        try:
+            yield pooled_client.client
+        finally:
+            self._give_back(pooled_client)
+
+    def _evict_idle(self, now: float):
+        """Close the clients not used for idle_timeout seconds. The caller holds the lock."""
+        self.last_evict_time = now
+        for key, pooled_client in list(self.client_map.items()):
+            if pooled_client.use_count == 0 and now - pooled_client.last_used_time > self.idle_timeout:
+                self.client_map.pop(key)
+                self._close_client(pooled_client)
+                logger.info(f"Close the idle LLM client of {key[1]}")
+
+    def evict_idle(self):
+        with self.lock:
+            self._evict_idle(time.monotonic())
+
+    def close(self):
+        """Close all the clients."""
+        with self.lock:
+            for pooled_client in self.client_map.values():
+                self._close_client(pooled_client)
+            self.client_map = {}
+
+    def _close_client(self, pooled_client: PooledClient):
+        try:
+            if pooled_client.loop is None:
+                pooled_client.client.close()
+            elif not pooled_client.loop.is_closed():
+                # The async client must be closed on its own event loop.
+                asyncio.run_coroutine_threadsafe(pooled_client.client.close(), pooled_client.loop)
+        except Exception as e:
+            logger.warning(f"Failed to close the LLM client: {e}")
+
+
+def get_client_pool() -> OpenAIClientPool:
+    return OpenAIClientPool()
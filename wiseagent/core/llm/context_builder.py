@@ -0,0 +1,201 @@
+"""
+Author: Huang Weitao
+Date: 2026-10-18 23:18:44
+LastEditors: Huang Weitao
+LastEditTime: 2026-10-18 23:18:44
+Description: Fit the memory of the agent to the context window of the model.
+
+Sending the last 30 messages makes the prompt size unpredictable: one file upload or jupyter output can exceed the
+context window, while 30 short chat lines waste it. The context builder counts the tokens of the messages and keeps
+the messages which fit in the budget of the model (the context window minus the tokens reserved for the response,
+the system prompt and the prompt):
+1. The message longer than max_message_tokens is truncated, the head and the tail are kept.
+2. The latest min_recent messages are kept first, the last one is truncated to the remaining budget if it is needed.
+3. The older messages are kept by salience (the messages from the other agents and the tasks before the thoughts and
+   the commands, the action outputs and the files last), then by recency.
+The kept messages are returned in the original order.
+
+The tokens are counted with tiktoken if it is installed, otherwise estimated (4 ascii characters or 1 other character
+per token). The count is cached by the digest of the text, the text itself is not kept.
+"""
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from wiseagent.common.protocol_message import EnvironmentHandleType, LLMHandleType
+from wiseagent.common.singleton import singleton
+
+# The tokens of the role and the separators of one message.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SALIENCE_MAP = {
+    EnvironmentHandleType.COMMUNICATION: 2,
+    EnvironmentHandleType.CONTROL: 2,
+    EnvironmentHandleType.CREATE_TASK: 2,
+    EnvironmentHandleType.FINISH_TASK: 2,
+    EnvironmentHandleType.THOUGHT: 1,
+    EnvironmentHandleType.COMMAND: 1,
+    EnvironmentHandleType.BASE_ACTION_MESSAGE: 0,
+    EnvironmentHandleType.FILE_UPLOAD: 0,
+    EnvironmentHandleType.IMAGE: 0,
+    EnvironmentHandleType.SLEEP: 0,
+    EnvironmentHandleType.WAKEUP: 0,
+}
+
+
+def get_content(message) -> str:
+    content = message.get("content") if isinstance(message, dict) else message.content
+    return content if isinstance(content, str) else str(content or "")
+
+
+def replace_content(message, content: str):
+    """Return a copy of the message with the content, the message in the memory is not changed."""
+    if isinstance(message, dict):
+        return {**message, "content": content}
+    return message.model_copy(update={"content": content})
+
+
+def get_salience(message) -> int:
+    if isinstance(message, dict):
+        return 2 if message.get("role") == LLMHandleType.USER else 1
+    if message.env_handle_type in SALIENCE_MAP:
+        return SALIENCE_MAP[message.env_handle_type]
+    return 2 if message.llm_handle_type == LLMHandleType.USER else 1
+
+
+class TokenCounter:
+    """Count the tokens of the text with the encoding of the model."""
+
+    def __init__(self, model_name: str = None, cache_size: int = 8192):
+        self.encoding = None
+        # The digest of the text -> the token count, the least recently used one is removed beyond cache_size.
+        self.cache_size = cache_size
+        self.count_cache: "OrderedDict[bytes, int]" = OrderedDict()
+        self.lock = threading.Lock()
+        try:
+            import tiktoken
+
+            try:
+                self.encoding = tiktoken.encoding_for_model(model_name or "")
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+        except ImportError:
+            pass
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        key = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        with self.lock:
+            token_count = self.count_cache.get(key)
+            if token_count is not None:
+                self.count_cache.move_to_end(key)
+                return token_count
+        token_count = self._count(text)
+        with self.lock:
+            self.count_cache[key] = token_count
+            if len(self.count_cache) > self.cache_size:
+                self.count_cache.popitem(last=False)
+        return token_count
+
+    def _count(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        ascii_count = len(text.encode("ascii", "ignore"))
+        return ascii_count // 4 + (len(text) - ascii_count) + 1
+
+    def count_message(self, message) -> int:
+        return self.count(get_content(message)) + MESSAGE_OVERHEAD_TOKENS
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Keep the head (2/3) and the tail (1/3) of the text within max_tokens."""
+        token_count = self.count(text)
+        if token_count <= max_tokens:
+            return text
+        head_tokens, tail_tokens = max_tokens * 2 // 3, max_tokens // 3
+        if self.encoding is not None:
+            token_list = self.encoding.encode(text, disallowed_special=())
+            head = self.encoding.decode(token_list[:head_tokens])
+            tail = self.encoding.decode(token_list[len(token_list) - tail_tokens :]) if tail_tokens else ""
+        else:
+            chars_per_token = len(text) / token_count
+            head = text[: int(head_tokens * chars_per_token)]
+            tail = text[len(text) - int(tail_tokens * chars_per_token) :] if tail_tokens else ""
+        return f"{head}\n...[{token_count - max_tokens} tokens truncated]...\n{tail}"
+
+
+@functools.lru_cache(maxsize=None)
+def get_token_counter(model_name: str = None) -> TokenCounter:
+    return TokenCounter(model_name)
+
+
+@singleton
+class ContextBuilder(BaseModel):
+    # The context window of the model, the key is the model name or "default". The memory is not fitted (the last
+    # last_k messages are used) if no window is configured for the model.
+    context_window_map: Dict[str, int] = {}
+    # The tokens reserved for the response.
+    reserved_tokens: int = 4096
+    # The message longer than it is truncated.
+    max_message_tokens: int = 4000
+    # The number of the latest messages kept before the others.
+    min_recent: int = 4
+    last_k: int = 30
+
+    def configure(self, **config):
+        for k, v in config.items():
+            if v is not None:
+                setattr(self, k, v)
+
+    def get_context_window(self, model_name: str = None) -> Optional[int]:
+        return self.context_window_map.get(model_name or "", self.context_window_map.get("default"))
+
+    def get_budget(self, model_name: str = None, system_prompt: str = "", prompt: str = "") -> Optional[int]:
+        """Return the tokens left for the messages, None if no window is configured for the model."""
+        context_window = self.get_context_window(model_name)
+        if context_window is None:
+            return None
+        counter = get_token_counter(model_name)
+        budget = context_window - self.reserved_tokens - counter.count(system_prompt) - counter.count(prompt)
+        return budget - MESSAGE_OVERHEAD_TOKENS * 2
+
+    def fit_message(self, message, model_name: str = None) -> Tuple[Any, int]:
+        """Return the message (truncated if it is longer than max_message_tokens) and its tokens."""
+        counter = get_token_counter(model_name)
+        if counter.count(get_content(message)) > self.max_message_tokens:
+            message = replace_content(message, counter.truncate(get_content(message), self.max_message_tokens))
+        return message, counter.count_message(message)
+
+    def build(self, memory: List[Any], model_name: str = None, system_prompt: str = "", prompt: str = "") -> List[Any]:
+        """Return the messages of the memory which fit in the context window of the model."""
+        budget = self.get_budget(model_name, system_prompt, prompt)
+        if budget is None:
+            return memory[-self.last_k :] if self.last_k >= 0 else memory
+        return [message for _, message, _ in self.select(memory, budget, model_name)]
+
+    def select(self, memory: List[Any], budget: int, model_name: str = None) -> List[Tuple[int, Any, int]]:
+        """Return the (index, message, tokens) of the messages of the memory which fit in the budget."""
+        counter = get_token_counter(model_name)
+        recent_start = max(0, len(memory) - self.min_recent)
+        older_list = sorted(range(recent_start), key=lambda i: (-get_salience(memory[i]), -i))
+        kept_map = {}
+        for index in list(range(len(memory) - 1, recent_start - 1, -1)) + older_list:
+            message, tokens = self.fit_message(memory[index], model_name)
+            if tokens > budget and index >= recent_start and budget > 64:
+                # The latest message is kept even if it has to be truncated to the remaining budget.
+                # The margin is for the truncation mark and the estimation error.
+                message = replace_content(message, counter.truncate(get_content(message), budget - 32))
+                tokens = counter.count_message(message)
+            if tokens > budget:
+                continue
+            kept_map[index] = (index, message, tokens)
+            budget -= tokens
+        return [kept_map[index] for index in sorted(kept_map)]
+
+
+def get_context_builder() -> ContextBuilder:
+    return ContextBuilder()
@@ -0,0 +1,133 @@
+"""
+Author: Huang Weitao
+Date: 2026-10-18 22:21:35
+LastEditors: Huang Weitao
+LastEditTime: 2026-10-18 22:21:35
+Description: The OpenAI compatible http server of FakeApi.
+
+The server answers POST /v1/chat/completions (stream or not) with FakeApi, so the real OpenAIClient, the client
+pool, the rate limiter and the router can be benchmarked without the network. The injected error is answered with
+its status code.
+
+Usage:
+    python -m wiseagent.core.llm.fake_openai_server --port 8000 --ttft 0.2 --tokens-per-second 50 --script script.jsonl
+    then set LLM_BASE_URL=http://127.0.0.1:8000/v1
+"""
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from wiseagent.core.llm.fakeapi import FakeApi, FakeApiError
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeOpenAIServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status_code: int, data: dict):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        fake_api = self.server.fake_api
+        time.sleep(fake_api.ttft)
+        try:
+            rsp = fake_api.get_response(body.get("messages", []))
+        except FakeApiError as e:
+            self.send_json(e.status_code, {"error": {"message": str(e), "code": e.status_code}})
+            return
+        model = body.get("model", fake_api.llm_type)
+        if not body.get("stream"):
+            message = {"role": "assistant", "content": rsp}
+            self.send_json(
+                200,
+                {
+                    "id": "fake",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                },
+            )
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            self.write_stream(rsp, model)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stops reading the stream, e.g. the hedge request which lost.
+            self.close_connection = True
+
+    def write_stream(self, rsp: str, model: str):
+        fake_api = self.server.fake_api
+        delay = fake_api.get_chunk_delay()
+        for index, content in enumerate(fake_api.split_response(rsp)):
+            if delay and index:
+                time.sleep(delay)
+            chunk = {
+                "id": "fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+            }
+            self.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        # The end of the stream and the last chunk of the chunked encoding are sent together, so the client keeps the
+        # connection.
+        data = b"data: [DONE]\n\n"
+        self.wfile.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, server_address, fake_api: FakeApi = None):
+        super().__init__(server_address, FakeOpenAIHandler)
+        self.fake_api = fake_api or FakeApi()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="The OpenAI compatible server of the mock LLM")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--script", default=None, help="The json lines file of the scripted responses")
+    parser.add_argument("--ttft", type=float, default=0)
+    parser.add_argument("--tokens-per-second", type=float, default=None)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--error-status-code", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    fake_api = FakeApi(
+        script_path=args.script,
+        ttft=args.ttft,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        error_status_code=args.error_status_code,
+        seed=args.seed,
+    )
+    server = FakeOpenAIServer((args.host, args.port), fake_api)
+    print(f"Fake OpenAI server is listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
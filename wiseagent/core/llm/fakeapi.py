@@ -1,18 +1,211 @@
-import queue
-import uuid
-from mailbox import Message
-from typing import Any, Callable, List, Union
+"""
+Author: Huang Weitao
+Date: 2026-10-18 21:58:12
+LastEditors: Huang Weitao
+LastEditTime: 2026-10-18 21:58:12
+Description: The mock LLM used by the load and the regression benchmarks without the network.
 
-from wiseagent.core.llm.base_llm import BaseLLM
+FakeApi answers the request from a script. Each entry of the script has a regex (match) searched in the last user
+prompt and the response (response), the plan commands (commands, rendered in the xml or json format asked by the
+MethodPlanAction prompt) or the status code of an injected error (error). The request which matches no entry gets
+the end command if it is a plan request, otherwise a fake answer derived from the prompt, so the same run always
+gets the same responses.
+
+The response is streamed like a real LLM: the first chunk comes after ttft seconds, then tokens_per_second tokens
+per second. The error is injected with error_rate before the first chunk, with a status_code like the openai sdk
+errors, so the rate limiter and the router handle it the same way.
+
+The script can be loaded from a json lines file, one entry per line. The entry with "prompt" instead of "match"
+matches the prompt exactly, so the recorded (prompt, response) pairs can be replayed.
+
+See fake_openai_server.py for the OpenAI compatible http server of FakeApi.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from wiseagent.common.protocol_message import STREAM_END_FLAG, Message
+from wiseagent.common.stream_parser import to_chunk_stream_function
+from wiseagent.core.llm.base_llm import BaseLLM, acall_stream_function
+
+END_COMMAND = {"action_name": "MethodPlanAction", "action_method": "end", "args": {}}
+
+
+class FakeApiError(Exception):
+    """The injected error, status_code is the same as the one of the openai sdk error."""
+
+    def __init__(self, status_code: int, message: str = "injected error"):
+        super().__init__(f"Error code: {status_code} - {message}")
+        self.status_code = status_code
+
+
+class ScriptedResponse(BaseModel):
+    # The regex searched in the last user prompt, None matches every prompt.
+    match: Optional[str] = None
+    response: Optional[str] = None
+    # The plan commands, e.g. [{"action_name": "Chat", "action_method": "chat", "args": {"send_to": "Bob"}}].
+    commands: Optional[List[Dict[str, Any]]] = None
+    # The status code of the injected error.
+    error: Optional[int] = None
+
+
+def get_plan_parse_type(messages: List[dict]) -> Optional[str]:
+    """Return the command format (xml or json) asked by the MethodPlanAction prompt, None if it is not a plan
+    request."""
+    text = "\n".join(str(message.get("content") or "") for message in messages)
+    if "<action_list>" in text:
+        return "xml"
+    if "```json" in text and "action_method" in text:
+        return "json"
+    return None
+
+
+def build_plan_response(command_list: List[Dict[str, Any]], parse_type: str = "xml", thought: str = "") -> str:
+    """Render the commands in the format parsed by MethodPlanAction."""
+    thought = thought or "I will do the next step of the task."
+    if parse_type == "json":
+        return f"{thought}\n```json\n{json.dumps(command_list, ensure_ascii=False, indent=4)}\n```"
+    action_list = []
+    for command in command_list:
+        line_list = [
+            "<action>",
+            f"<action_name>{command['action_name']}</action_name>",
+            f"<action_method>{command['action_method']}</action_method>",
+        ]
+        for name, value in (command.get("args") or {}).items():
+            if isinstance(value, (list, dict)):
+                line_list.append(f'<args name="{name}" type = list >{json.dumps(value, ensure_ascii=False)}</args>')
+            else:
+                line_list.append(f'<args name="{name}" type = {type(value).__name__} >{value}</args>')
+        line_list.append("</action>")
+        action_list.append("\n".join(line_list))
+    return f"{thought}\n```xml\n<action_list>\n" + "\n".join(action_list) + "\n</action_list>\n```"
 
 
 class FakeApi(BaseLLM):
-    def __init__(self, api_key=None):
-        super().__init__()
-        self.api_key = api_key
-        self.model = "fakeapi"
-
-    def llm_ask(self, memory: List[Message] = None, system_prompt: str = None, queue: queue.Queue = None) -> str:
-        """Ask the LLM a question and return the answer"""
-        message = self._build_message(memory, system_prompt)
-        return f" fake answer :{str(uuid.uuid4())[-12:]}"
+    llm_type: str = "FakeApi"
+    script: List[ScriptedResponse] = []
+    # The seconds before the first chunk.
+    ttft: float = 0
+    # The tokens per second of the stream, None means no delay.
+    tokens_per_second: Optional[float] = None
+    # The number of the characters of one token (one chunk).
+    chars_per_token: int = 4
+    # The probability of the injected error, and its status code.
+    error_rate: float = 0
+    error_status_code: int = 500
+    seed: int = 0
+    random: Any = None
+    lock: Any = None
+    request_count: int = 0
+    error_count: int = 0
+
+    def __init__(self, script: List[dict] = None, script_path: str = None, **data):
+        super().__init__(**data)
+        self.random = random.Random(self.seed)
+        self.lock = threading.Lock()
+        self.script = [ScriptedResponse(**entry) for entry in script or []]
+        if script_path:
+            self.load_script(script_path)
+
+    def load_script(self, script_path: str):
+        """Append the entries of the json lines file to the script."""
+        with open(script_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if "prompt" in entry:
+                    entry["match"] = f"^{re.escape(entry.pop('prompt'))}$"
+                self.script.append(ScriptedResponse(**entry))
+
+    def get_response(self, messages: List[dict]) -> str:
+        """Return the response of the request.
+        Raise:
+            FakeApiError: If the error is injected.
+        """
+        prompt = next((str(m.get("content") or "") for m in reversed(messages) if m.get("role") == "user"), "")
+        with self.lock:
+            self.request_count += 1
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.error_count += 1
+                raise FakeApiError(self.error_status_code)
+        for entry in self.script:
+            if entry.match is not None and not re.search(entry.match, prompt, re.DOTALL):
+                continue
+            if entry.error is not None:
+                with self.lock:
+                    self.error_count += 1
+                raise FakeApiError(entry.error)
+            if entry.commands is not None:
+                return build_plan_response(entry.commands, get_plan_parse_type(messages) or "xml", entry.response)
+            return entry.response or ""
+        parse_type = get_plan_parse_type(messages)
+        if parse_type is not None:
+            return build_plan_response([END_COMMAND], parse_type, "The task is completed.")
+        return f"fake answer: {hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]}"
+
+    def split_response(self, rsp: str) -> List[str]:
+        return [rsp[i : i + self.chars_per_token] for i in range(0, len(rsp), self.chars_per_token)]
+
+    def get_chunk_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second else 0
+
+    def llm_ask(
+        self, memory: List[Message] = None, system_prompt: str = None, handle_stream_function=None, **kwargs
+    ) -> str:
+        """Answer the request from the script. The arguments of the real LLM (base_url, model_name...) are ignored."""
+        messages = self._build_messages(memory or [], system_prompt)
+        handle_stream_function = to_chunk_stream_function(handle_stream_function)
+        time.sleep(self.ttft)
+        rsp = self.get_response(messages)
+        delay = self.get_chunk_delay()
+        for index, chunk in enumerate(self.split_response(rsp)):
+            if delay and index:
+                time.sleep(delay)
+            if handle_stream_function:
+                handle_stream_function(chunk)
+        if handle_stream_function:
+            handle_stream_function(STREAM_END_FLAG)
+        return rsp
+
+    async def allm_ask(
+        self, memory: List[Message] = None, system_prompt: str = None, handle_stream_function=None, **kwargs
+    ) -> str:
+        messages = self._build_messages(memory or [], system_prompt)
+        handle_stream_function = to_chunk_stream_function(handle_stream_function)
+        await asyncio.sleep(self.ttft)
+        rsp = self.get_response(messages)
+        delay = self.get_chunk_delay()
+        for index, chunk in enumerate(self.split_response(rsp)):
+            if delay and index:
+                await asyncio.sleep(delay)
+            if handle_stream_function:
+                await acall_stream_function(handle_stream_function, chunk)
+        if handle_stream_function:
+            await acall_stream_function(handle_stream_function, STREAM_END_FLAG)
+        return rsp
+
+    def get_stats(self) -> dict:
+        return {"request": self.request_count, "error": self.error_count}
+
+
+def get_llm():
+    """Create the FakeApi from the environment variables FAKE_LLM_SCRIPT_PATH, FAKE_LLM_TTFT,
+    FAKE_LLM_TOKENS_PER_SECOND, FAKE_LLM_ERROR_RATE and FAKE_LLM_SEED."""
+    config = {
+        "script_path": os.environ.get("FAKE_LLM_SCRIPT_PATH"),
+        "ttft": os.environ.get("FAKE_LLM_TTFT"),
+        "tokens_per_second": os.environ.get("FAKE_LLM_TOKENS_PER_SECOND"),
+        "error_rate": os.environ.get("FAKE_LLM_ERROR_RATE"),
+        "seed": os.environ.get("FAKE_LLM_SEED"),
+    }
+    return FakeApi(**{k: v for k, v in config.items() if v})
@@ -0,0 +1,258 @@
+"""
+Author: Huang Weitao
+Date: 2026-10-18 22:47:03
+LastEditors: Huang Weitao
+LastEditTime: 2026-10-18 22:47:03
+Description: Hedged LLM requests.
+
+A few slow upstream completions dominate the tail latency of the plans. If the first token of a request does not
+arrive within the percentile (e.g. p95) of the recent time to first token of the (base_url, model), a duplicate
+request (the hedge) is sent to the same or an alternate backend. The first request which streams wins, its chunks are
+forwarded to the caller, and the other one is cancelled: the async request is cancelled at once, the sync one when
+it receives its first chunk.
+
+The hedges are limited by a budget: every request adds budget_ratio credit (up to max_burst) and every hedge takes
+one, so the hedges are at most budget_ratio of the requests in the long run.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from pydantic import BaseModel
+
+from wiseagent.common.logs import logger
+from wiseagent.common.singleton import singleton
+from wiseagent.common.stream_parser import chunk_stream_function
+from wiseagent.core.llm.base_llm import acall_stream_function
+
+
+class HedgeCancelledError(Exception):
+    """The request lost the race to the other request."""
+
+
+class HedgeRace:
+    """Forward the stream of the first request which streams, stop the others."""
+
+    def __init__(self, handle_stream_function=None, on_win=None):
+        self.handle_stream_function = handle_stream_function
+        self.on_win = on_win
+        self.start_time = time.monotonic()
+        self.winner: Optional[int] = None
+        self.first_token_latency: Optional[float] = None
+        self.condition = threading.Condition()
+
+    def _claim(self, index: int):
+        with self.condition:
+            if self.winner is None:
+                self.winner = index
+                self.first_token_latency = time.monotonic() - self.start_time
+                self.condition.notify_all()
+                if self.on_win:
+                    self.on_win()
+            elif self.winner != index:
+                raise HedgeCancelledError("The other request streams first")
+
+    def notify(self, *args):
+        with self.condition:
+            self.condition.notify_all()
+
+    def make_handle_stream_function(self, index: int, is_async: bool = False):
+        """Return the chunk level stream function of the index-th request."""
+        if is_async:
+
+            @chunk_stream_function
+            async def ahandle_stream(chunk: str):
+                self._claim(index)
+                if self.handle_stream_function:
+                    return await acall_stream_function(self.handle_stream_function, chunk)
+
+            return ahandle_stream
+
+        @chunk_stream_function
+        def handle_stream(chunk: str):
+            self._claim(index)
+            if self.handle_stream_function:
+                return self.handle_stream_function(chunk)
+
+        return handle_stream
+
+
+@singleton
+class HedgePolicy(BaseModel):
+    enabled: bool = False
+    # The hedge is sent after this percentile of the recent time to first token.
+    percentile: float = 95
+    # The min seconds before the hedge, and the min number of the samples before hedging.
+    min_delay: float = 0.5
+    min_samples: int = 20
+    # The number of the recent time to first token kept per (base_url, model).
+    window: int = 200
+    # The hedges are at most budget_ratio of the requests, with max_burst hedges in a row.
+    budget_ratio: float = 0.05
+    max_burst: float = 5
+    # The arguments (base_url, api_key, model_name) of the alternate backend of the hedge, empty means the same one.
+    backend: Dict[str, Any] = {}
+    ttft_map: Dict[Tuple[str, str], Any] = {}
+    credit: float = 0
+    request_count: int = 0
+    hedge_count: int = 0
+    hedge_win_count: int = 0
+    lock: Any = None
+    executor: Any = None
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self.ttft_map = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="llm_hedge")
+
+    def configure(self, **config):
+        for k, v in config.items():
+            if v is not None:
+                setattr(self, k, v)
+
+    def get_hedge_delay(self, key: Tuple[str, str]) -> Optional[float]:
+        """Return the seconds to wait for the first token before the hedge, None if there are not enough samples."""
+        with self.lock:
+            ttft_list = sorted(self.ttft_map.get(key) or [])
+        if len(ttft_list) < self.min_samples:
+            return None
+        index = min(len(ttft_list) - 1, int(len(ttft_list) * self.percentile / 100))
+        return max(self.min_delay, ttft_list[index])
+
+    def _start(self, key: Tuple[str, str]) -> Optional[float]:
+        with self.lock:
+            self.request_count += 1
+            self.credit = min(self.max_burst, self.credit + self.budget_ratio)
+        return self.get_hedge_delay(key)
+
+    def _take_budget(self) -> bool:
+        with self.lock:
+            if self.credit < 1:
+                return False
+            self.credit -= 1
+            self.hedge_count += 1
+            return True
+
+    def _finish(self, key: Tuple[str, str], race: HedgeRace):
+        with self.lock:
+            if race.first_token_latency is not None:
+                self.ttft_map.setdefault(key, deque(maxlen=self.window)).append(race.first_token_latency)
+            if race.winner == 1:
+                self.hedge_win_count += 1
+
+    @staticmethod
+    def _get_result(future_list: list, get_error) -> Any:
+        """Return the result of the request which succeeded, raise the error of the first request if all failed."""
+        for future in future_list:
+            if get_error(future) is None:
+                return future.result()
+        raise get_error(future_list[0])
+
+    def call(self, key: Tuple[str, str], request_function, handle_stream_function=None, hedge_function=None) -> str:
+        """Call request_function(handle_stream_function), and hedge_function (request_function if it is None) if the
+        first token is late.
+
+        Args:
+            key (Tuple[str, str]): The (base_url, model) of the request.
+            request_function: The function sending the request, it calls the chunk level stream function it is given.
+            hedge_function: The function sending the hedge.
+        """
+        delay = self._start(key)
+        race = HedgeRace(handle_stream_function)
+        future_list = [
+            self.executor.submit(contextvars.copy_context().run, request_function, race.make_handle_stream_function(0))
+        ]
+        future_list[0].add_done_callback(race.notify)
+        deadline = race.start_time + delay if delay is not None else None
+        try:
+            while True:
+                with race.condition:
+                    if race.winner is None and not all(future.done() for future in future_list):
+                        timeout = deadline - time.monotonic() if deadline is not None else None
+                        if timeout is None or timeout > 0:
+                            race.condition.wait(timeout)
+                    winner = race.winner
+                if winner is not None:
+                    return future_list[winner].result()
+                if all(future.done() for future in future_list):
+                    return self._get_result(future_list, lambda future: future.exception())
+                if deadline is not None and time.monotonic() >= deadline:
+                    deadline = None
+                    if self._take_budget():
+                        logger.info(f"No first token of {key[1]} in {delay:.2f} s, send the hedge request")
+                        hedge = self.executor.submit(
+                            contextvars.copy_context().run,
+                            hedge_function or request_function,
+                            race.make_handle_stream_function(1),
+                        )
+                        hedge.add_done_callback(race.notify)
+                        future_list.append(hedge)
+        finally:
+            self._finish(key, race)
+
+    async def acall(
+        self,
+        key: Tuple[str, str],
+        request_coroutine_function,
+        handle_stream_function=None,
+        hedge_coroutine_function=None,
+    ) -> str:
+        """The coroutine version of call, the request which loses the race is cancelled."""
+        delay = self._start(key)
+        loop = asyncio.get_running_loop()
+        first_token_event = asyncio.Event()
+        race = HedgeRace(handle_stream_function, lambda: loop.call_soon_threadsafe(first_token_event.set))
+        task_list = [asyncio.ensure_future(request_coroutine_function(race.make_handle_stream_function(0, True)))]
+        deadline = race.start_time + delay if delay is not None else None
+        try:
+            while True:
+                if race.winner is not None:
+                    for index, task in enumerate(task_list):
+                        if index == race.winner:
+                            continue
+                        if task.done() and not task.cancelled():
+                            # Retrieve the error of the failed loser, so it is not logged as never retrieved.
+                            task.exception()
+                        task.cancel()
+                    return await task_list[race.winner]
+                pending_list = [task for task in task_list if not task.done()]
+                if not pending_list:
+                    return self._get_result(task_list, lambda task: task.exception())
+                timeout = max(0, deadline - time.monotonic()) if deadline is not None else None
+                first_token_task = asyncio.ensure_future(first_token_event.wait())
+                await asyncio.wait(
+                    pending_list + [first_token_task], timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                first_token_task.cancel()
+                if race.winner is None and deadline is not None and time.monotonic() >= deadline:
+                    deadline = None
+                    if self._take_budget():
+                        logger.info(f"No first token of {key[1]} in {delay:.2f} s, send the hedge request")
+                        hedge_coroutine_function = hedge_coroutine_function or request_coroutine_function
+                        task_list.append(
+                            asyncio.ensure_future(hedge_coroutine_function(race.make_handle_stream_function(1, True)))
+                        )
+        except asyncio.CancelledError:
+            for task in task_list:
+                task.cancel()
+            raise
+        finally:
+            self._finish(key, race)
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "request": self.request_count,
+                "hedge": self.hedge_count,
+                "hedge_win": self.hedge_win_count,
+                "credit": self.credit,
+            }
+
+
+def get_hedge_policy() -> HedgePolicy:
+    return HedgePolicy()
@@ -0,0 +1,234 @@
+"""
+Author: Huang Weitao
+Date: 2026-10-18 18:41:37
+LastEditors: Huang Weitao
+LastEditTime: 2026-10-18 18:41:37
+Description: Exact match cache of the LLM response.
+
+The key is the sha256 of (llm type, base url, model, messages, temperature, max tokens), the messages are built the
+same way as the LLM builds the request, so the same request hits the cache no matter which Message class is used.
+The response is kept in an in-memory LRU and in a SQLite database, so the replay and the regression runs hit the
+cache across the processes. The cached response is replayed through the handle_stream_function, so the stream
+consumers (e.g. the file upload of WriteCodeAction) work the same as with the real LLM.
+
+The cache is opt-in, set llm_cache in the global config to enable it. The semantic cache (see semantic_cache.py) is
+asked when the exact match cache is missed.
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from wiseagent.common.const import DATA_PATH
+from wiseagent.common.logs import logger
+from wiseagent.common.protocol_message import STREAM_END_FLAG, Message
+from wiseagent.common.stream_parser import to_chunk_stream_function
+from wiseagent.core.llm.base_llm import BaseLLM, acall_stream_function
+
+# The name of the action which is asking the LLM, set by BaseAction.llm_ask. None if the action does not allow the
+# semantic cache.
+CURRENT_LLM_CALLER: ContextVar[Optional[str]] = ContextVar("CURRENT_LLM_CALLER", default=None)
+
+
+def get_current_llm_caller() -> Optional[str]:
+    return CURRENT_LLM_CALLER.get()
+
+
+class LLMResponseCache(BaseModel):
+    # The max number of the responses in memory.
+    max_size: int = 1024
+    # The response expires after ttl seconds. None means never.
+    ttl: Optional[float] = None
+    # The path of the SQLite database. None means the memory only.
+    path: Optional[Path] = DATA_PATH / "llm_cache.sqlite3"
+    hit_count: int = 0
+    miss_count: int = 0
+    memory_cache: Any = None
+    connection: Any = None
+    lock: Any = None
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        # key -> (response, create time)
+        self.memory_cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.lock = threading.Lock()
+        if self.path is not None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(str(self.path), check_same_thread=False)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, response TEXT, create_time REAL)"
+            )
+            self.connection.commit()
+
+    @staticmethod
+    def make_key(**request) -> str:
+        """Return the stable hash of the request."""
+        data = json.dumps(request, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _is_expired(self, create_time: float) -> bool:
+        return self.ttl is not None and time.time() - create_time > self.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            item = self.memory_cache.get(key)
+            if item is not None and self._is_expired(item[1]):
+                self.memory_cache.pop(key)
+                item = None
+            if item is None and self.connection is not None:
+                row = self.connection.execute(
+                    "SELECT response, create_time FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and self._is_expired(row[1]):
+                    self.connection.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self.connection.commit()
+                elif row is not None:
+                    item = (row[0], row[1])
+                    self._put_memory(key, item)
+            if item is None:
+                self.miss_count += 1
+                return None
+            self.memory_cache.move_to_end(key)
+            self.hit_count += 1
+            return item[0]
+
+    def set(self, key: str, response: str):
+        item = (response, time.time())
+        with self.lock:
+            self._put_memory(key, item)
+            if self.connection is not None:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, response, create_time) VALUES (?, ?, ?)", (key, *item)
+                )
+                self.connection.commit()
+
+    def _put_memory(self, key: str, item: Tuple[str, float]):
+        self.memory_cache[key] = item
+        self.memory_cache.move_to_end(key)
+        while len(self.memory_cache) > self.max_size:
+            self.memory_cache.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.memory_cache.clear()
+            if self.connection is not None:
+                self.connection.execute("DELETE FROM llm_cache")
+                self.connection.commit()
+
+    def get_stats(self) -> dict:
+        total = self.hit_count + self.miss_count
+        return {
+            "hit": self.hit_count,
+            "miss": self.miss_count,
+            "hit_rate": self.hit_count / total if total else 0,
+            "memory_size": len(self.memory_cache),
+        }
+
+
+class CachedLLM(BaseLLM):
+    """Answer the request from the cache, ask the wrapped LLM when the cache is missed."""
+
+    llm: BaseLLM = None
+    # The exact match cache, None if it is not enabled.
+    cache: Optional[LLMResponseCache] = None
+    # The SemanticResponseCache, None if it is not enabled.
+    semantic_cache: Any = None
+
+    def __init__(self, llm: BaseLLM, cache: LLMResponseCache = None, semantic_cache=None):
+        super().__init__(llm=llm, cache=cache, semantic_cache=semantic_cache, llm_type=llm.llm_type)
+
+    def get_request(
+        self,
+        system_prompt: str = None,
+        base_url: str = None,
+        model_name: str = None,
+        temperature: float = None,
+        max_tokens: int = None,
+        **kwargs,
+    ) -> dict:
+        """Return the fields of the request which change the response, except the messages."""
+        return dict(
+            llm_type=self.llm_type,
+            base_url=base_url or self.llm.base_url,
+            model_name=model_name or getattr(self.llm, "openai_model_name", ""),
+            temperature=temperature if temperature is not None else getattr(self.llm, "temperature", None),
+            max_tokens=max_tokens,
+            system_prompt=system_prompt,
+        )
+
+    def lookup(self, memory: List[Message] = None, system_prompt: str = None, **kwargs) -> Tuple[Optional[str], dict]:
+        """Return the cached response (None if it is missed), and the state used to save the response."""
+        messages = self.llm._build_messages(memory or [], system_prompt)
+        request = self.get_request(system_prompt=system_prompt, **kwargs)
+        state = {}
+        if self.cache is not None:
+            state["key"] = self.cache.make_key(messages=messages, **request)
+            rsp = self.cache.get(state["key"])
+            if rsp is not None:
+                return rsp, state
+        if self.semantic_cache is not None and self.semantic_cache.is_enabled():
+            position = next((i for i in range(len(messages) - 1, -1, -1) if messages[i].get("role") == "user"), -1)
+            prompt = messages[position]["content"] if position != -1 else None
+            if prompt:
+                try:
+                    state["vector"] = self.semantic_cache.embed(prompt)
+                except Exception as e:
+                    logger.warning(f"Failed to embed the prompt for the semantic cache: {e}")
+                    return None, state
+                # The messages except the final prompt are hashed into the scope, so they must match exactly.
+                state["scope"] = self.semantic_cache.make_scope(
+                    history=messages[:position] + messages[position + 1 :], **request
+                )
+                rsp = self.semantic_cache.get(state["scope"], state["vector"])
+                if rsp is not None:
+                    return rsp, state
+        return None, state
+
+    def save(self, rsp: str, state: dict):
+        if not rsp:
+            return
+        if "key" in state:
+            self.cache.set(state["key"], rsp)
+        if "vector" in state:
+            self.semantic_cache.set(state["scope"], state["vector"], rsp)
+
+    def llm_ask(
+        self, memory: List[Message] = None, system_prompt: str = None, handle_stream_function=None, **kwargs
+    ) -> str:
+        rsp, state = self.lookup(memory, system_prompt, **kwargs)
+        if rsp is not None:
+            if handle_stream_function:
+                handle_stream_function = to_chunk_stream_function(handle_stream_function)
+                handle_stream_function(rsp)
+                handle_stream_function(STREAM_END_FLAG)
+            return rsp
+        rsp = self.llm.llm_ask(
+            memory=memory, system_prompt=system_prompt, handle_stream_function=handle_stream_function, **kwargs
+        )
+        self.save(rsp, state)
+        return rsp
+
+    async def allm_ask(
+        self, memory: List[Message] = None, system_prompt: str = None, handle_stream_function=None, **kwargs
+    ) -> str:
+        # The lookup may read the database and ask the embedding model, it is run in a thread.
+        rsp, state = await asyncio.to_thread(self.lookup, memory, system_prompt, **kwargs)
+        if rsp is not None:
+            if handle_stream_function:
+                handle_stream_function = to_chunk_stream_function(handle_stream_function)
+                await acall_stream_function(handle_stream_function, rsp)
+                await acall_stream_function(handle_stream_function, STREAM_END_FLAG)
+            return rsp
+        rsp = await self.llm.allm_ask(
+            memory=memory, system_prompt=system_prompt, handle_stream_function=handle_stream_function, **kwargs
+        )
+        await asyncio.to_thread(self.save, rsp, state)
+        return rsp
@@ -5,18 +5,32 @@ LastEditors: Huang Weitao
 LastEditTime: 2024-09-27 01:01:25
 Description: 
 """
+import asyncio
+import functools
 import os
-import threading
+import time
 from pathlib import Path
-from typing import Any, List
+from typing import Any, List, Optional
 
-from openai import AsyncStream, OpenAI
+from openai import AsyncStream, OpenAI, Stream
 from openai.types.chat import ChatCompletionChunk
 
 from wiseagent.common.logs import logger
 from wiseagent.common.protocol_message import STREAM_END_FLAG, Message
 from wiseagent.common.singleton import singleton
-from wiseagent.core.llm.base_llm import BaseLLM
+from wiseagent.common.stream_parser import to_chunk_stream_function
+from wiseagent.core.llm.base_llm import BaseLLM, acall_stream_function
+from wiseagent.core.llm.client_pool import get_client_pool
+from wiseagent.core.llm.hedging import get_hedge_policy
+from wiseagent.core.llm.rate_limiter import (
+    estimate_request_tokens,
+    estimate_tokens,
+    get_rate_limiter,
+    get_rate_limiter_manager,
+    is_retryable_error,
+    is_throttled_error,
+)
+from wiseagent.core.llm.single_flight import get_single_flight
 
 DEBUGE = False
 llm_ask_times = 0
@@ -29,10 +43,7 @@ class OpenAIClient(BaseLLM):
     llm_type: str = "OpenAI"
     base_url: str = ""
     openai_model_name: str = ""
-    semaphore: Any = None
     temperature: float = 1
-    # The number of thread that can call llm_ask at the same time
-    semaphore_size: int = 5
     verbose: bool = False
     count_tokens: bool = False
     tokenizer: Any = None
@@ -44,7 +55,6 @@ class OpenAIClient(BaseLLM):
         api_key=None,
         base_url=None,
         model_name=None,
-        semaphore_size=5,
         temperature=None,
         verbose=True,
         count_tokens=None,
@@ -55,12 +65,11 @@ class OpenAIClient(BaseLLM):
         self.openai_model_name = model_name or os.environ.get("LLM_MODEL_NAME")
         self.temperature = temperature or os.environ.get("LLM_TEMPERATURE", 0.5)
         self.count_tokens = count_tokens or (os.environ.get("LLM_COUNT_TOKENS", "False") == "True")
-        self.semaphore_size = semaphore_size
-        self.semaphore = threading.Semaphore(self.semaphore_size)
         self.verbose = verbose or os.environ.get("LLM_VERBOSE") == "True"
 
     def create_client(self, api_key: str = None, base_url: str = None, temperature: float = 1):
-        """Create a client for the OpenAI API use the given parameters."""
+        """Create a client for the OpenAI API use the given parameters. The client is not pooled, llm_ask borrows the
+        client from the client pool instead."""
         return OpenAI(
             api_key=api_key or self.api_key,
             base_url=base_url or self.base_url,
@@ -83,7 +92,8 @@ class OpenAIClient(BaseLLM):
         Args:
             memory (List[Message], optional): The conversation history. Defaults to None.
             system_prompt (str, optional): The system prompt. Defaults to None.
-            handle_stream_function (function, optional): The function to handle the stream response. Defaults to None.
+            handle_stream_function (function, optional): The function to handle the stream response, it is called once
+                per chunk if it is a chunk_stream_function, otherwise once per character. Defaults to None.
             verbose (bool, optional): Whether to print the response. Defaults to True.
 
             base_url (str, optional): The base url of the API. Defaults to None.
@@ -93,58 +103,231 @@ class OpenAIClient(BaseLLM):
         Returns:
             str: The generated response.
         """
-        # Each request will hold a semaphore to prevent the API from being called too frequently.
         verbose = verbose if verbose is not None else self.verbose
-        with self.semaphore:
-            client = self.create_client(api_key=api_key, base_url=base_url, temperature=temperature or self.temperature)
-            memory = memory or []
-            messages = self._build_messages(memory, system_prompt)
-            response: AsyncStream[ChatCompletionChunk] = client.chat.completions.create(
-                model=model_name or self.openai_model_name,
-                messages=messages,
-                stream=True,
-                temperature=self.temperature,
-                max_tokens=max_tokens,
-            )
+        base_url = base_url or self.base_url
+        model_name = model_name or self.openai_model_name
+        messages = self._build_messages(memory or [], system_prompt)
+        handle_stream_function = to_chunk_stream_function(handle_stream_function)
+        request = dict(
+            messages=messages,
+            api_key=api_key or self.api_key,
+            base_url=base_url,
+            model_name=model_name,
+            max_tokens=max_tokens,
+        )
+        # The identical requests in flight share one upstream call.
+        return get_single_flight().call(
+            self._make_request_key(**request),
+            functools.partial(self._send, verbose=verbose, **request),
+            handle_stream_function,
+        )
+
+    def _send(self, handle_stream_function, verbose: bool = False, **request) -> str:
+        """Send the request, and the hedge request if the hedging is enabled and the first token is late."""
+        hedge_policy = get_hedge_policy()
+        if not hedge_policy.enabled:
+            return self._request(handle_stream_function, verbose=verbose, **request)
+        hedge_request = {**request, **{k: v for k, v in hedge_policy.backend.items() if v}}
+        return hedge_policy.call(
+            (request["base_url"], request["model_name"]),
+            functools.partial(self._request, verbose=verbose, **request),
+            handle_stream_function,
+            functools.partial(self._request, **hedge_request),
+        )
+
+    async def _asend(self, handle_stream_function, verbose: bool = False, **request) -> str:
+        hedge_policy = get_hedge_policy()
+        if not hedge_policy.enabled:
+            return await self._arequest(handle_stream_function, verbose=verbose, **request)
+        hedge_request = {**request, **{k: v for k, v in hedge_policy.backend.items() if v}}
+        return await hedge_policy.acall(
+            (request["base_url"], request["model_name"]),
+            functools.partial(self._arequest, verbose=verbose, **request),
+            handle_stream_function,
+            functools.partial(self._arequest, **hedge_request),
+        )
+
+    def _request(
+        self,
+        handle_stream_function,
+        messages: List[dict],
+        api_key: str,
+        base_url: str,
+        model_name: str,
+        max_tokens: int = None,
+        verbose: bool = False,
+    ) -> str:
+        # Each request holds a slot of the rate limiter of the (base_url, model).
+        limiter = get_rate_limiter(base_url, model_name)
+        prompt_tokens = estimate_request_tokens(messages)
+        estimated_tokens = prompt_tokens + (max_tokens or 0)
+        attempt = 0
+        while True:
+            limiter.acquire(estimated_tokens)
             rsp = ""
-            stream_message = ""
-
-            for chunk in response:
-                chunk_message = chunk.choices[0].delta.content or "" if chunk.choices else ""  # extract the message
-                if verbose:
-                    print(chunk_message, end="")
-                for ch in chunk_message:
-                    if handle_stream_function:
-                        stream_message += ch
-                        stream_message = handle_stream_function(stream_message)
-                rsp += chunk_message
-                # If the queue is not None: the response will be put into the queue.
-            if verbose:
-                    print("\n", end="")
-            # tiktoken
-            if self.count_tokens:
-                temp_model_name = model_name or self.openai_model_name
-                if temp_model_name in ["deepseek-chat", "deepseek-coder"]:
-                    self.count_tokens_fn(messages, rsp)
-                pass
-            if handle_stream_function:
-                handle_stream_function(STREAM_END_FLAG)
-            global DEBUGE, llm_ask_times
-            if DEBUGE:
-                with open("llm.txt", "w", encoding="utf-8") as f:
-                    for index, message in enumerate(messages[:-1]):
-                        f.write(f"=============== {index+1} ==============\n")
-                        f.write(f'role: {message["role"]}\n')
-                        f.write(f'content: {message["content"]}\n')
-
-                    f.write(f"=============== prompt ==============\n")
-                    f.write(f'role: {messages[-1]["role"]}\n')
-                    f.write(f'content: {messages[-1]["content"]}\n')
-                    f.write(f"=============== response ==============\n")
-                    f.write(f"content: {rsp}\n")
+            try:
+                with get_client_pool().use_client(api_key, base_url) as client:
+                    response: Stream[ChatCompletionChunk] = client.chat.completions.create(
+                        model=model_name,
+                        messages=messages,
+                        stream=True,
+                        temperature=self.temperature,
+                        max_tokens=max_tokens,
+                    )
+                    # The stream is closed if it is stopped early (e.g. the hedge lost), so the connection is released.
+                    with response:
+                        for chunk in response:
+                            chunk_message = chunk.choices[0].delta.content or "" if chunk.choices else ""
+                            if verbose:
+                                print(chunk_message, end="")
+                            if handle_stream_function and chunk_message:
+                                handle_stream_function(chunk_message)
+                            rsp += chunk_message
+            except Exception as e:
+                limiter.release(success=False, throttled=is_throttled_error(e))
+                delay = self._get_retry_delay(e, attempt, rsp)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            limiter.release(token_correction=prompt_tokens + estimate_tokens(rsp) - estimated_tokens)
+            break
+        if verbose:
+            print("\n", end="")
+        self._count_tokens(messages, rsp, model_name)
+        if handle_stream_function:
+            handle_stream_function(STREAM_END_FLAG)
+        self._dump_debug(messages, rsp)
+        return rsp
 
+    async def allm_ask(
+        self,
+        memory: List[Message] = None,
+        system_prompt: str = None,
+        handle_stream_function=None,
+        verbose: bool = None,
+        base_url: str = None,
+        model_name: str = None,
+        api_key: str = None,
+        temperature: float = None,
+        max_tokens: int = None,
+    ) -> str:
+        """The coroutine version of llm_ask. The stream is read with the async client on the event loop, so the
+        waiting request does not hold a thread. The handle_stream_function can be a function or a coroutine function.
+        """
+        verbose = verbose if verbose is not None else self.verbose
+        base_url = base_url or self.base_url
+        model_name = model_name or self.openai_model_name
+        messages = self._build_messages(memory or [], system_prompt)
+        handle_stream_function = to_chunk_stream_function(handle_stream_function)
+        request = dict(
+            messages=messages,
+            api_key=api_key or self.api_key,
+            base_url=base_url,
+            model_name=model_name,
+            max_tokens=max_tokens,
+        )
+        # The identical requests in flight share one upstream call, with the requests of llm_ask too.
+        return await get_single_flight().acall(
+            self._make_request_key(**request),
+            functools.partial(self._asend, verbose=verbose, **request),
+            handle_stream_function,
+        )
+
+    async def _arequest(
+        self,
+        handle_stream_function,
+        messages: List[dict],
+        api_key: str,
+        base_url: str,
+        model_name: str,
+        max_tokens: int = None,
+        verbose: bool = False,
+    ) -> str:
+        # The rate limiter is shared with llm_ask.
+        limiter = get_rate_limiter(base_url, model_name)
+        prompt_tokens = estimate_request_tokens(messages)
+        estimated_tokens = prompt_tokens + (max_tokens or 0)
+        attempt = 0
+        while True:
+            await limiter.aacquire(estimated_tokens)
+            rsp = ""
+            try:
+                async with get_client_pool().use_async_client(api_key, base_url) as client:
+                    response: AsyncStream[ChatCompletionChunk] = await client.chat.completions.create(
+                        model=model_name,
+                        messages=messages,
+                        stream=True,
+                        temperature=self.temperature,
+                        max_tokens=max_tokens,
+                    )
+                    async with response:
+                        async for chunk in response:
+                            chunk_message = chunk.choices[0].delta.content or "" if chunk.choices else ""
+                            if verbose:
+                                print(chunk_message, end="")
+                            if handle_stream_function and chunk_message:
+                                await acall_stream_function(handle_stream_function, chunk_message)
+                            rsp += chunk_message
+            except asyncio.CancelledError:
+                # The request is cancelled (e.g. the hedge won), the slot is released without retry.
+                limiter.release(success=False)
+                raise
+            except Exception as e:
+                limiter.release(success=False, throttled=is_throttled_error(e))
+                delay = self._get_retry_delay(e, attempt, rsp)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            limiter.release(token_correction=prompt_tokens + estimate_tokens(rsp) - estimated_tokens)
+            break
+        if verbose:
+            print("\n", end="")
+        self._count_tokens(messages, rsp, model_name)
+        if handle_stream_function:
+            await acall_stream_function(handle_stream_function, STREAM_END_FLAG)
+        self._dump_debug(messages, rsp)
         return rsp
 
+    def _make_request_key(self, **request) -> str:
+        # The request is sent with the temperature of the client.
+        return get_single_flight().make_key(temperature=self.temperature, **request)
+
+    def _get_retry_delay(self, error: Exception, attempt: int, rsp: str) -> Optional[float]:
+        """Return the seconds to wait before retrying the failed request, None if it is not retried. The request is
+        only retried before the stream started, so the stream function never sees the same chunk twice."""
+        manager = get_rate_limiter_manager()
+        if rsp or attempt >= manager.max_retries or not is_retryable_error(error):
+            return None
+        delay = manager.get_retry_delay(attempt, error)
+        logger.warning(f"LLM request failed: {error}, retry {attempt + 1} in {delay:.1f} s")
+        return delay
+
+    def _count_tokens(self, messages: List[dict], rsp: str, model_name: str = None):
+        # tiktoken
+        if self.count_tokens:
+            temp_model_name = model_name or self.openai_model_name
+            if temp_model_name in ["deepseek-chat", "deepseek-coder"]:
+                self.count_tokens_fn(messages, rsp)
+
+    def _dump_debug(self, messages: List[dict], rsp: str):
+        global DEBUGE, llm_ask_times
+        if DEBUGE:
+            with open("llm.txt", "w", encoding="utf-8") as f:
+                for index, message in enumerate(messages[:-1]):
+                    f.write(f"=============== {index+1} ==============\n")
+                    f.write(f'role: {message["role"]}\n')
+                    f.write(f'content: {message["content"]}\n')
+
+                f.write(f"=============== prompt ==============\n")
+                f.write(f'role: {messages[-1]["role"]}\n')
+                f.write(f'content: {messages[-1]["content"]}\n')
+                f.write(f"=============== response ==============\n")
+                f.write(f"content: {rsp}\n")
+
     def count_tokens_fn(self, message, rsp: str):
         """Count tokens for the given message and response."""
         from jinja2 import Template
@@ -0,0 +1,176 @@
+"""
+Author: Huang Weitao
+Date: 2026-10-18 23:52:16
+LastEditors: Huang Weitao
+LastEditTime: 2026-10-18 23:52:16
+Description: Cached, incremental assembly of the prompt of the agent.
+
+Every plan renders the system prompt (the format of the template with the long tools description), fits the memory
+to the context window and converts every message to the dict of the API request, although only a few messages are
+new. The assembler of the agent keeps:
+1. The rendered system prompts, which are rendered again only when the template or one of the arguments changes. A
+   few prompts are kept, since the plan and the other actions render the prompt with different examples.
+2. The converted context of the last plan and the number of the memory messages it covers. The messages appended
+   since then are fitted (see ContextBuilder.fit_message), converted and appended to it. If the context exceeds the
+   budget, the kept messages are dropped in the reverse order of ContextBuilder.build (the lowest salience and the
+   oldest first, the latest min_recent messages are not dropped), so a plan does O(new messages + context) work
+   rather than O(memory). A dropped message is not added back. The context is built again from the whole memory
+   only when the window moves: the budget shrinks below the kept messages, the latest messages alone exceed it, the
+   model changes or the memory is replaced (e.g. the long term memory action trims it). A larger budget is used from
+   the next rebuild.
+The dict of a message is converted once, the rebuild takes it from the cache.
+"""
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from wiseagent.common.protocol_message import Message
+from wiseagent.core.llm.base_llm import convert_message
+from wiseagent.core.llm.context_builder import get_context_builder, get_salience
+
+
+class PromptAssembler(BaseModel):
+    # (template, arguments) -> the rendered system prompt, the oldest one is removed if there are more than
+    # max_system_prompts.
+    system_prompt_map: Dict[Tuple, str] = {}
+    max_system_prompts: int = 8
+    # The messages of the memory which are converted, in the order of the memory.
+    message_list: List[Any] = []
+    # id(message) -> (message, content, converted dict), the content detects the message changed after conversion.
+    converted_map: Dict[int, Tuple[Any, Any, dict]] = {}
+    # The converted context of the last build, None if it must be built again.
+    context_list: Optional[List[dict]] = None
+    # (memory index, tokens, salience) of the messages of context_list, empty if no window is configured.
+    context_entry_list: List[Tuple[int, int, int]] = []
+    # The model, the budget (None if no window is configured) and the tokens of the context of the last build.
+    context_model_name: Optional[str] = None
+    context_budget: Optional[int] = None
+    context_tokens: int = 0
+    lock: Any = None
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self.system_prompt_map = {}
+        self.message_list = []
+        self.converted_map = {}
+        self.context_entry_list = []
+        self.lock = threading.Lock()
+
+    def get_system_prompt(self, template: str, **kwargs) -> str:
+        """Return template.format(**kwargs), rendered again only if the template or the arguments change."""
+        key = (template, tuple(kwargs.items()))
+        with self.lock:
+            system_prompt = self.system_prompt_map.get(key)
+            if system_prompt is None:
+                system_prompt = template.format(**kwargs)
+                if len(self.system_prompt_map) >= self.max_system_prompts:
+                    self.system_prompt_map.pop(next(iter(self.system_prompt_map)))
+                self.system_prompt_map[key] = system_prompt
+            return system_prompt
+
+    def _is_prefix(self, memory: List[Message], memory_count: int) -> bool:
+        """Whether the converted messages are still the head of the memory, i.e. the memory is only appended."""
+        count = len(self.message_list)
+        if count == 0:
+            return True
+        return (
+            memory_count >= count and memory[0] is self.message_list[0] and memory[count - 1] is self.message_list[-1]
+        )
+
+    def _update(self, memory: List[Message], memory_count: int) -> List[Message]:
+        """Convert the messages appended to the memory since the last update, and return them. Called with the lock
+        held. The cache is cleared if the memory is replaced."""
+        if not self._is_prefix(memory, memory_count):
+            self.message_list = []
+            self.converted_map = {}
+            self.context_list = None
+        new_message_list = memory[len(self.message_list) : memory_count]
+        for message in new_message_list:
+            self.message_list.append(message)
+            if type(message) is not dict:
+                self.converted_map[id(message)] = (message, message.content, convert_message(message))
+        return new_message_list
+
+    def convert(self, message) -> dict:
+        entry = self.converted_map.get(id(message))
+        if entry is not None and entry[0] is message and entry[1] is message.content:
+            return entry[2]
+        return convert_message(message)
+
+    def _append_context(
+        self, new_message_list: List[Message], memory_count: int, model_name: str, budget: Optional[int]
+    ) -> bool:
+        """Append the new messages to the context of the last build and drop the old ones which do not fit, return
+        False if the context must be built again. Called with the lock held."""
+        if self.context_list is None or model_name != self.context_model_name:
+            return False
+        context_builder = get_context_builder()
+        if budget is None or self.context_budget is None:
+            if budget is not self.context_budget:
+                return False
+            context_list = self.context_list + [self.convert(message) for message in new_message_list]
+            self.context_list = context_list[-context_builder.last_k :] if context_builder.last_k >= 0 else context_list
+            return True
+        if budget < self.context_tokens:
+            return False
+        tokens = self.context_tokens
+        context_list, entry_list = list(self.context_list), list(self.context_entry_list)
+        for index, message in enumerate(new_message_list, memory_count - len(new_message_list)):
+            message, message_tokens = context_builder.fit_message(message, model_name)
+            context_list.append(self.convert(message))
+            entry_list.append((index, message_tokens, get_salience(message)))
+            tokens += message_tokens
+        if tokens > budget:
+            recent_start = memory_count - context_builder.min_recent
+            drop_list = sorted(
+                (position for position, entry in enumerate(entry_list) if entry[0] < recent_start),
+                key=lambda position: (entry_list[position][2], entry_list[position][0]),
+            )
+            dropped_set = set()
+            for position in drop_list:
+                if tokens <= budget:
+                    break
+                dropped_set.add(position)
+                tokens -= entry_list[position][1]
+            if tokens > budget:
+                return False
+            context_list = [context for position, context in enumerate(context_list) if position not in dropped_set]
+            entry_list = [entry for position, entry in enumerate(entry_list) if position not in dropped_set]
+        self.context_list, self.context_entry_list, self.context_tokens = context_list, entry_list, tokens
+        return True
+
+    def _build_context(
+        self, memory: List[Message], model_name: str, system_prompt: str, prompt: str, budget: Optional[int]
+    ):
+        """Build the context from the whole memory. Called with the lock held."""
+        context_builder = get_context_builder()
+        if budget is None:
+            context_memory = context_builder.build(memory, model_name, system_prompt, prompt)
+            self.context_list = [self.convert(message) for message in context_memory]
+            self.context_entry_list, self.context_tokens = [], 0
+        else:
+            selected_list = context_builder.select(memory, budget, model_name)
+            self.context_list = [self.convert(message) for _, message, _ in selected_list]
+            self.context_entry_list = [
+                (index, tokens, get_salience(message)) for index, message, tokens in selected_list
+            ]
+            self.context_tokens = sum(tokens for _, _, tokens in selected_list)
+        self.context_model_name = model_name
+
+    def build_context(
+        self, memory: List[Message], model_name: str = None, system_prompt: str = "", prompt: str = ""
+    ) -> List[dict]:
+        """Return the dicts of the messages of the memory which fit in the context window of the model (see
+        ContextBuilder.build). The memory is the memory of the agent, which is only appended or replaced.
+        NOTE: The returned list is shared with the next build, do not modify it.
+        """
+        context_builder = get_context_builder()
+        budget = context_builder.get_budget(model_name, system_prompt or "", prompt or "")
+        with self.lock:
+            memory_count = len(memory)
+            new_message_list = self._update(memory, memory_count)
+            if not self._append_context(new_message_list, memory_count, model_name, budget):
+                self._build_context(memory[:memory_count], model_name, system_prompt, prompt, budget)
+            self.context_budget = budget
+            return self.context_list
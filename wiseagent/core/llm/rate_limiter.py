@@ -0,0 +1,298 @@
+"""
+Author: Huang Weitao
+Date: 2026-10-18 20:04:19
+LastEditors: Huang Weitao
+LastEditTime: 2026-10-18 20:04:19
+Description: The rate limiter of the LLM requests.
+
+Each (base_url, model) has one RateLimiter with two token buckets, the requests per minute (rpm) and the tokens per
+minute (tpm) of the provider, and a concurrency limit adjusted AIMD-style: it grows by one after a window of
+successful requests and halves when the provider answers 429 or 5xx. The request which failed with 429, 5xx or a
+connection error before the stream started is retried with jittered exponential backoff.
+
+The tokens of a request are estimated (about 4 characters per token, plus max_tokens) before the request is sent,
+and corrected with the length of the response when the request is released.
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from wiseagent.common.logs import logger
+from wiseagent.common.singleton import singleton
+
+# The approximate number of the characters of one token.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1 if text else 0
+
+
+def estimate_request_tokens(messages: List[dict], max_tokens: int = None) -> int:
+    """Estimate the tokens of the request, the prompt and the max tokens of the response."""
+    prompt_tokens = sum(estimate_tokens(str(message.get("content") or "")) for message in messages)
+    return prompt_tokens + (max_tokens or 0)
+
+
+class TokenBucket(BaseModel):
+    # The number of the tokens refilled per minute, also the capacity of the bucket.
+    capacity: float
+    tokens: float = 0
+    last_refill_time: float = 0
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self.tokens = self.capacity
+        self.last_refill_time = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill_time) * self.capacity / 60)
+        self.last_refill_time = now
+
+    def get_wait_time(self, amount: float, now: float) -> float:
+        """Return the seconds until the amount can be taken, 0 if it can be taken now. The amount larger than the
+        capacity only waits for the full bucket, the bucket goes into debt instead."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0
+        return (amount - self.tokens) * 60 / self.capacity
+
+    def take(self, amount: float):
+        self.tokens -= amount
+
+    def give_back(self, amount: float):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimitConfig(BaseModel):
+    # The requests per minute, None means no limit.
+    rpm: Optional[float] = None
+    # The tokens per minute, None means no limit.
+    tpm: Optional[float] = None
+    # The initial number of the concurrent requests.
+    concurrency: int = 5
+    min_concurrency: int = 1
+    max_concurrency: int = 20
+
+
+class RateLimiter(BaseModel):
+    key: Tuple[str, str]
+    config: RateLimitConfig = RateLimitConfig()
+    request_bucket: Optional[TokenBucket] = None
+    token_bucket: Optional[TokenBucket] = None
+    # The current concurrency limit, the integer part is used.
+    concurrency_limit: float = 5
+    in_flight: int = 0
+    condition: Any = None
+    # Metrics
+    queue_depth: int = 0
+    request_count: int = 0
+    success_count: int = 0
+    throttled_count: int = 0
+    error_count: int = 0
+    total_wait_time: float = 0
+    max_wait_time: float = 0
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self.condition = threading.Condition()
+        self.concurrency_limit = self.config.concurrency
+        if self.config.rpm:
+            self.request_bucket = TokenBucket(capacity=self.config.rpm)
+        if self.config.tpm:
+            self.token_bucket = TokenBucket(capacity=self.config.tpm)
+
+    def _try_acquire(self, tokens: int) -> Optional[float]:
+        """Take the slot if it is free. Return 0 if it is taken, the seconds to wait for the buckets, or None to wait
+        for a running request to be released. The caller holds the lock."""
+        if self.in_flight >= int(self.concurrency_limit):
+            return None
+        now = time.monotonic()
+        wait_time = 0
+        if self.request_bucket is not None:
+            wait_time = max(wait_time, self.request_bucket.get_wait_time(1, now))
+        if self.token_bucket is not None:
+            wait_time = max(wait_time, self.token_bucket.get_wait_time(tokens, now))
+        if wait_time > 0:
+            return wait_time
+        if self.request_bucket is not None:
+            self.request_bucket.take(1)
+        if self.token_bucket is not None:
+            self.token_bucket.take(tokens)
+        self.in_flight += 1
+        self.request_count += 1
+        return 0
+
+    def _record_wait(self, wait_time: float):
+        self.total_wait_time += wait_time
+        self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Wait until the request can be sent, return the wait time in seconds."""
+        start = time.monotonic()
+        with self.condition:
+            self.queue_depth += 1
+            try:
+                while (wait_time := self._try_acquire(tokens)) != 0:
+                    self.condition.wait(timeout=wait_time)
+            finally:
+                self.queue_depth -= 1
+            wait_time = time.monotonic() - start
+            self._record_wait(wait_time)
+        return wait_time
+
+    async def aacquire(self, tokens: int = 0) -> float:
+        """The coroutine version of acquire, the limiter is polled so the event loop is not blocked."""
+        start = time.monotonic()
+        with self.condition:
+            self.queue_depth += 1
+        try:
+            while True:
+                with self.condition:
+                    wait_time = self._try_acquire(tokens)
+                if wait_time == 0:
+                    break
+                await asyncio.sleep(min(wait_time, 0.05) if wait_time is not None else 0.05)
+        finally:
+            with self.condition:
+                self.queue_depth -= 1
+        wait_time = time.monotonic() - start
+        with self.condition:
+            self._record_wait(wait_time)
+        return wait_time
+
+    def release(self, success: bool = True, throttled: bool = False, token_correction: int = 0):
+        """Release the slot of the request.
+
+        Args:
+            success (bool): Whether the request succeeded.
+            throttled (bool): Whether the provider answered 429 or 5xx, the concurrency limit is halved.
+            token_correction (int): The used tokens minus the estimated tokens, the bucket is corrected with it.
+        """
+        with self.condition:
+            self.in_flight -= 1
+            if success:
+                self.success_count += 1
+                # Additive increase: one more slot after concurrency_limit successful requests.
+                self.concurrency_limit = min(
+                    self.config.max_concurrency, self.concurrency_limit + 1 / self.concurrency_limit
+                )
+            elif throttled:
+                self.throttled_count += 1
+                self.concurrency_limit = max(self.config.min_concurrency, self.concurrency_limit / 2)
+                logger.warning(f"LLM {self.key} is throttled, the concurrency limit is {int(self.concurrency_limit)}")
+            else:
+                self.error_count += 1
+            if self.token_bucket is not None and token_correction:
+                if token_correction > 0:
+                    self.token_bucket.take(token_correction)
+                else:
+                    self.token_bucket.give_back(-token_correction)
+            self.condition.notify_all()
+
+    def get_metrics(self) -> dict:
+        with self.condition:
+            return {
+                "queue_depth": self.queue_depth,
+                "in_flight": self.in_flight,
+                "concurrency_limit": int(self.concurrency_limit),
+                "request": self.request_count,
+                "success": self.success_count,
+                "throttled": self.throttled_count,
+                "error": self.error_count,
+                "mean_wait_time": self.total_wait_time / self.request_count if self.request_count else 0,
+                "max_wait_time": self.max_wait_time,
+            }
+
+
+@singleton
+class RateLimiterManager(BaseModel):
+    # The config of the limiters, the key is "default", the model name or "base_url|model".
+    config_map: Dict[str, Dict[str, Any]] = {}
+    # The max number of the retries of the request failed with 429, 5xx or a connection error.
+    max_retries: int = 3
+    # The backoff of the n-th retry is min(retry_max_delay, retry_base_delay * 2 ** n) with jitter.
+    retry_base_delay: float = 1
+    retry_max_delay: float = 30
+    limiter_map: Dict[Tuple[str, str], RateLimiter] = {}
+    lock: Any = None
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self.limiter_map = {}
+        self.lock = threading.Lock()
+
+    def configure(self, rate_limit: Dict[str, Dict[str, Any]] = None, **config):
+        """Update the config. The limiters created before are replaced when they are used next time."""
+        with self.lock:
+            if rate_limit is not None:
+                self.config_map = rate_limit
+                self.limiter_map = {}
+            for k, v in config.items():
+                if v is not None:
+                    setattr(self, k, v)
+
+    def get_config(self, base_url: str, model: str) -> RateLimitConfig:
+        config = dict(self.config_map.get("default") or {})
+        config.update(self.config_map.get(model) or {})
+        config.update(self.config_map.get(f"{base_url}|{model}") or {})
+        return RateLimitConfig(**{k: v for k, v in config.items() if v is not None})
+
+    def get_limiter(self, base_url: str, model: str) -> RateLimiter:
+        key = (base_url or "", model or "")
+        with self.lock:
+            limiter = self.limiter_map.get(key)
+            if limiter is None:
+                limiter = RateLimiter(key=key, config=self.get_config(*key))
+                self.limiter_map[key] = limiter
+            return limiter
+
+    def get_retry_delay(self, attempt: int, error: Exception = None) -> float:
+        """Return the seconds to wait before the attempt-th retry, the Retry-After header of the response is used if
+        it is given."""
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.retry_max_delay)
+        delay = min(self.retry_max_delay, self.retry_base_delay * 2**attempt)
+        # Jitter, so the throttled requests do not retry at the same time.
+        return random.uniform(delay / 2, delay)
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            limiter_list = list(self.limiter_map.values())
+        return {f"{limiter.key[0]}|{limiter.key[1]}": limiter.get_metrics() for limiter in limiter_list}
+
+
+def is_throttled_error(error: Exception) -> bool:
+    """Whether the provider answered 429 or 5xx."""
+    status_code = getattr(error, "status_code", None)
+    return status_code is not None and (status_code == 429 or status_code >= 500)
+
+
+def is_retryable_error(error: Exception) -> bool:
+    from openai import APIConnectionError
+
+    return is_throttled_error(error) or isinstance(error, APIConnectionError)
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def get_rate_limiter_manager() -> RateLimiterManager:
+    return RateLimiterManager()
+
+
+def get_rate_limiter(base_url: str, model: str) -> RateLimiter:
+    return RateLimiterManager().get_limiter(base_url, model)
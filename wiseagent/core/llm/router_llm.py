@@ -0,0 +1,270 @@
+"""
+Author: Huang Weitao
+Date: 2026-10-18 21:26:40
+LastEditors: Huang Weitao
+LastEditTime: 2026-10-18 21:26:40
+Description: The LLM which routes the request to the fastest healthy backend.
+
+The backends are the LLMs of the LLMManager with their own base url, api key and model (e.g. OpenAIClient with
+different providers). The router keeps the rolling latency of the first token and the error rate of each backend,
+and sends the request to the healthy backend with the lowest p50 latency. The backend without samples is tried
+first, so the new backend is measured. The backend which fails several times in a row is skipped for cooldown
+seconds, then it is healthy again.
+
+The request fails over to the next backend if the backend fails or does not send the first token within
+first_token_timeout seconds. After the first token the stream belongs to the caller, the error is raised instead.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from wiseagent.common.logs import logger
+from wiseagent.common.protocol_message import Message
+from wiseagent.common.stream_parser import (
+    chunk_stream_function,
+    to_chunk_stream_function,
+)
+from wiseagent.core.llm.base_llm import BaseLLM, acall_stream_function
+
+
+class FirstTokenTimeoutError(Exception):
+    """The backend does not send the first token in time."""
+
+
+class BackendStats(BaseModel):
+    # The number of the latest requests used by the statistics.
+    window: int = 100
+    latency_list: Any = None
+    # True if the request failed.
+    error_list: Any = None
+    consecutive_error_count: int = 0
+    cooldown_until: float = 0
+    lock: Any = None
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self.latency_list = deque(maxlen=self.window)
+        self.error_list = deque(maxlen=self.window)
+        self.lock = threading.Lock()
+
+    def record_success(self, latency: float):
+        with self.lock:
+            self.latency_list.append(latency)
+            self.error_list.append(False)
+            self.consecutive_error_count = 0
+
+    def record_error(self, max_consecutive_errors: int, cooldown: float):
+        with self.lock:
+            self.error_list.append(True)
+            self.consecutive_error_count += 1
+            if self.consecutive_error_count >= max_consecutive_errors:
+                # The backend is tried again after the cooldown with a clean error history.
+                self.cooldown_until = time.monotonic() + cooldown
+                self.consecutive_error_count = 0
+                self.error_list.clear()
+
+    def get_percentile(self, percentile: float) -> Optional[float]:
+        """Return the latency percentile (0-100), None if no sample."""
+        with self.lock:
+            latency_list = sorted(self.latency_list)
+        if not latency_list:
+            return None
+        return latency_list[min(len(latency_list) - 1, int(len(latency_list) * percentile / 100))]
+
+    def get_error_rate(self) -> float:
+        with self.lock:
+            return sum(self.error_list) / len(self.error_list) if self.error_list else 0
+
+    def is_cooling_down(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+
+class RouterBackend(BaseModel):
+    name: str
+    llm: BaseLLM
+    # The arguments of llm_ask of the backend, e.g. base_url, api_key, model_name.
+    llm_kwargs: Dict[str, Any] = {}
+    stats: BackendStats = None
+
+
+class RouterAttempt:
+    """Forward the stream of one backend to the caller, until the attempt is abandoned."""
+
+    def __init__(self, handle_stream_function=None, on_first_token=None):
+        self.handle_stream_function = handle_stream_function
+        self.on_first_token = on_first_token
+        self.start_time = time.monotonic()
+        self.first_token_latency: Optional[float] = None
+        self.is_abandoned = False
+        self.lock = threading.Lock()
+
+    @property
+    def is_started(self) -> bool:
+        return self.first_token_latency is not None
+
+    def _receive(self):
+        with self.lock:
+            if self.is_abandoned:
+                # Stop the stream of the abandoned backend.
+                raise FirstTokenTimeoutError("The request is sent to another backend")
+            if self.first_token_latency is None:
+                self.first_token_latency = time.monotonic() - self.start_time
+                if self.on_first_token:
+                    self.on_first_token()
+
+    @chunk_stream_function
+    def handle_stream(self, chunk: str):
+        self._receive()
+        if self.handle_stream_function:
+            return self.handle_stream_function(chunk)
+
+    @chunk_stream_function
+    async def ahandle_stream(self, chunk: str):
+        self._receive()
+        if self.handle_stream_function:
+            return await acall_stream_function(self.handle_stream_function, chunk)
+
+    def abandon(self) -> bool:
+        """Abandon the attempt if no token is forwarded, return whether it is abandoned."""
+        with self.lock:
+            if self.first_token_latency is None:
+                self.is_abandoned = True
+            return self.is_abandoned
+
+
+class RouterLLM(BaseLLM):
+    llm_type: str = "Router"
+    backend_list: List[RouterBackend] = []
+    # Fail over if the first token is not received in time, None means no limit.
+    first_token_timeout: Optional[float] = None
+    # The backend whose error rate is above it is only used when no other backend is healthy.
+    max_error_rate: float = 0.5
+    # The backend is skipped for cooldown seconds after max_consecutive_errors errors in a row.
+    max_consecutive_errors: int = 3
+    cooldown: float = 30
+    executor: Any = None
+
+    def __init__(self, backend_list: List[RouterBackend], window: int = 100, **data):
+        super().__init__(backend_list=backend_list, **data)
+        for backend in self.backend_list:
+            backend.stats = BackendStats(window=window)
+        self.executor = ThreadPoolExecutor(thread_name_prefix="router_llm")
+
+    def select_backend_list(self) -> List[RouterBackend]:
+        """Return the backends in the order to try."""
+        healthy_list, unhealthy_list = [], []
+        for backend in self.backend_list:
+            if backend.stats.is_cooling_down() or backend.stats.get_error_rate() > self.max_error_rate:
+                unhealthy_list.append(backend)
+            else:
+                healthy_list.append(backend)
+
+        def get_latency(backend: RouterBackend) -> float:
+            latency = backend.stats.get_percentile(50)
+            return latency if latency is not None else 0
+
+        healthy_list.sort(key=get_latency)
+        unhealthy_list.sort(key=lambda backend: backend.stats.cooldown_until)
+        return healthy_list + unhealthy_list
+
+    def _get_backend_kwargs(self, backend: RouterBackend, kwargs: dict) -> dict:
+        # The endpoint of the backend overrides the one of the agent.
+        return {**kwargs, **{k: v for k, v in backend.llm_kwargs.items() if v is not None}}
+
+    def _record(self, backend: RouterBackend, attempt: RouterAttempt, error: Exception = None):
+        if error is None:
+            latency = attempt.first_token_latency
+            backend.stats.record_success(latency if latency is not None else time.monotonic() - attempt.start_time)
+        else:
+            backend.stats.record_error(self.max_consecutive_errors, self.cooldown)
+
+    def llm_ask(
+        self, memory: List[Message] = None, system_prompt: str = None, handle_stream_function=None, **kwargs
+    ) -> str:
+        handle_stream_function = to_chunk_stream_function(handle_stream_function)
+        last_error = None
+        for backend in self.select_backend_list():
+            first_token_event = threading.Event()
+            attempt = RouterAttempt(handle_stream_function, first_token_event.set)
+            backend_kwargs = self._get_backend_kwargs(backend, kwargs)
+            try:
+                if self.first_token_timeout is None:
+                    rsp = backend.llm.llm_ask(memory, system_prompt, attempt.handle_stream, **backend_kwargs)
+                else:
+                    future = self.executor.submit(
+                        contextvars.copy_context().run,
+                        backend.llm.llm_ask,
+                        memory,
+                        system_prompt,
+                        attempt.handle_stream,
+                        **backend_kwargs,
+                    )
+                    future.add_done_callback(lambda _, event=first_token_event: event.set())
+                    if not first_token_event.wait(self.first_token_timeout) and attempt.abandon():
+                        raise FirstTokenTimeoutError(f"No token in {self.first_token_timeout} s")
+                    rsp = future.result()
+            except Exception as e:
+                self._record(backend, attempt, e)
+                if attempt.is_started:
+                    raise
+                logger.warning(f"LLM backend {backend.name} failed before the first token: {e}")
+                last_error = e
+                continue
+            self._record(backend, attempt)
+            return rsp
+        raise last_error or Exception("No LLM backend is configured")
+
+    async def allm_ask(
+        self, memory: List[Message] = None, system_prompt: str = None, handle_stream_function=None, **kwargs
+    ) -> str:
+        handle_stream_function = to_chunk_stream_function(handle_stream_function)
+        loop = asyncio.get_running_loop()
+        last_error = None
+        for backend in self.select_backend_list():
+            first_token_event = asyncio.Event()
+            # The stream function may be called in the thread of the backend, see BaseLLM.allm_ask.
+            attempt = RouterAttempt(handle_stream_function, lambda: loop.call_soon_threadsafe(first_token_event.set))
+            task = asyncio.ensure_future(
+                backend.llm.allm_ask(
+                    memory, system_prompt, attempt.ahandle_stream, **self._get_backend_kwargs(backend, kwargs)
+                )
+            )
+            try:
+                if self.first_token_timeout is not None:
+                    first_token_task = asyncio.ensure_future(first_token_event.wait())
+                    await asyncio.wait({task, first_token_task}, timeout=self.first_token_timeout)
+                    first_token_task.cancel()
+                    if not task.done() and not first_token_event.is_set() and attempt.abandon():
+                        task.cancel()
+                        raise FirstTokenTimeoutError(f"No token in {self.first_token_timeout} s")
+                rsp = await task
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+            except Exception as e:
+                self._record(backend, attempt, e)
+                if attempt.is_started:
+                    raise
+                logger.warning(f"LLM backend {backend.name} failed before the first token: {e}")
+                last_error = e
+                continue
+            self._record(backend, attempt)
+            return rsp
+        raise last_error or Exception("No LLM backend is configured")
+
+    def get_stats(self) -> dict:
+        return {
+            backend.name: {
+                "p50": backend.stats.get_percentile(50),
+                "p95": backend.stats.get_percentile(95),
+                "error_rate": backend.stats.get_error_rate(),
+                "cooling_down": backend.stats.is_cooling_down(),
+            }
+            for backend in self.backend_list
+        }
@@ -0,0 +1,207 @@
+"""
+Author: Huang Weitao
+Date: 2026-10-18 19:05:52
+LastEditors: Huang Weitao
+LastEditTime: 2026-10-18 19:05:52
+Description: Semantic cache of the LLM response.
+
+The planning prompts often differ only in the timestamps or the message ids, so they never hit the exact match cache.
+The semantic cache embeds the final user prompt and returns the cached response of the most similar prompt if the
+cosine similarity is above the threshold. Only the request with the same scope (llm type, base url, model,
+temperature, max tokens, system prompt and the hash of the messages before the final prompt) is compared, so the same
+prompt after a different conversation does not get the stale response.
+
+The cache is only used by the actions in the allowlist (llm_semantic_cache_actions in the global config), the
+current action is set by BaseAction.llm_ask in CURRENT_LLM_CALLER (llm_cache.py). The action which must never get a
+stale response (e.g. WriteCodeAction) sets allow_semantic_cache to False.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+from wiseagent.common.const import DATA_PATH
+from wiseagent.common.logs import logger
+from wiseagent.core.llm.llm_cache import get_current_llm_caller
+
+
+class SemanticIndex(BaseModel):
+    """The normalized vectors and the responses of one scope."""
+
+    vectors: Any = None
+    response_list: List[str] = []
+    create_time_list: List[float] = []
+    # The rowid of the response in the database, None if it is not saved.
+    row_id_list: List[Optional[int]] = []
+
+    def search(self, vector) -> Tuple[int, float]:
+        """Return the index and the similarity of the nearest vector, (-1, -1) if the index is empty."""
+        if self.vectors is None or len(self.response_list) == 0:
+            return -1, -1.0
+        scores = self.vectors @ vector
+        index = int(np.argmax(scores))
+        return index, float(scores[index])
+
+    def add(self, vector, response: str, create_time: float, max_size: int, row_id: int = None) -> List[int]:
+        """Add the response, return the rowids of the oldest responses removed beyond max_size."""
+        self.vectors = vector[None, :] if self.vectors is None else np.vstack([self.vectors, vector])
+        self.response_list.append(response)
+        self.create_time_list.append(create_time)
+        self.row_id_list.append(row_id)
+        removed_list = []
+        while len(self.response_list) > max_size:
+            removed_list.append(self.remove(0))
+        return [row_id for row_id in removed_list if row_id is not None]
+
+    def remove(self, index: int) -> Optional[int]:
+        """Remove the response, return its rowid."""
+        self.vectors = np.delete(self.vectors, index, axis=0)
+        self.response_list.pop(index)
+        self.create_time_list.pop(index)
+        return self.row_id_list.pop(index)
+
+
+class SemanticResponseCache(BaseModel):
+    # The min cosine similarity of the hit.
+    threshold: float = 0.95
+    # The max number of the responses of one scope.
+    max_size: int = 1024
+    # The response expires after ttl seconds. None means never.
+    ttl: Optional[float] = None
+    # The path of the SQLite database. None means the memory only.
+    path: Optional[Path] = DATA_PATH / "llm_cache.sqlite3"
+    # The actions which use the semantic cache.
+    action_list: List[str] = []
+    # The arguments of EmbeddingFactory.get_embedding, the environment variables are used if it is empty.
+    embedding_config: Dict[str, Any] = {}
+    embedding_model: Any = None
+    index_map: Dict[str, SemanticIndex] = {}
+    connection: Any = None
+    lock: Any = None
+    hit_count: int = 0
+    miss_count: int = 0
+    # The similarity of the nearest prompt of the hits and the misses, used to tune the threshold.
+    hit_similarity_sum: float = 0
+    miss_similarity_sum: float = 0
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self.index_map = {}
+        self.lock = threading.Lock()
+        if self.path is not None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(str(self.path), check_same_thread=False)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS llm_semantic_cache "
+                "(scope TEXT, vector BLOB, response TEXT, create_time REAL)"
+            )
+            self.connection.commit()
+            self._load()
+
+    def _load(self):
+        if self.ttl is not None:
+            self.connection.execute("DELETE FROM llm_semantic_cache WHERE create_time < ?", (time.time() - self.ttl,))
+            self.connection.commit()
+        rows = self.connection.execute(
+            "SELECT rowid, scope, vector, response, create_time FROM llm_semantic_cache ORDER BY create_time"
+        ).fetchall()
+        row_map = {}
+        for row in rows:
+            row_map.setdefault(row[1], []).append(row)
+        # The responses beyond max_size (e.g. max_size is decreased) are deleted, the vectors of one scope are
+        # stacked once.
+        removed_list = []
+        for scope, row_list in row_map.items():
+            removed_list += [row[0] for row in row_list[: -self.max_size]]
+            row_list = row_list[-self.max_size :]
+            self.index_map[scope] = SemanticIndex(
+                vectors=np.vstack([np.frombuffer(row[2], dtype=np.float32) for row in row_list]),
+                response_list=[row[3] for row in row_list],
+                create_time_list=[row[4] for row in row_list],
+                row_id_list=[row[0] for row in row_list],
+            )
+        self._delete_rows(removed_list)
+
+    def _delete_rows(self, row_id_list: List[int]):
+        if self.connection is None or not row_id_list:
+            return
+        self.connection.executemany("DELETE FROM llm_semantic_cache WHERE rowid = ?", [(i,) for i in row_id_list])
+        self.connection.commit()
+
+    def _is_expired(self, create_time: float) -> bool:
+        return self.ttl is not None and time.time() - create_time > self.ttl
+
+    def is_enabled(self) -> bool:
+        """Whether the current action uses the semantic cache."""
+        caller = get_current_llm_caller()
+        return caller is not None and caller in self.action_list
+
+    @staticmethod
+    def make_scope(**request) -> str:
+        data = json.dumps(request, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def embed(self, text: str):
+        """Return the normalized embedding of the text."""
+        if self.embedding_model is None:
+            from wiseagent.tools.embedding.embedding_factory import EmbeddingFactory
+
+            self.embedding_model = EmbeddingFactory.get_embedding(**self.embedding_config)
+        vector = np.asarray(self.embedding_model.embed(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, scope: str, vector) -> Optional[str]:
+        with self.lock:
+            index = self.index_map.get(scope)
+            position, similarity = index.search(vector) if index is not None else (-1, -1.0)
+            if position != -1 and self._is_expired(index.create_time_list[position]):
+                self._delete_rows([row_id for row_id in [index.remove(position)] if row_id is not None])
+                position = -1
+            if position == -1 or similarity < self.threshold:
+                self.miss_count += 1
+                self.miss_similarity_sum += max(similarity, 0)
+                logger.debug(f"LLM semantic cache miss, the nearest similarity: {similarity:.4f}")
+                return None
+            self.hit_count += 1
+            self.hit_similarity_sum += similarity
+            logger.debug(f"LLM semantic cache hit, similarity: {similarity:.4f}")
+            return index.response_list[position]
+
+    def set(self, scope: str, vector, response: str):
+        create_time = time.time()
+        with self.lock:
+            row_id = None
+            if self.connection is not None:
+                row_id = self.connection.execute(
+                    "INSERT INTO llm_semantic_cache (scope, vector, response, create_time) VALUES (?, ?, ?, ?)",
+                    (scope, vector.astype(np.float32).tobytes(), response, create_time),
+                ).lastrowid
+                self.connection.commit()
+            index = self.index_map.setdefault(scope, SemanticIndex())
+            # The evicted responses are deleted from the database too, so the table does not grow without bound.
+            self._delete_rows(index.add(vector, response, create_time, self.max_size, row_id))
+
+    def clear(self):
+        with self.lock:
+            self.index_map = {}
+            if self.connection is not None:
+                self.connection.execute("DELETE FROM llm_semantic_cache")
+                self.connection.commit()
+
+    def get_stats(self) -> dict:
+        total = self.hit_count + self.miss_count
+        return {
+            "hit": self.hit_count,
+            "miss": self.miss_count,
+            "hit_rate": self.hit_count / total if total else 0,
+            "threshold": self.threshold,
+            "mean_hit_similarity": self.hit_similarity_sum / self.hit_count if self.hit_count else 0,
+            "mean_miss_similarity": self.miss_similarity_sum / self.miss_count if self.miss_count else 0,
+        }
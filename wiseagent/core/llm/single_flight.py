@@ -0,0 +1,261 @@
+"""
+Author: Huang Weitao
+Date: 2026-10-18 20:41:06
+LastEditors: Huang Weitao
+LastEditTime: 2026-10-18 20:41:06
+Description: Coalesce the identical LLM requests in flight.
+
+The agents built from the same yaml react to the same broadcast with the same prompt at the same time. The first
+request (the leader) asks the LLM, and the identical requests which arrive before it finishes (the followers) share
+its upstream call: the chunks of the leader are written to a StreamBuffer, every follower reads them with its own
+reader and calls its own handle_stream_function, so the follower that joins late still receives the stream from the
+beginning. The followers get the same response, or the same exception if the upstream call fails.
+
+The failure of the leader itself is not shared with the followers:
+1. If the handle_stream_function of the leader raises (e.g. the router abandons the attempt) or the leader is
+   cancelled, the upstream call goes on for the followers, and the leader gets its own error. The upstream call is
+   stopped only when no follower reads it.
+2. If the upstream call is stopped by the leader in any other way (e.g. KeyboardInterrupt), the followers retry the
+   request.
+The async leader runs the upstream call in a task, so the cancellation of the leader does not cancel it.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from pydantic import BaseModel
+
+from wiseagent.common.logs import logger
+from wiseagent.common.protocol_message import STREAM_END_FLAG
+from wiseagent.common.singleton import singleton
+from wiseagent.common.stream_buffer import StreamBuffer
+from wiseagent.common.stream_parser import chunk_stream_function
+from wiseagent.core.llm.base_llm import acall_stream_function
+
+
+def is_caused_by(error: BaseException, cause: BaseException) -> bool:
+    """Whether the error is the cause or raised while handling it."""
+    while error is not None:
+        if error is cause:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class InFlightRequest(BaseModel):
+    key: str = ""
+    stream_buffer: Any = None
+    rsp: Optional[str] = None
+    # The error of the upstream call, shared with the followers.
+    error: Any = None
+    # The error of the leader itself (its handle_stream_function raised or it is cancelled), not shared.
+    leader_error: Any = None
+    # The upstream call is stopped without a result, the followers retry.
+    is_abandoned: bool = False
+    follower_count: int = 0
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self.stream_buffer = StreamBuffer()
+
+    def tee(self, handle_stream_function=None, is_followed=None):
+        """Return the chunk level stream function of the leader, which writes the chunk to the stream buffer and
+        calls the handle_stream_function of the leader. If the handle_stream_function raises, the error is kept for
+        the leader, and it is raised to stop the upstream call only if is_followed(self) is False."""
+
+        @chunk_stream_function
+        def handle_stream(chunk: str):
+            if chunk != STREAM_END_FLAG:
+                self.stream_buffer.write(chunk)
+            if self.leader_error is None:
+                if handle_stream_function:
+                    try:
+                        return handle_stream_function(chunk)
+                    except BaseException as e:
+                        self.leader_error = e
+                        if not is_followed(self):
+                            raise
+            elif not is_followed(self):
+                raise self.leader_error
+
+        return handle_stream
+
+    def atee(self, handle_stream_function=None, is_followed=None):
+        """The coroutine version of tee. The handle_stream_function can be a function or a coroutine function."""
+
+        @chunk_stream_function
+        async def handle_stream(chunk: str):
+            if chunk != STREAM_END_FLAG:
+                self.stream_buffer.write(chunk)
+            if self.leader_error is None:
+                if handle_stream_function:
+                    try:
+                        return await acall_stream_function(handle_stream_function, chunk)
+                    except BaseException as e:
+                        self.leader_error = e
+                        if not is_followed(self):
+                            raise
+            elif not is_followed(self):
+                raise self.leader_error
+
+        return handle_stream
+
+    def get_result(self) -> str:
+        if self.error is not None:
+            raise self.error
+        return self.rsp
+
+    def get_leader_result(self) -> str:
+        if self.leader_error is not None:
+            raise self.leader_error
+        return self.get_result()
+
+
+@singleton
+class SingleFlight(BaseModel):
+    # Whether the identical requests are coalesced.
+    enabled: bool = True
+    request_map: Dict[str, InFlightRequest] = {}
+    lock: Any = None
+    coalesced_count: int = 0
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self.request_map = {}
+        self.lock = threading.Lock()
+
+    def configure(self, enabled: bool = None):
+        if enabled is not None:
+            self.enabled = enabled
+
+    @staticmethod
+    def make_key(**request) -> str:
+        data = json.dumps(request, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _join(self, key: str) -> Tuple[InFlightRequest, bool]:
+        """Return the request in flight of the key and whether the caller is the leader."""
+        with self.lock:
+            in_flight_request = self.request_map.get(key)
+            if in_flight_request is None:
+                in_flight_request = InFlightRequest(key=key)
+                self.request_map[key] = in_flight_request
+                return in_flight_request, True
+            in_flight_request.follower_count += 1
+            self.coalesced_count += 1
+            return in_flight_request, False
+
+    def _leave(self, in_flight_request: InFlightRequest):
+        with self.lock:
+            in_flight_request.follower_count -= 1
+
+    def _remove(self, in_flight_request: InFlightRequest):
+        """Remove the request, so the identical request after it asks the LLM again. Called with the lock held."""
+        if self.request_map.get(in_flight_request.key) is in_flight_request:
+            self.request_map.pop(in_flight_request.key)
+
+    def _is_followed(self, in_flight_request: InFlightRequest) -> bool:
+        """Called when the leader stops reading the stream. Return whether any follower reads it, otherwise the
+        request is removed, so no follower joins it and the upstream call can be stopped."""
+        with self.lock:
+            if in_flight_request.follower_count > 0:
+                return True
+            self._remove(in_flight_request)
+            return False
+
+    def _finish(self, in_flight_request: InFlightRequest, rsp: str = None, error: BaseException = None):
+        if error is not None and (
+            not isinstance(error, Exception) or is_caused_by(error, in_flight_request.leader_error)
+        ):
+            # The upstream call is stopped by the leader, it is not the error of the request.
+            in_flight_request.is_abandoned = True
+        else:
+            in_flight_request.rsp = rsp
+            in_flight_request.error = error
+        # The request is removed before the stream is closed, so the request after it asks the LLM again.
+        with self.lock:
+            self._remove(in_flight_request)
+        in_flight_request.stream_buffer.close()
+
+    def call(self, key: str, function, handle_stream_function=None) -> str:
+        """Call function(handle_stream_function) if no identical request is in flight, otherwise wait for the request
+        in flight and replay its stream to the handle_stream_function. The handle_stream_function must be a chunk
+        level stream function.
+        """
+        if not self.enabled:
+            return function(handle_stream_function)
+        in_flight_request, is_leader = self._join(key)
+        if is_leader:
+            try:
+                rsp = function(in_flight_request.tee(handle_stream_function, self._is_followed))
+            except BaseException as e:
+                self._finish(in_flight_request, error=e)
+                raise
+            self._finish(in_flight_request, rsp)
+            return in_flight_request.get_leader_result()
+        try:
+            for chunk in in_flight_request.stream_buffer.reader():
+                if handle_stream_function:
+                    handle_stream_function(chunk)
+        finally:
+            self._leave(in_flight_request)
+        if in_flight_request.is_abandoned:
+            logger.info("The leader of the coalesced LLM request stopped, retry the request")
+            return self.call(key, function, handle_stream_function)
+        rsp = in_flight_request.get_result()
+        if handle_stream_function:
+            handle_stream_function(STREAM_END_FLAG)
+        return rsp
+
+    async def acall(self, key: str, coroutine_function, handle_stream_function=None) -> str:
+        """The coroutine version of call. The handle_stream_function can be a function or a coroutine function."""
+        if not self.enabled:
+            return await coroutine_function(handle_stream_function)
+        in_flight_request, is_leader = self._join(key)
+        if is_leader:
+            task = asyncio.ensure_future(self._arun(in_flight_request, coroutine_function, handle_stream_function))
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError as e:
+                # The leader is cancelled, the upstream call goes on if the followers read it.
+                if not task.done():
+                    in_flight_request.leader_error = e
+                    if not self._is_followed(in_flight_request):
+                        task.cancel()
+                raise
+            return in_flight_request.get_leader_result()
+        try:
+            async for chunk in in_flight_request.stream_buffer.reader():
+                if handle_stream_function:
+                    await acall_stream_function(handle_stream_function, chunk)
+        finally:
+            self._leave(in_flight_request)
+        if in_flight_request.is_abandoned:
+            logger.info("The leader of the coalesced LLM request stopped, retry the request")
+            return await self.acall(key, coroutine_function, handle_stream_function)
+        rsp = in_flight_request.get_result()
+        if handle_stream_function:
+            await acall_stream_function(handle_stream_function, STREAM_END_FLAG)
+        return rsp
+
+    async def _arun(self, in_flight_request: InFlightRequest, coroutine_function, handle_stream_function=None):
+        """Run the upstream call of the leader. The result is kept in the in_flight_request."""
+        try:
+            rsp = await coroutine_function(in_flight_request.atee(handle_stream_function, self._is_followed))
+        except BaseException as e:
+            self._finish(in_flight_request, error=e)
+            # The error of the request is raised by the leader and the followers from the in_flight_request.
+            if not isinstance(e, Exception):
+                raise
+            return
+        self._finish(in_flight_request, rsp)
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {"in_flight": len(self.request_map), "coalesced": self.coalesced_count}
+
+
+def get_single_flight() -> SingleFlight:
+    return SingleFlight()
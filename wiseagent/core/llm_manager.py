@@ -9,6 +9,7 @@ Description:
 import importlib
 import os
 import time
+from typing import Any
 
 from loguru import logger
 from pydantic import BaseModel
@@ -16,18 +17,93 @@ from pydantic import BaseModel
 from wiseagent.common.global_config import GlobalConfig
 from wiseagent.core.agent_core import AgentCore
 from wiseagent.core.llm.base_llm import BaseLLM
+from wiseagent.core.llm.client_pool import get_client_pool
+from wiseagent.core.llm.context_builder import get_context_builder
+from wiseagent.core.llm.hedging import get_hedge_policy
+from wiseagent.core.llm.llm_cache import CachedLLM, LLMResponseCache
+from wiseagent.core.llm.rate_limiter import get_rate_limiter_manager
+from wiseagent.core.llm.single_flight import get_single_flight
 
 
 class LLMManager(BaseModel):
     llm_map: dict = {}
+    # The response cache in front of the LLMs, None if llm_cache is not enabled in the global config.
+    llm_cache: Any = None
+    llm_semantic_cache: Any = None
+    cached_llm_map: dict = {}
 
     def __init__(self, global_config: GlobalConfig):
         super().__init__()
         start = time.time()
+        self.init_client_pool(global_config)
+        self.init_rate_limiter(global_config)
+        self.init_hedging(global_config)
+        self.init_context_builder(global_config)
+        self.init_llm_cache(global_config)
         self.init_llm_map(global_config)
+        self.init_router(global_config)
         end = time.time()
         logger.info(f"LLMManager init time: {end - start} s")
 
+    def init_client_pool(self, global_config: GlobalConfig):
+        """Configure the pool of the OpenAI clients shared by the LLMs."""
+        get_client_pool().configure(
+            max_connections=global_config.llm_client_max_connections,
+            max_keepalive_connections=global_config.llm_client_max_keepalive_connections,
+            keepalive_expiry=global_config.llm_client_keepalive_expiry,
+            idle_timeout=global_config.llm_client_idle_timeout,
+        )
+
+    def init_rate_limiter(self, global_config: GlobalConfig):
+        """Configure the rate limiters and the coalescing of the LLM requests."""
+        get_rate_limiter_manager().configure(
+            rate_limit=global_config.llm_rate_limit,
+            max_retries=global_config.llm_max_retries,
+            retry_base_delay=global_config.llm_retry_base_delay,
+            retry_max_delay=global_config.llm_retry_max_delay,
+        )
+        get_single_flight().configure(enabled=global_config.llm_coalesce_requests)
+
+    def init_hedging(self, global_config: GlobalConfig):
+        """Configure the hedging of the slow LLM requests."""
+        get_hedge_policy().configure(
+            enabled=global_config.llm_hedge,
+            percentile=global_config.llm_hedge_percentile,
+            min_delay=global_config.llm_hedge_min_delay,
+            budget_ratio=global_config.llm_hedge_budget,
+            backend=global_config.llm_hedge_backend,
+        )
+
+    def init_context_builder(self, global_config: GlobalConfig):
+        """Configure the token budget of the memory sent to the LLMs."""
+        get_context_builder().configure(
+            context_window_map=global_config.llm_context_window,
+            reserved_tokens=global_config.llm_context_reserved_tokens,
+            max_message_tokens=global_config.llm_context_max_message_tokens,
+            min_recent=global_config.llm_context_min_recent,
+        )
+
+    def init_llm_cache(self, global_config: GlobalConfig):
+        if global_config.llm_cache:
+            cache_config = {
+                "max_size": global_config.llm_cache_size,
+                "ttl": global_config.llm_cache_ttl,
+                "path": global_config.llm_cache_path,
+            }
+            self.llm_cache = LLMResponseCache(**{k: v for k, v in cache_config.items() if v is not None})
+        if global_config.llm_semantic_cache:
+            from wiseagent.core.llm.semantic_cache import SemanticResponseCache
+
+            cache_config = {
+                "threshold": global_config.llm_semantic_cache_threshold,
+                "max_size": global_config.llm_cache_size,
+                "ttl": global_config.llm_cache_ttl,
+                "path": global_config.llm_cache_path,
+                "action_list": global_config.llm_semantic_cache_actions,
+                "embedding_config": global_config.llm_semantic_cache_embedding,
+            }
+            self.llm_semantic_cache = SemanticResponseCache(**{k: v for k, v in cache_config.items() if v is not None})
+
     def init_llm_map(self, global_config: GlobalConfig):
         for llm_module_path in global_config.llm_module_path:
             llm_module = importlib.import_module(llm_module_path)
@@ -36,6 +112,26 @@ class LLMManager(BaseModel):
             llm_model = llm_module.get_llm()
             self.llm_map[llm_model.llm_type] = llm_model
 
+    def init_router(self, global_config: GlobalConfig):
+        """Register the "Router" LLM if its backends are configured."""
+        if not global_config.llm_router_backends:
+            return
+        from wiseagent.core.llm.router_llm import RouterBackend, RouterLLM
+
+        backend_list = []
+        for index, backend_config in enumerate(global_config.llm_router_backends):
+            backend_config = dict(backend_config)
+            llm_type = backend_config.pop("llm_type")
+            if llm_type not in self.llm_map:
+                raise Exception(f"LLM {llm_type} of the router backend not found")
+            name = backend_config.pop("name", None) or f"{llm_type}-{index}"
+            backend_list.append(RouterBackend(name=name, llm=self.llm_map[llm_type], llm_kwargs=backend_config))
+        router_config = {
+            "first_token_timeout": global_config.llm_router_first_token_timeout,
+            "cooldown": global_config.llm_router_cooldown,
+        }
+        self.register(RouterLLM(backend_list, **{k: v for k, v in router_config.items() if v is not None}))
+
     def register(self, obj: BaseLLM):
         self.llm_map[obj.llm_type] = obj
 
@@ -52,4 +148,10 @@ class LLMManager(BaseModel):
             if llm_type is None or llm_type not in self.llm_map:
                 raise Exception(f"Default LLM {llm_type} not found")
             logger.info(f"Using default LLM {llm_type}")
-        return self.llm_map[llm_type]
+        if self.llm_cache is None and self.llm_semantic_cache is None:
+            return self.llm_map[llm_type]
+        cached_llm = self.cached_llm_map.get(llm_type)
+        if cached_llm is None or cached_llm.llm is not self.llm_map[llm_type]:
+            cached_llm = CachedLLM(self.llm_map[llm_type], self.llm_cache, self.llm_semantic_cache)
+            self.cached_llm_map[llm_type] = cached_llm
+        return cached_llm
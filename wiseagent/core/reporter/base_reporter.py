@@ -7,6 +7,7 @@ Description:
 """
 
 from abc import ABC, abstractmethod
+from typing import List
 
 from pydantic import BaseModel
 
@@ -17,6 +18,25 @@ class BaseReporter(BaseModel, ABC):
     """
 
     name: str = "BaseReporter"
+    # The monitor will dispatch the message to every reporter in its own worker thread with a bounded inbox.
+    # When the inbox is full, the overflow_policy (drop_oldest, coalesce, block) decide what to do. "block" stalls the
+    # dispatch to every reporter until this one catches up, use it only for the reporter that must not lose messages.
+    inbox_size: int = 1000
+    overflow_policy: str = "drop_oldest"
+    # The env_handle_type (see EnvironmentHandleType) and the sender the reporter care about.
+    # None means all, the monitor will only dispatch the subscribed messages to the reporter.
+    subscribe_handle_types: List[str] = None
+    subscribe_senders: List[str] = None
+
+    def is_subscribed(self, env_handle_type, send_from) -> bool:
+        """Return True if the reporter want to receive the message with the env_handle_type and the sender."""
+        if self.subscribe_handle_types is not None and env_handle_type not in self.subscribe_handle_types:
+            return False
+        if self.subscribe_senders is not None and send_from not in [
+            sender.lower() for sender in self.subscribe_senders
+        ]:
+            return False
+        return True
 
     @abstractmethod
     def handle_stream_message(self, report_data) -> bool:
@@ -0,0 +1,136 @@
+"""
+Author: Huang Weitao
+Date: 2026-10-18 15:50:02
+LastEditors: Huang Weitao
+LastEditTime: 2026-10-18 15:50:02
+Description: Dispatch worker of the reporter. Every reporter registered to the monitor owns a worker thread and a
+bounded inbox, so a slow reporter (e.g. one that is reading a long stream) will not block the others.
+"""
+import threading
+from collections import deque
+from typing import Any
+
+from pydantic import BaseModel
+
+from wiseagent.common.logs import logger
+from wiseagent.common.protocol_message import Message
+
+
+class ReporterOverflowPolicy:
+    # Block the monitor until the reporter takes a message from the inbox. It stalls the dispatch to all the reporters,
+    # so it is opt-in for the reporter that must not lose messages.
+    BLOCK = "block"
+    # Drop the oldest message in the inbox.
+    DROP_OLDEST = "drop_oldest"
+    # Replace the pending message with the same env_handle_type and sender, otherwise drop the oldest message.
+    COALESCE = "coalesce"
+
+
+class ReporterWorker(BaseModel):
+    """Deliver the messages to one reporter in its own thread."""
+
+    reporter: Any = None
+    inbox_size: int = 1000
+    overflow_policy: str = ReporterOverflowPolicy.DROP_OLDEST
+    # The number of messages dropped because of the overflow policy.
+    drop_count: int = 0
+
+    _inbox: Any = None
+    _condition: Any = None
+    _thread: Any = None
+    _is_running: bool = False
+
+    def __init__(self, reporter, inbox_size: int = None, overflow_policy: str = None):
+        super().__init__(reporter=reporter)
+        self.inbox_size = inbox_size or getattr(reporter, "inbox_size", None) or self.inbox_size
+        self.overflow_policy = overflow_policy or getattr(reporter, "overflow_policy", None) or self.overflow_policy
+        if self.overflow_policy not in [
+            ReporterOverflowPolicy.BLOCK,
+            ReporterOverflowPolicy.DROP_OLDEST,
+            ReporterOverflowPolicy.COALESCE,
+        ]:
+            raise ValueError(f"Unknown overflow policy {self.overflow_policy}")
+        self._inbox = deque()
+        self._condition = threading.Condition()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._is_running = True
+        self._thread = threading.Thread(target=self._run, name=f"ReporterWorker-{self.reporter.name}")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self, timeout: float = None):
+        """Stop the worker after the messages in the inbox are delivered."""
+        with self._condition:
+            self._is_running = False
+            self._condition.notify_all()
+        if self._thread is not None and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def qsize(self):
+        return len(self._inbox)
+
+    def put(self, message: Message):
+        """Put the message into the inbox. If the inbox is full, handle it according to the overflow policy. The
+        inbox never exceeds inbox_size: if the worker is not running (not started or closed), nobody takes the
+        messages, so the oldest one is dropped instead of waiting."""
+        with self._condition:
+            while len(self._inbox) >= self.inbox_size:
+                if self.overflow_policy != ReporterOverflowPolicy.BLOCK and self._make_room(message):
+                    break
+                if not self._is_running:
+                    pending = self._inbox.popleft()
+                    self.drop_count += 1
+                    logger.debug(f"Worker of {self.reporter.name} is not running, drop message {pending.message_id}")
+                    break
+                self._condition.wait()
+            self._inbox.append(message)
+            self._condition.notify_all()
+
+    def _make_room(self, message: Message) -> bool:
+        """Drop a pending message to make room for the new one. The stream message is never dropped.
+        Returns:
+            bool: True if a message is dropped.
+        """
+        if self.overflow_policy == ReporterOverflowPolicy.COALESCE and not message.is_stream:
+            for index, pending in enumerate(self._inbox):
+                if (
+                    not pending.is_stream
+                    and pending.env_handle_type == message.env_handle_type
+                    and pending.send_from == message.send_from
+                ):
+                    del self._inbox[index]
+                    self.drop_count += 1
+                    return True
+        for index, pending in enumerate(self._inbox):
+            if not pending.is_stream:
+                del self._inbox[index]
+                self.drop_count += 1
+                logger.debug(f"Inbox of {self.reporter.name} is full, drop message {pending.message_id}")
+                return True
+        return False
+
+    def _get(self):
+        with self._condition:
+            while not self._inbox and self._is_running:
+                self._condition.wait()
+            if not self._inbox:
+                return None
+            message = self._inbox.popleft()
+            self._condition.notify_all()
+            return message
+
+    def _run(self):
+        while True:
+            message = self._get()
+            if message is None:
+                break
+            try:
+                if message.is_stream:
+                    self.reporter.handle_stream_message(message)
+                else:
+                    self.reporter.handle_message(message)
+            except Exception as e:
+                logger.exception(f"Reporter {self.reporter.name} failed to handle message {message.message_id}: {e}")
@@ -5,12 +5,12 @@ LastEditors: Huang Weitao
 LastEditTime: 2024-09-20 22:44:46
 Description: ()
 """
-import queue
 from typing import List
 
 from wiseagent.common.logs import logger
-from wiseagent.common.protocol_message import STREAM_END_FLAG, Message
+from wiseagent.common.protocol_message import Message
 from wiseagent.common.singleton import singleton
+from wiseagent.common.stream_buffer import iter_stream
 from wiseagent.core.agent import Agent
 from wiseagent.core.reporter.base_reporter import BaseReporter
 
@@ -22,14 +22,7 @@ class TextReporter(BaseReporter):
     def handle_stream_message(self, report_message: Message) -> bool:
         """the single agent report will report the message to the website."""
         logger.info(f"{report_message.send_from}:")
-        stream_queue = report_message.stream_queue
-        while True:
-            try:
-                message_block = stream_queue.get(timeout=1)
-            except queue.Empty:
-                continue
-            if message_block == None or message_block == STREAM_END_FLAG:
-                break
+        for message_block in iter_stream(report_message.stream_queue):
             logger.info(message_block)
         return True
 
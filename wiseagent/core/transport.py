@@ -0,0 +1,474 @@
+"""
+Author: Huang Weitao
+Date: 2026-10-18 16:42:10
+LastEditors: Huang Weitao
+LastEditTime: 2026-10-18 16:42:10
+Description: Spread the agent society across several AgentCore nodes.
+
+Every node owns a transport (the TCP SocketTransport, or the in-process LocalTransport for the test on one host) and
+a NodeRegistry which maps the agent name to the node it lives on. The agent on another node is represented by a
+RemoteAgentProxy in the routing table of the local receiver, so the routing (including the broadcast of
+send_to == "all") is the same as the single node mode. BaseReceiver.add_message and EnvBaseReporter.add_message ask
+the node to route the message first, the message to a remote agent is sent to its node directly.
+
+The nodes announce their agents to each other with the sync frame. If report_node is set, the node forwards all the
+messages reported by its agents to the monitor of the report node, where the environment lives.
+"""
+import json
+import socket
+import struct
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from pydantic import BaseModel
+
+from wiseagent.common.global_config import GlobalConfig
+from wiseagent.common.logs import logger
+from wiseagent.common.message_codec import decode_message, encode_message_parts
+from wiseagent.common.protocol_message import Message
+from wiseagent.common.stream_buffer import StreamBuffer, iter_stream
+from wiseagent.core.reporter.base_reporter import BaseReporter
+
+
+class TransportType:
+    LOCAL = "local"
+    SOCKET = "socket"
+
+
+class TransportFrame:
+    """The frame type between the nodes."""
+
+    # Announce the agents of the node to the peer.
+    SYNC = "sync"
+    # Deliver the message to an agent of the peer.
+    DELIVER = "deliver"
+    # Forward the reported message to the monitor of the peer.
+    REPORT = "report"
+    STREAM_START = "stream_start"
+    STREAM_CHUNK = "stream_chunk"
+    STREAM_END = "stream_end"
+
+
+# The frame on the wire: body size (uint32) | meta size (uint32) | meta (json) | message (message_codec frame)
+_FRAME_PREFIX = struct.Struct(">II")
+_BODY_SIZE = struct.Struct(">I")
+_META_SIZE = struct.Struct(">I")
+# The frame smaller than this is joined into one buffer before sending, the larger one is sent part by part.
+_JOIN_FRAME_SIZE = 64 * 1024
+
+
+def encode_frame_parts(frame: dict) -> List[Union[bytes, memoryview]]:
+    """Encode the frame to a list of buffers. The file content of the message is not copied."""
+    message = frame.get("message", None)
+    meta = json.dumps({key: value for key, value in frame.items() if key != "message"}, ensure_ascii=False)
+    meta = meta.encode("utf-8")
+    message_parts = encode_message_parts(message) if message is not None else []
+    body_size = _META_SIZE.size + len(meta) + sum(memoryview(part).nbytes for part in message_parts)
+    return [_FRAME_PREFIX.pack(body_size, len(meta)) + meta] + message_parts
+
+
+def decode_frame(body: Union[bytes, bytearray, memoryview]) -> dict:
+    """Decode the body of a frame (without the body size prefix)."""
+    view = memoryview(body)
+    (meta_size,) = _META_SIZE.unpack_from(view)
+    offset = _META_SIZE.size + meta_size
+    frame = json.loads(bytes(view[_META_SIZE.size : offset]))
+    if len(view) > offset:
+        frame["message"] = decode_message(view[offset:])
+    return frame
+
+
+class BaseTransport(BaseModel, ABC):
+    """Send the frames to the other nodes and pass the received frames to the handler."""
+
+    # The address of this node, e.g. "127.0.0.1:7100" for the socket transport.
+    address: str = ""
+    _handle_frame: Any = None
+
+    @abstractmethod
+    def start(self, handle_frame: Callable[[dict], None]):
+        """Start to receive the frames. handle_frame is called for every received frame."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def send(self, address: str, frame: dict):
+        """Send the frame to the node at the address.
+        Raise:
+            ConnectionError: If the node is not reachable.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+# The LocalTransport started in this process, map the address to the transport.
+_local_transport_map: Dict[str, "LocalTransport"] = {}
+_local_transport_lock = threading.Lock()
+
+
+class LocalTransport(BaseTransport):
+    """Loopback transport between the nodes in the same process. The frame is encoded and decoded as the socket
+    transport does, so the node can be tested on one host without any network service."""
+
+    def start(self, handle_frame: Callable[[dict], None]):
+        self._handle_frame = handle_frame
+        with _local_transport_lock:
+            if _local_transport_map.get(self.address, self) is not self:
+                raise Exception(f"Local transport {self.address} is already started")
+            _local_transport_map[self.address] = self
+
+    def send(self, address: str, frame: dict):
+        target = _local_transport_map.get(address, None)
+        if target is None or target._handle_frame is None:
+            raise ConnectionError(f"Local transport {address} is not started")
+        data = b"".join(encode_frame_parts(frame))
+        target._handle_frame(decode_frame(memoryview(data)[_BODY_SIZE.size :]))
+
+    def close(self):
+        with _local_transport_lock:
+            if _local_transport_map.get(self.address, None) is self:
+                del _local_transport_map[self.address]
+
+
+class SocketTransport(BaseTransport):
+    """TCP transport. The frame is a 4 bytes length prefix and the body, see encode_frame_parts. One connection is
+    kept for every peer."""
+
+    connect_timeout: float = 5
+    _server: Any = None
+    _accept_thread: Any = None
+    # Map the address of the peer to the outgoing connection and its lock.
+    _connection_map: Dict[str, Any] = {}
+    _connection_lock: Any = None
+    _is_running: bool = False
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self._connection_map = {}
+        self._connection_lock = threading.Lock()
+
+    @staticmethod
+    def _split_address(address: str):
+        host, port = address.rsplit(":", 1)
+        return host, int(port)
+
+    def start(self, handle_frame: Callable[[dict], None]):
+        if self._is_running:
+            return
+        self._handle_frame = handle_frame
+        self._server = socket.create_server(self._split_address(self.address))
+        self._is_running = True
+        self._accept_thread = threading.Thread(target=self._accept, name=f"SocketTransport-{self.address}")
+        self._accept_thread.daemon = True
+        self._accept_thread.start()
+
+    def _accept(self):
+        while self._is_running:
+            try:
+                connection, _ = self._server.accept()
+            except OSError:
+                break
+            thread = threading.Thread(target=self._read, args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    @staticmethod
+    def _read_exact(connection, size: int) -> bytearray:
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            block_size = connection.recv_into(view[received:])
+            if not block_size:
+                raise ConnectionError("Connection closed")
+            received += block_size
+        return buffer
+
+    def _read(self, connection):
+        with connection:
+            while self._is_running:
+                try:
+                    (size,) = _BODY_SIZE.unpack(self._read_exact(connection, _BODY_SIZE.size))
+                    body = self._read_exact(connection, size)
+                except (ConnectionError, OSError):
+                    break
+                try:
+                    self._handle_frame(decode_frame(body))
+                except Exception as e:
+                    logger.exception(f"Failed to handle the frame from the peer: {e}")
+
+    def _get_connection(self, address: str):
+        with self._connection_lock:
+            if address not in self._connection_map:
+                connection = socket.create_connection(self._split_address(address), timeout=self.connect_timeout)
+                connection.settimeout(None)
+                connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self._connection_map[address] = (connection, threading.Lock())
+            return self._connection_map[address]
+
+    def _drop_connection(self, address: str):
+        with self._connection_lock:
+            connection, _ = self._connection_map.pop(address, (None, None))
+        if connection is not None:
+            connection.close()
+
+    def send(self, address: str, frame: dict):
+        parts = encode_frame_parts(frame)
+        if sum(memoryview(part).nbytes for part in parts) < _JOIN_FRAME_SIZE:
+            parts = [b"".join(parts)]
+        # Retry once with a new connection, the peer may have been restarted.
+        for retry in range(2):
+            try:
+                connection, lock = self._get_connection(address)
+                with lock:
+                    for part in parts:
+                        connection.sendall(part)
+                return
+            except OSError as e:
+                self._drop_connection(address)
+                if retry:
+                    raise ConnectionError(f"Failed to send the frame to {address}: {e}")
+
+    def close(self):
+        self._is_running = False
+        if self._server is not None:
+            self._server.close()
+        for address in list(self._connection_map.keys()):
+            self._drop_connection(address)
+
+
+def get_transport(transport_type: str, address: str) -> BaseTransport:
+    if transport_type == TransportType.LOCAL:
+        return LocalTransport(address=address)
+    if transport_type == TransportType.SOCKET:
+        return SocketTransport(address=address)
+    raise ValueError(f"Unknown transport type {transport_type}")
+
+
+class NodeRegistry(BaseModel):
+    """Map the agent name (lower case) to the node id, and the node id to its address."""
+
+    node_address_map: Dict[str, str] = {}
+    agent_node_map: Dict[str, str] = {}
+    _lock: Any = None
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self._lock = threading.Lock()
+
+    def register_node(self, node_id: str, address: str):
+        with self._lock:
+            self.node_address_map[node_id] = address
+
+    def get_node_address(self, node_id: str) -> str:
+        return self.node_address_map.get(node_id, None)
+
+    def register_agent(self, agent_name: str, node_id: str):
+        with self._lock:
+            self.agent_node_map[agent_name.lower()] = node_id
+
+    def unregister_agent(self, agent_name: str):
+        with self._lock:
+            self.agent_node_map.pop(agent_name.lower(), None)
+
+    def get_agent_node(self, agent_name: str) -> str:
+        return self.agent_node_map.get(agent_name.lower(), None)
+
+    def get_node_agent_list(self, node_id: str) -> List[str]:
+        return [name for name, agent_node in self.agent_node_map.items() if agent_node == node_id]
+
+
+class RemoteAgentProxy(BaseModel):
+    """The agent living on another node. It is registered in the routing table of the local receiver."""
+
+    name: str
+    node_id: str
+    is_activate: bool = False
+    node: Any = None
+
+    def add_memory(self, message: Message, from_env=False):
+        self.node.send_frame(
+            self.node_id, {"type": TransportFrame.DELIVER, "agent_name": self.name, "message": message}
+        )
+
+
+class NodeReporter(BaseReporter):
+    """Forward all the messages reported by the agents of this node to the monitor of the report node."""
+
+    name: str = "NodeReporter"
+    node: Any = None
+    report_node: str = ""
+
+    def handle_message(self, report_message: Message) -> bool:
+        self.node.send_frame(self.report_node, {"type": TransportFrame.REPORT, "message": report_message})
+        return True
+
+    def handle_stream_message(self, report_message: Message) -> bool:
+        message_id = report_message.message_id
+        self.node.send_frame(self.report_node, {"type": TransportFrame.STREAM_START, "message": report_message})
+        for message_block in iter_stream(report_message.stream_queue):
+            self.node.send_frame(
+                self.report_node,
+                {"type": TransportFrame.STREAM_CHUNK, "message_id": message_id, "message_block": message_block},
+            )
+        self.node.send_frame(self.report_node, {"type": TransportFrame.STREAM_END, "message_id": message_id})
+        return True
+
+
+class AgentNode(BaseModel):
+    """One AgentCore in the distributed agent society."""
+
+    node_id: str
+    transport: Any = None
+    registry: Any = None
+    # The node whose monitor receives the messages reported by the agents of this node. None means local only.
+    report_node: Optional[str] = None
+    # The receiver and the monitor of this node, the ones of the agent core by default.
+    receiver: Any = None
+    monitor: Any = None
+    # The stream message rebuilt from the peer, map the message id to the local stream buffer.
+    stream_queue_map: Dict[str, Any] = {}
+    _reporter: Any = None
+
+    def __init__(self, node_id: str, transport: BaseTransport, peer_map: Dict[str, str] = None, **data):
+        super().__init__(node_id=node_id, transport=transport, registry=NodeRegistry(), **data)
+        self.stream_queue_map = {}
+        self.registry.register_node(node_id, transport.address)
+        for peer_id, address in (peer_map or {}).items():
+            self.registry.register_node(peer_id, address)
+
+    @classmethod
+    def from_global_config(cls, global_config: GlobalConfig) -> "AgentNode":
+        transport = get_transport(global_config.node_transport or TransportType.SOCKET, global_config.node_address)
+        return cls(
+            node_id=global_config.node_id,
+            transport=transport,
+            peer_map=global_config.node_peers,
+            report_node=global_config.report_node,
+        )
+
+    def _get_receiver(self):
+        if self.receiver is None:
+            from wiseagent.core.agent_core import get_agent_core
+
+            self.receiver = get_agent_core().get_receiver()
+        return self.receiver
+
+    def _get_monitor(self):
+        if self.monitor is None:
+            from wiseagent.core.agent_core import get_agent_core
+
+            self.monitor = get_agent_core().get_monitor()
+        return self.monitor
+
+    def get_peer_list(self) -> List[str]:
+        return [node_id for node_id in self.registry.node_address_map if node_id != self.node_id]
+
+    def start(self):
+        self.transport.start(self.handle_frame)
+        if self.report_node and self.report_node != self.node_id:
+            self._reporter = NodeReporter(node=self, report_node=self.report_node)
+            self._get_monitor().register(self._reporter)
+        # The peer may not be started yet, it will send its sync frame to this node when it starts.
+        for peer_id in self.get_peer_list():
+            self.sync(peer_id, reply=True)
+        logger.info(f"Agent node {self.node_id} start at {self.transport.address}")
+
+    def close(self):
+        if self._reporter is not None:
+            self._get_monitor().unregister(self._reporter)
+        self.transport.close()
+
+    def send_frame(self, node_id: str, frame: dict) -> bool:
+        """Send the frame to the node. Returns False if the node is unknown or not reachable."""
+        address = self.registry.get_node_address(node_id)
+        if address is None:
+            logger.error(f"Node {node_id} is not registered")
+            return False
+        try:
+            self.transport.send(address, dict(frame, node_id=self.node_id))
+            return True
+        except ConnectionError as e:
+            logger.warning(f"Node {node_id} is not reachable: {e}")
+            return False
+
+    def get_local_agent_list(self) -> List[str]:
+        """The agents living on this node (including the agents in the shard processes of this node)."""
+        return [
+            name
+            for name, agent in list(self._get_receiver().route_map.items())
+            if not isinstance(agent, RemoteAgentProxy)
+        ]
+
+    def sync(self, node_id: str, reply: bool = False):
+        """Announce the local agents to the node. If reply is True, the node will announce its agents back."""
+        self.send_frame(
+            node_id, {"type": TransportFrame.SYNC, "agent_list": self.get_local_agent_list(), "reply": reply}
+        )
+
+    def announce(self):
+        """Announce the local agents to all the peers. Call it when a local agent is added or removed."""
+        for peer_id in self.get_peer_list():
+            self.sync(peer_id)
+
+    def route(self, message: Message) -> bool:
+        """Send the message to the node of its receiver.
+        Returns:
+            bool: True if the receiver is a remote agent and the message has been sent.
+        """
+        if not message.send_to or message.send_to == "all":
+            return False
+        node_id = self.registry.get_agent_node(message.send_to)
+        if node_id is None or node_id == self.node_id:
+            return False
+        agent_frame = {"type": TransportFrame.DELIVER, "agent_name": message.send_to, "message": message}
+        return self.send_frame(node_id, agent_frame)
+
+    def _handle_sync(self, node_id: str, agent_list: List[str]):
+        receiver = self._get_receiver()
+        for name in self.registry.get_node_agent_list(node_id):
+            if name not in agent_list:
+                self.registry.unregister_agent(name)
+                if isinstance(receiver.get_route(name), RemoteAgentProxy):
+                    receiver.remove_route(name)
+        for name in agent_list:
+            local_agent = receiver.get_route(name)
+            if local_agent is not None and not isinstance(local_agent, RemoteAgentProxy):
+                logger.warning(f"Agent {name} of node {node_id} has the same name as a local agent, ignore it")
+                continue
+            self.registry.register_agent(name, node_id)
+            if local_agent is None or local_agent.node_id != node_id:
+                receiver.add_route(RemoteAgentProxy(name=name, node_id=node_id, node=self))
+
+    def handle_frame(self, frame: dict):
+        """Handle the frame received from the peer."""
+        frame_type, node_id = frame["type"], frame["node_id"]
+        if frame_type == TransportFrame.SYNC:
+            self._handle_sync(node_id, frame["agent_list"])
+            if frame.get("reply", False):
+                self.sync(node_id)
+        elif frame_type == TransportFrame.DELIVER:
+            agent_data = self._get_receiver().get_route(frame["agent_name"])
+            if agent_data is None or isinstance(agent_data, RemoteAgentProxy):
+                # The agent has moved or not started yet, let the receiver route it (or keep it as dead letter).
+                self._get_receiver().message_queue.put(frame["message"])
+            else:
+                agent_data.add_memory(frame["message"], from_env=True)
+        elif frame_type == TransportFrame.REPORT:
+            self._get_monitor().add_message(frame["message"])
+        elif frame_type == TransportFrame.STREAM_START:
+            message = frame["message"]
+            message.stream_queue = StreamBuffer()
+            self.stream_queue_map[message.message_id] = message.stream_queue
+            self._get_monitor().add_message(message)
+        elif frame_type == TransportFrame.STREAM_CHUNK:
+            if frame["message_id"] in self.stream_queue_map:
+                self.stream_queue_map[frame["message_id"]].write(frame["message_block"])
+        elif frame_type == TransportFrame.STREAM_END:
+            stream_queue = self.stream_queue_map.pop(frame["message_id"], None)
+            if stream_queue is not None:
+                stream_queue.close()
+        else:
+            logger.warning(f"Unknown frame type {frame_type} from node {node_id}")
@@ -9,7 +9,7 @@ The environment repoter is the agent system receiver.
 """
 
 from abc import ABC
-from typing import Any
+from typing import Any, List
 
 from pydantic import BaseModel
 
@@ -28,8 +28,8 @@ class EnvBaseReceiver(BaseReporter, ABC):
     _handle_message: Any = None
     _handle_stream_message: Any = None
 
-    def __init__(self, handle_message, handle_stream_message):
-        super().__init__()
+    def __init__(self, handle_message, handle_stream_message, subscribe_handle_types: List[str] = None):
+        super().__init__(subscribe_handle_types=subscribe_handle_types)
         if not handle_message:
             raise ValueError("handle_message is required")
         if not handle_stream_message:
@@ -62,13 +62,18 @@ class EnvBaseReporter(BaseModel):
     """
 
     repoter: Any = None
+    # The AgentNode used to send the message to the agent on another node. The node of the agent core by default.
+    node: Any = None
 
-    def __init__(self):
+    def __init__(self, node=None):
         super().__init__()
         agent_core = get_agent_core()
         self.repoter = agent_core.get_receiver()
+        self.node = node or agent_core.node
 
     def add_message(self, message: Message):
+        if self.node is not None and self.node.route(message):
+            return
         if self.repoter:
             self.repoter.add_message(message)
 
@@ -76,10 +81,14 @@ class EnvBaseReporter(BaseModel):
 class BaseEnvironment(BaseModel):
     env_receiver: Any = None
     env_reporter: Any = None
+    # The env_handle_type the environment care about. None means all.
+    subscribe_handle_types: List[str] = None
 
     def __init__(self):
         super().__init__()
-        self.env_receiver = EnvBaseReceiver(self.handle_message, self.handle_stream_message)
+        self.env_receiver = EnvBaseReceiver(
+            self.handle_message, self.handle_stream_message, subscribe_handle_types=self.subscribe_handle_types
+        )
         self.env_reporter = EnvBaseReporter()
         pass
 
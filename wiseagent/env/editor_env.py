@@ -7,7 +7,6 @@ Description: This is a environment class that can change every editor into a cha
 """
 
 
-import queue
 import re
 import threading
 import time
@@ -20,13 +19,13 @@ from pynput.keyboard import Controller, Key, KeyCode, Listener
 
 from wiseagent.common.logs import logger
 from wiseagent.common.protocol_message import (
-    STREAM_END_FLAG,
     EnvironmentHandleType,
     FileUploadMessage,
     Message,
     UserMessage,
 )
 from wiseagent.common.singleton import singleton
+from wiseagent.common.stream_buffer import iter_stream
 from wiseagent.core.agent_core import get_agent_core
 from wiseagent.env.base import BaseEnvironment
 
@@ -172,14 +171,7 @@ class EditorEnv(BaseEnvironment):
 
     def handle_stream_message(self, message: Message) -> bool:
         """the single agent report will report the message to the website."""
-        stream_queue = message.stream_queue
-        while True:
-            try:
-                message_block = stream_queue.get(timeout=1)
-            except queue.Empty:
-                continue
-            if message_block == None or message_block == STREAM_END_FLAG:
-                break
+        for message_block in iter_stream(message.stream_queue):
             logger.info(message_block)
         return True
 
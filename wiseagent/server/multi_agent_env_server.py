@@ -6,11 +6,13 @@ LastEditTime: 2024-11-06 19:45:25
 Description: 
 """
 import asyncio
+import threading
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from wiseagent.common.protocol_message import STREAM_END_FLAG
+from wiseagent.common.stream_buffer import StreamBuffer
 from wiseagent.core.agent import Agent
 from wiseagent.core.agent_core import get_agent_core
 from wiseagent.env.multi_agent_env import MultiAgentEnv
@@ -29,6 +31,7 @@ class MultiAgentEnvServer:
         # run env
         self.env = MultiAgentEnv()
         self.message_cache = self.env.message_cache
+        self.stream_lock = threading.Lock()
 
     def add_agent(self, yaml_string):
         if yaml_string in self.agent_yaml_string:
@@ -59,7 +62,10 @@ class MultiAgentEnvServer:
         if position_tag >= len(self.message_cache):
             return None, position_tag
         next_position_tag = len(self.message_cache)
-        return self.message_cache[position_tag:], next_position_tag
+        message_list = self.message_cache[position_tag:next_position_tag]
+        for message in message_list:
+            self.finish_stream(message)
+        return message_list, next_position_tag
         #  this will be loop for frontend to get the newest message
 
     def get_agent_list(self):
@@ -70,10 +76,29 @@ class MultiAgentEnvServer:
                 rsp.append({"name": agent.name.lower(), "active": 1 if agent.is_activate else 0})
         return rsp
 
+    def finish_stream(self, message):
+        """Write the streamed text to the content of the message once the stream buffer is closed, so the message is
+        returned with its content and is_stream=False like a normal message."""
+        if not message.is_stream or not isinstance(message.stream_queue, StreamBuffer):
+            return
+        if not message.stream_queue.is_closed:
+            return
+        with self.stream_lock:
+            if message.is_stream:
+                message.content = message.stream_queue.get_value()
+                message.is_stream = False
+
     async def get_stream_message(self, message_id):
         # Get the message from the message_cache
         message = next(filter(lambda x: x.message_id == message_id, self.message_cache), None)
-        if message:
+        if message and isinstance(message.stream_queue, StreamBuffer):
+            # Every client reads the stream with its own reader from the beginning, so the clients do not take the
+            # blocks from each other. The content of the message is set once the stream is finished.
+            async for message_block in message.stream_queue.reader():
+                if message_block:
+                    yield "data: " + "<" + message_block.replace("\n", "<new_line>") + ">" + "\n\n"
+            self.finish_stream(message)
+        elif message:
             if message.content:
                 print(f"message.content:", message.content)
                 cur_message_block = message.content.replace("\n", "<new_line>")
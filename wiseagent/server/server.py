@@ -8,12 +8,14 @@ Description:
 
 import json
 import queue
+import struct
 import threading
 import time
 
 import uvicorn
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 
+from wiseagent.common.message_codec import encode_message
 from wiseagent.common.protocol_message import STREAM_END_FLAG, Message
 from wiseagent.server.multi_agent_env_server import MultiAgentEnvServer, create_app
 
@@ -60,6 +62,19 @@ async def get_message(position: int):
     }
 
 
+@app.get("/get_message_binary")
+async def get_message_binary(position: int):
+    """The same as /get_message, but the messages are encoded by the binary message codec, each frame is prefixed by
+    its size (uint32, big endian). The file content is not base64 encoded. The next position tag is in the header."""
+    message_list, next_position_tag = multi_agent_env_server.get_message(position)
+    frame_list = [encode_message(m) for m in message_list or []]
+    return Response(
+        content=b"".join(struct.pack(">I", len(frame)) + frame for frame in frame_list),
+        media_type="application/octet-stream",
+        headers={"next-position-tag": str(next_position_tag)},
+    )
+
+
 @app.get("/get_stream_message")
 async def get_stream_message(message_id: str):
     return StreamingResponse(multi_agent_env_server.get_stream_message(message_id), media_type="text/event-stream")